@@ -52,6 +52,21 @@ def create_app(config_class=Config):
             'message': 'Missing authorization token'
         }), 401
         
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return jsonify({
+            'error': 'Unauthorized',
+            'message': 'Token has been revoked'
+        }), 401
+
+    # 已注销令牌检查（内存中完成，不查数据库）
+    from app.services.blocklist import blocklist
+    blocklist.init_app(app)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return blocklist.is_revoked(jwt_payload['jti'])
+        
     @jwt.user_lookup_error_loader
     def user_lookup_error_callback(jwt_header, jwt_payload):
         return jsonify({
@@ -65,6 +80,25 @@ def create_app(config_class=Config):
     app.register_blueprint(dashboard.bp, url_prefix='/api/dashboard')
     app.register_blueprint(transactions.bp, url_prefix='/api/transactions')
 
+    # 初始化服务
+    from app.services import identity, change_seq, ledger, recipients, tokens
+    from app.services.hashing import hasher
+    from app.services.ratelimit import limiter
+    from app.services.notifications import notifier
+    from app.services.idempotency import idempotency
+    from app.services.transfer_queue import transfer_queue
+    from app.services.group_commit import group_commit
+    identity.init_app(app)
+    tokens.init_app(app)
+    ledger.init_app(app)
+    recipients.init_app(app)
+    hasher.init_app(app)
+    limiter.init_app(app)
+    notifier.init_app(app)
+    idempotency.init_app(app)
+    transfer_queue.init_app(app)
+    group_commit.init_app(app)
+
 
     @app.route('/')
     def index():
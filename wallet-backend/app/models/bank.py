@@ -11,10 +11,22 @@ class BankAccount(db.Model):
     is_primary = db.Column(db.Boolean, default=False)
     is_verified = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    balance_shards = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # >0 时入账分散到子余额行
     
     # 通过关联表与用户建立多对多关系
     users = db.relationship('User', secondary='user_bank_accounts', back_populates='bank_accounts')
 
+class BankAccountShard(db.Model):
+    # 热点账户的子余额：账户余额 = bank_accounts.balance + 所有子余额之和
+    __tablename__ = 'bank_account_shards'
+
+    id = db.Column(db.Integer, primary_key=True)
+    bank_account_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'), nullable=False)
+    shard_no = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('bank_account_id', 'shard_no'),)
+
 class UserBankAccount(db.Model):
     __tablename__ = 'user_bank_accounts'
     
@@ -23,4 +35,17 @@ class UserBankAccount(db.Model):
     bank_account_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'bank_account_id'),)
\ No newline at end of file
+    __table_args__ = (db.UniqueConstraint('user_id', 'bank_account_id'),)
+
+class UserBalanceSummary(db.Model):
+    # 每个用户的余额汇总，与转账在同一事务中增量维护
+    __tablename__ = 'user_balance_summaries'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_balance = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    account_count = db.Column(db.Integer, nullable=False, default=0)
+    pending_total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('balance_summary', uselist=False))
@@ -0,0 +1,26 @@
+from app import db
+from datetime import datetime
+
+class DisbursementBatch(db.Model):
+    __tablename__ = 'disbursement_batches'
+
+    id = db.Column(db.String(64), primary_key=True)  # 客户端提供的批次号，重复提交时据此续跑
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    total_items = db.Column(db.Integer, nullable=False)
+    items_hash = db.Column(db.String(64), nullable=False)  # 条目内容的sha256，重复提交时内容必须一致
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+class DisbursementItem(db.Model):
+    __tablename__ = 'disbursement_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(64), db.ForeignKey('disbursement_batches.id'), nullable=False)
+    item_index = db.Column(db.Integer, nullable=False)
+    to_user_id = db.Column(db.Integer)
+    amount = db.Column(db.Numeric(10, 2))
+    status = db.Column(db.String(20), nullable=False)  # completed / failed
+    error = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('batch_id', 'item_index'),)
@@ -0,0 +1,19 @@
+from app import db
+from datetime import datetime
+
+class IdempotencyKey(db.Model):
+    # 带 Idempotency-Key 的写请求：同一用户、同一接口、同一key只执行一次，之后重放保存的响应
+    __tablename__ = 'idempotency_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # 请求体指纹，同一key换了请求内容时拒绝
+    status = db.Column(db.String(20), nullable=False, default='processing')  # processing / completed
+    response_code = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'endpoint', 'key'),)
@@ -0,0 +1,33 @@
+from app import db
+from datetime import datetime
+import enum
+
+class DeliveryChannel(enum.Enum):
+    EMAIL = "email"
+    SMS = "sms"
+
+class DeliveryStatus(enum.Enum):
+    QUEUED = "queued"
+    SENT = "sent"
+    FAILED = "failed"
+
+class MessageDelivery(db.Model):
+    __tablename__ = 'message_deliveries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.Enum(DeliveryChannel), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    code = db.Column(db.String(6))  # 待发送的验证码，发送成功或放弃后清空
+    status = db.Column(db.Enum(DeliveryStatus), nullable=False, default=DeliveryStatus.QUEUED)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255))
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)  # 失败重试时按退避推后
+    claim_token = db.Column(db.String(32))  # 领取该记录的发送线程
+    claimed_until = db.Column(db.DateTime)  # 租约到期后（发送进程崩溃）可被其它进程重新领取
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 发送线程按 (status, next_attempt_at) 领取到期的记录
+    __table_args__ = (
+        db.Index('ix_message_deliveries_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
@@ -23,11 +23,18 @@ class Transaction(db.Model):
     type = db.Column(db.Enum(TransactionType), nullable=False)
     sender_account=db.Column(db.String(30)) #如果type是transfer 则需要填发送者的银行账户 接收方默认是primary账户
     recipient_identifier=db.Column(db.String(30))
+    recipient_account_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'))  # 实际入账的账户，撤回时从这里扣回
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关联
     user = db.relationship('User', backref=db.backref('transactions', lazy=True))
+    
+    # 过期清理按 (status, created_at) 做范围扫描；验证标识后按 (recipient_identifier, status) 查待结算转账
+    __table_args__ = (
+        db.Index('ix_transactions_status_created_at', 'status', 'created_at'),
+        db.Index('ix_transactions_recipient_status', 'recipient_identifier', 'status'),
+    )
 
 class PaymentRequest(db.Model):
     __tablename__ = 'payment_requests'
@@ -46,4 +53,10 @@ class PaymentRequest(db.Model):
     transaction = db.relationship('Transaction', backref=db.backref('payment_requests', lazy=True))
     requester = db.relationship('User', foreign_keys=[requester_id], backref=db.backref('requested_payments', lazy=True))
     payer = db.relationship('User', foreign_keys=[payer_id], backref=db.backref('pending_payments', lazy=True))
+    
+    # 付款人收件箱按 (payer_id, status, created_at) 键集分页；付款人验证标识后按标识补填 payer_id
+    __table_args__ = (
+        db.Index('ix_payment_requests_payer_status_created_at', 'payer_id', 'status', 'created_at'),
+        db.Index('ix_payment_requests_payer_identifier', 'payer_identifier', 'payer_id'),
+    )
     
\ No newline at end of file
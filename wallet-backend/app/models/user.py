@@ -1,6 +1,6 @@
 from app import db
 from datetime import datetime
-import bcrypt
+from app.services.hashing import hasher
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -10,6 +10,7 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     balance = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 变更序号，用于ETag
     
     # 关联
     emails = db.relationship('Email', backref='user', lazy=True)
@@ -17,29 +18,27 @@ class User(db.Model):
     bank_accounts = db.relationship('BankAccount', secondary='user_bank_accounts', back_populates='users')
     
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = hasher.hash_password(password)
     
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return User.verify_password(password, self.password_hash)
+
+    @staticmethod
+    def verify_password(password, password_hash):
+        """校验密码与已存储的哈希（无需加载User实例）"""
+        return hasher.check_password(password, password_hash)
         
     def to_dict(self):
         """返回用户的字典表示"""
-        primary_email = self.emails[0] if self.emails else None
-        primary_phone = self.phones[0] if self.phones else None
-        return {
-            'id': f"ACC{self.id}",
-            'name': self.name,
-            'email': primary_email.email if primary_email else None,
-            'phone': primary_phone.phone if primary_phone else None,
-            'is_admin': self.is_admin,
-            'balance': self.balance
-        }
+        from app.serializers.user import AccountSerializer
+        return AccountSerializer.dump(self)
 
 class Email(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     is_verified = db.Column(db.Boolean, default=False)
     verification_code = db.Column(db.String(6))
+    verification_failures = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 当前验证码的连续错误次数
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -48,5 +47,6 @@ class Phone(db.Model):
     phone = db.Column(db.String(20), unique=True, nullable=False)
     is_verified = db.Column(db.Boolean, default=False)
     verification_code = db.Column(db.String(6))
+    verification_failures = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 当前验证码的连续错误次数
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow) 
\ No newline at end of file
@@ -1,11 +1,32 @@
-from flask import Blueprint, request, jsonify, make_response
-from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token, verify_jwt_in_request
+from flask import Blueprint, request, jsonify, make_response, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, verify_jwt_in_request
 from app.models.user import User, Email, Phone
-from app.models.bank import BankAccount
+from app.models.bank import BankAccount, UserBankAccount, UserBalanceSummary
+from app.models.notification import DeliveryChannel
 from app.models.transaction import Transaction, PaymentRequest, TransactionStatus, TransactionType
+from app.serializers.user import ProfileSerializer
+from app.services.identity import lookup_identity
+from app.services.balance_summary import apply_delta, apply_account_delta, get_summary
+from app.services.accounts import list_accounts, export_accounts, parse_filters, InvalidQuery
+from app.services.change_seq import etag_by_change_seq, current_month
+from app.services.hashing import hasher, HashingBusy
+from app.services.tokens import create_user_token, user_is_admin, admin_claim_is_stale
+from app.services.blocklist import blocklist
+from app.services.ratelimit import limiter
+from app.services.notifications import notifier
+from app.services.disbursement import run_batch, BatchConflict
+from app.services.retry import retry_on_deadlock, retry_counters
+from app.services.idempotency import idempotent, record_response
+from app.services.group_commit import group_commit
+from app.services.settlement import settle_pending
+from app.services.payment_requests import attach_payment_requests
+from app.services.recipients import primary_account_ids
+from app.services.ledger import shard_count, fold_shards, set_shard_count, account_balance
 from app import db
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc
+from decimal import Decimal
+from sqlalchemy import func, desc, select, literal, union_all
+from sqlalchemy.exc import IntegrityError
 from functools import wraps
 import random
 import string
@@ -20,11 +41,14 @@ def admin_required(fn):
         # 先验证JWT
         verify_jwt_in_request()
         
-        # 然后获取用户身份
+        # 管理员标记直接取自令牌声明；只有权限变更之前签发的令牌才回查数据库
+        claims = get_jwt()
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        is_admin = claims.get('is_admin', False)
+        if 'is_admin' not in claims or admin_claim_is_stale(current_user_id, claims['iat']):
+            is_admin = user_is_admin(current_user_id)
         
-        if not user or not user.is_admin:
+        if not is_admin:
             return jsonify({
                 'status': 'error',
                 'message': 'Admin privileges required'
@@ -33,6 +57,64 @@ def admin_required(fn):
         return fn(*args, **kwargs)
     return wrapper
 
+def _server_busy():
+    response = jsonify({
+        'status': 'error',
+        'message': 'Server is busy, please try again later'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def _rate_limited(*rules):
+    """依次检查 (键, (次数, 窗口)) 规则，超限时返回429响应"""
+    for key, (limit, window) in rules:
+        allowed, _, retry_after = limiter.hit(key, limit, window)
+        if not allowed:
+            response = jsonify({
+                'status': 'error',
+                'message': 'Too many requests, please try again later'
+            })
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+    return None
+
+# 注册时需要唯一的字段及其错误信息（按检查顺序）
+_UNIQUE_FIELDS = {
+    'ssn': 'SSN already registered',
+    'email': 'Email already registered',
+    'phone': 'Phone already registered'
+}
+
+def _registered_fields(ssn, email, phone):
+    """返回已被占用的字段集合（UNION ALL 一次往返）"""
+    probe = union_all(
+        select(literal('ssn').label('field')).where(User.ssn == ssn),
+        select(literal('email').label('field')).where(Email.email == email),
+        select(literal('phone').label('field')).where(Phone.phone == phone)
+    )
+    return {row.field for row in db.session.execute(probe)}
+
+def _duplicate_field(error):
+    """从唯一约束冲突中解析出冲突的字段"""
+    message = str(error.orig).lower()
+    # 只看约束名部分，避免冲突值本身包含字段名造成误判
+    # MySQL: Duplicate entry 'x' for key 'email.email'  SQLite: UNIQUE constraint failed: email.email
+    for marker in ('for key', 'constraint failed:'):
+        if marker in message:
+            message = message.rsplit(marker, 1)[1]
+            break
+    for field in _UNIQUE_FIELDS:
+        if field in message:
+            return field
+    return None
+
+def _duplicate_response(field):
+    return jsonify({
+        'status': 'error',
+        'message': 'Registration failed',
+        'error': _UNIQUE_FIELDS[field]
+    }), 400
+
 # 用户认证相关路由
 @bp.route('/auth/register', methods=['POST', 'OPTIONS'])
 def register():
@@ -43,6 +125,13 @@ def register():
         response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
         return response
 
+    # 在任何数据库查询和密码哈希之前限流
+    limited = _rate_limited(
+        (f"register:ip:{request.remote_addr}", current_app.config['REGISTER_LIMIT_PER_IP'])
+    )
+    if limited:
+        return limited
+
     try:
         data = request.get_json()
         print("Register request data:", data)
@@ -57,29 +146,11 @@ def register():
                 'error': f'Missing required fields: {", ".join(missing_fields)}'
             }), 400
         
-        # 检查SSN是否已存在
-        if User.query.filter_by(ssn=data['ssn']).first():
-            return jsonify({
-                'status': 'error',
-                'message': 'Registration failed',
-                'error': 'SSN already registered'
-            }), 400
-            
-        # 检查邮箱是否已存在
-        if Email.query.filter_by(email=data['email']).first():
-            return jsonify({
-                'status': 'error',
-                'message': 'Registration failed',
-                'error': 'Email already registered'
-            }), 400
-            
-        # 检查电话是否已存在
-        if Phone.query.filter_by(phone=data['phone']).first():
-            return jsonify({
-                'status': 'error',
-                'message': 'Registration failed',
-                'error': 'Phone already registered'
-            }), 400
+        # 一次查询同时检查SSN、邮箱、电话是否已被注册
+        taken = _registered_fields(data['ssn'], data['email'], data['phone'])
+        for field in _UNIQUE_FIELDS:
+            if field in taken:
+                return _duplicate_response(field)
         
         # 创建用户
         user = User(
@@ -87,6 +158,7 @@ def register():
             ssn=data['ssn'],
             balance=round(random.uniform(800, 1200), 2)
         )
+        user.balance_summary = UserBalanceSummary()
         user.set_password(data['password'])
         db.session.add(user)
         print("User created:", user.id)
@@ -101,10 +173,26 @@ def register():
         user.phones.append(phone)
         print("Phone added:", phone.phone)
         
+        # 投递记录与用户在同一事务中创建，提交后交给后台发送
+        email_delivery = notifier.create_delivery(DeliveryChannel.EMAIL, email.email, email.verification_code)
+        phone_delivery = notifier.create_delivery(DeliveryChannel.SMS, phone.phone, phone.verification_code)
+        
         # 提交事务
+        # 并发注册时由唯一约束兜底，映射回相同的字段错误信息
         try:
             db.session.commit()
             print("Database commit successful")
+        except IntegrityError as e:
+            db.session.rollback()
+            field = _duplicate_field(e)
+            if field:
+                return _duplicate_response(field)
+            print("Database error during registration:", str(e))
+            return jsonify({
+                'status': 'error',
+                'message': 'Registration failed',
+                'error': 'Database error during registration'
+            }), 400
         except Exception as e:
             db.session.rollback()
             print("Database error during registration:", str(e))
@@ -115,8 +203,12 @@ def register():
                 'error': 'Database error during registration'
             }), 400
         
+        # 只唤醒发送线程，不在请求中等待服务商响应
+        notifier.enqueue(email_delivery)
+        notifier.enqueue(phone_delivery)
+        
         # 生成访问令牌
-        access_token = create_access_token(identity=user.id)
+        access_token = create_user_token(user.id, user.is_admin)
         print("Access token generated")
         
         return jsonify({
@@ -131,6 +223,9 @@ def register():
                 'balance': user.balance
             }
         }), 201
+    except HashingBusy:
+        db.session.rollback()
+        return _server_busy()
     except Exception as e:
         print("Register error:", str(e))
         print("Traceback:", traceback.format_exc())
@@ -161,34 +256,45 @@ def login():
                 'message': 'Both identifier and password are required'
             }), 400
             
-        # 通过邮箱或电话查找用户
-        user = None
-        if '@' in data['identifier']:
-            email = Email.query.filter_by(email=data['identifier']).first()
-            if email:
-                user = email.user
-        else:
-            phone = Phone.query.filter_by(phone=data['identifier']).first()
-            if phone:
-                user = phone.user
+        # 在任何数据库查询和bcrypt校验之前限流
+        limited = _rate_limited(
+            (f"login:ip:{request.remote_addr}", current_app.config['LOGIN_LIMIT_PER_IP']),
+            # 邮箱按不区分大小写比较，限流键也要规范化，否则换个大小写/加空格就是新的额度
+            (f"login:id:{str(data['identifier']).strip().lower()}", current_app.config['LOGIN_LIMIT_PER_IDENTIFIER'])
+        )
+        if limited:
+            return limited
+            
+        # 通过邮箱或电话查找用户（一次联表查询，命中缓存时不访问数据库）
+        identity = lookup_identity(data['identifier'])
                 
-        if not user:
+        if not identity:
             return jsonify({
                 'status': 'error',
                 'message': 'User not found'
             }), 401
             
-        if not user.check_password(data['password']):
+        if not User.verify_password(data['password'], identity['password_hash']):
             return jsonify({
                 'status': 'error',
                 'message': 'Invalid password'
             }), 401
             
+        # 存储的哈希cost与当前配置不同时，借本次登录透明地重新哈希
+        # 哈希队列繁忙时跳过，留到下次登录
+        if hasher.needs_rehash(identity['password_hash']):
+            try:
+                user = User.query.get(identity['user_id'])
+                user.set_password(data['password'])
+                db.session.commit()
+            except HashingBusy:
+                db.session.rollback()
+            
         # 生成访问令牌
-        access_token = create_access_token(identity=str(user.id))
+        access_token = create_user_token(identity['user_id'], identity['user']['is_admin'])
         
         # 准备用户信息
-        user_info = user.to_dict()
+        user_info = dict(identity['user'])
         
         # 准备响应数据
         response_data = {
@@ -202,6 +308,9 @@ def login():
         response = jsonify(response_data)
         return response, 200
         
+    except HashingBusy:
+        db.session.rollback()
+        return _server_busy()
     except Exception as e:
         print("Login error:", str(e))
         print("Traceback:", traceback.format_exc())
@@ -210,6 +319,51 @@ def login():
             'message': str(e)
         }), 400
 
+# 注销登录：令牌加入黑名单直到其过期
+@bp.route('/auth/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    claims = get_jwt()
+    blocklist.revoke(claims['jti'], claims['exp'])
+    return jsonify({
+        'status': 'success',
+        'message': 'Logout successful'
+    })
+
+# 验证标识后结算待处理转账，单独一个事务
+def _settle_pending_transfers(identifier):
+    try:
+        return settle_pending(identifier)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Settle pending transfers error: %s", e)
+        return 0
+
+def _verify_rate_limited(user_id, identifier):
+    """按 用户+邮箱/电话 限制验证码提交次数，防止暴力枚举6位验证码"""
+    return _rate_limited(
+        (f"verify:{user_id}:{str(identifier).strip().lower()}", current_app.config['VERIFY_LIMIT_PER_IDENTIFIER'])
+    )
+
+def _check_verification_code(record, channel, recipient, code):
+    """校验验证码；错误次数达到上限后作废旧码并重新发送，返回错误响应或None"""
+    if record.verification_code and record.verification_code == code:
+        return None
+    
+    record.verification_failures = (record.verification_failures or 0) + 1
+    delivery = None
+    if record.verification_failures >= current_app.config['VERIFY_MAX_FAILURES']:
+        # 旧码作废，之后再猜中也无效
+        record.verification_code = ''.join(random.choices(string.digits, k=6))
+        record.verification_failures = 0
+        delivery = notifier.create_delivery(channel, recipient, record.verification_code)
+    db.session.commit()
+    
+    if delivery is None:
+        return jsonify({'error': 'Invalid verification code'}), 400
+    notifier.enqueue(delivery)
+    return jsonify({'error': 'Verification code locked, a new code has been sent'}), 400
+
 # 验证邮箱
 @bp.route('/verify/email', methods=['POST'])
 @jwt_required()
@@ -217,17 +371,27 @@ def verify_email():
     data = request.get_json()
     user_id = get_jwt_identity()
     
+    limited = _verify_rate_limited(user_id, data['email'])
+    if limited:
+        return limited
+    
     email = Email.query.filter_by(user_id=user_id, email=data['email']).first()
     if not email:
         return jsonify({'error': 'Email not found'}), 404
     
-    if email.verification_code != data['code']:
-        return jsonify({'error': 'Invalid verification code'}), 400
+    rejected = _check_verification_code(email, DeliveryChannel.EMAIL, email.email, data['code'])
+    if rejected:
+        return rejected
     
     email.is_verified = True
+    # 之前只按邮箱记录的付款请求挂到该用户名下，进入收件箱
+    attach_payment_requests(email.user_id, email.email)
     db.session.commit()
     
-    return jsonify({'message': 'Email verified successfully'})
+    # 结算之前转给这个邮箱的待处理转账（失败不影响验证结果，之后仍可取消或过期）
+    settled = _settle_pending_transfers(email.email)
+    
+    return jsonify({'message': 'Email verified successfully', 'settled_transfers': settled})
 
 # 验证电话
 @bp.route('/verify/phone', methods=['POST'])
@@ -236,17 +400,27 @@ def verify_phone():
     data = request.get_json()
     user_id = get_jwt_identity()
     
+    limited = _verify_rate_limited(user_id, data['phone'])
+    if limited:
+        return limited
+    
     phone = Phone.query.filter_by(user_id=user_id, phone=data['phone']).first()
     if not phone:
         return jsonify({'error': 'Phone not found'}), 404
     
-    if phone.verification_code != data['code']:
-        return jsonify({'error': 'Invalid verification code'}), 400
+    rejected = _check_verification_code(phone, DeliveryChannel.SMS, phone.phone, data['code'])
+    if rejected:
+        return rejected
     
     phone.is_verified = True
+    # 之前只按电话记录的付款请求挂到该用户名下，进入收件箱
+    attach_payment_requests(phone.user_id, phone.phone)
     db.session.commit()
     
-    return jsonify({'message': 'Phone verified successfully'})
+    # 结算之前转给这个电话的待处理转账（失败不影响验证结果，之后仍可取消或过期）
+    settled = _settle_pending_transfers(phone.phone)
+    
+    return jsonify({'message': 'Phone verified successfully', 'settled_transfers': settled})
 
 # 添加银行账户
 @bp.route('/bank-accounts', methods=['POST'])
@@ -364,6 +538,7 @@ def request_payment():
 # 获取交易历史
 @bp.route('/transactions', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq()
 def get_transactions():
     user_id = get_jwt_identity()
     
@@ -404,6 +579,7 @@ def get_transactions():
 # Dashboard相关路由
 @bp.route('/dashboard/overview', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq(salt=current_month)
 def get_dashboard_overview():
     try:
         # 获取用户ID并打印日志
@@ -421,12 +597,10 @@ def get_dashboard_overview():
             
         print(f"Found user: {user.name} (ID: {user.id})")
             
-        # 获取待处理交易的总额
-        pending_balance = db.session.query(func.sum(Transaction.amount)).\
-            filter(
-                Transaction.user_id == current_user_id,
-                Transaction.status == TransactionStatus.PENDING
-            ).scalar() or 0.0
+        # 获取总余额和待处理交易的总额（读取余额汇总表）
+        summary = get_summary(user.id)
+        total_balance = summary.total_balance if summary else 0.0
+        pending_balance = summary.pending_total if summary else 0.0
             
         # 获取本月交易总额
         month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0)
@@ -441,7 +615,7 @@ def get_dashboard_overview():
         response_data = {
             'status': 'success',
             'data': {
-                'total_balance': float(user.balance),
+                'total_balance': float(total_balance),
                 'pending_balance': float(pending_balance),
                 'monthly_activity': float(monthly_activity)
             }
@@ -460,6 +634,7 @@ def get_dashboard_overview():
 
 @bp.route('/dashboard/recent-transactions', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq()
 def get_recent_transactions():
     current_user_id = get_jwt_identity()
     
@@ -516,32 +691,21 @@ def get_recent_transactions():
 
 @bp.route('/user/profile', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq()
 def get_user_profile():
     current_user_id = get_jwt_identity()
     
     try:
-        user = User.query.get(current_user_id)
-        if not user:
+        profile = ProfileSerializer.get(current_user_id)
+        if not profile:
             return jsonify({
                 'error': 'User not found',
                 'message': 'The requested user does not exist'
             }), 404
             
-        # 获取主要邮箱和电话
-        primary_email = user.emails[0] if user.emails else None
-        primary_phone = user.phones[0] if user.phones else None
-            
         response = make_response(jsonify({
             'status': 'success',
-            'data': {
-                'id': user.id,
-                'name': user.name,
-                'email': primary_email.email if primary_email else None,
-                'phone': primary_phone.phone if primary_phone else None,
-                'email_verified': primary_email.is_verified if primary_email else False,
-                'phone_verified': primary_phone.is_verified if primary_phone else False,
-                'avatar': None  # 暂时不支持头像
-            }
+            'data': profile
         }))
         
         # 添加缓存控制
@@ -592,30 +756,34 @@ def get_all_accounts():
     @admin_required
     def handle_request():
         try:
-            # 打印请求信息
-            print("Request headers:", dict(request.headers))
-            print("Authorization:", request.headers.get('Authorization'))
-            
             current_user_id = get_jwt_identity()
             print("Current user ID:", current_user_id)
             
-            # 获取所有用户
-            users = User.query.all()
-            accounts = []
-            
-            for user in users:
-                account_info = user.to_dict()
-                # 计算用户的总余额
-                total_balance = db.session.query(func.sum(BankAccount.balance))\
-                    .filter(BankAccount.users.any(id=user.id))\
-                    .scalar() or 0.0
-                account_info['balance'] = round(float(total_balance), 2)
-                accounts.append(account_info)
+            # 一次聚合查询获取余额合计和主邮箱/电话，键集分页
+            per_page = min(request.args.get('per_page', 50, type=int), current_app.config['ADMIN_PAGE_SIZE_MAX'])
+            try:
+                accounts, next_cursor = list_accounts(
+                    filters=parse_filters(request.args),
+                    sort=request.args.get('sort', 'id'),
+                    order=request.args.get('order', 'asc'),
+                    cursor=request.args.get('cursor'),
+                    limit=max(per_page, 1)
+                )
+            except InvalidQuery as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                }), 400
                 
             response = jsonify({
                 'status': 'success',
                 'data': {
-                    'accounts': accounts
+                    'accounts': accounts,
+                    'pagination': {
+                        'next_cursor': next_cursor,
+                        'has_next': next_cursor is not None,
+                        'per_page': max(per_page, 1)
+                    }
                 }
             })
             
@@ -634,10 +802,39 @@ def get_all_accounts():
     
     return handle_request()
 
+# 管理员API - 流式导出所有账户（内存占用与用户数无关）
+@bp.route('/admin/accounts/export', methods=['GET'])
+@admin_required
+def export_all_accounts():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({
+            'status': 'error',
+            'message': 'format must be ndjson or csv'
+        }), 400
+    try:
+        filters = parse_filters(request.args)
+    except InvalidQuery as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+        
+    compress = request.args.get('gzip', '').lower() in ('1', 'true')
+    body = export_accounts(filters, fmt=fmt, compress=compress)
+    response = Response(
+        stream_with_context(body),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=accounts.{fmt}'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 # 管理员API - 转账
 @bp.route('/admin/transfer', methods=['POST'])
-@jwt_required()
 @admin_required
+@idempotent
 def admin_transfer():
     try:
         data = request.get_json()
@@ -653,71 +850,14 @@ def admin_transfer():
         to_account_id = int(data['to_account'].replace('ACC', ''))
         from_account_id = int(data['from_account'].replace('ACC', '')) if 'from_account' in data else None
         
-        # 验证目标账户
-        to_user = User.query.get(to_account_id)
-        if not to_user:
-            return jsonify({
-                'error': 'Invalid account',
-                'message': 'Target account not found'
-            }), 404
-            
-        # 如果指定了源账户，验证源账户
-        from_user = None
-        if from_account_id:
-            from_user = User.query.get(from_account_id)
-            if not from_user:
-                return jsonify({
-                    'error': 'Invalid account',
-                    'message': 'Source account not found'
-                }), 404
-        
-        amount = float(data['amount'])
+        amount = Decimal(str(data['amount']))
         if amount <= 0:
             return jsonify({
                 'error': 'Invalid amount',
                 'message': 'Amount must be positive'
             }), 400
             
-        # 创建交易记录
-        transaction = Transaction(
-            user_id=to_user.id,
-            amount=amount,
-            description=data.get('note', 'Admin transfer'),
-            type=TransactionType.TRANSFER,
-            status=TransactionStatus.COMPLETED
-        )
-        
-        # 更新账户余额
-        if from_user:
-            # 用户间转账
-            from_account = from_user.bank_accounts[0] if from_user.bank_accounts else None
-            if not from_account or from_account.balance < amount:
-                return jsonify({
-                    'error': 'Insufficient funds',
-                    'message': 'Source account has insufficient funds'
-                }), 400
-            from_account.balance -= amount
-            
-        to_account = to_user.bank_accounts[0] if to_user.bank_accounts else None
-        if not to_account:
-            # 如果用户没有银行账户，创建一个
-            to_account = BankAccount(
-                bank_name='Default Bank',
-                account_number=''.join(random.choices(string.digits, k=10)),
-                balance=0
-            )
-            to_user.bank_accounts.append(to_account)
-            
-        to_account.balance += amount
-        
-        db.session.add(transaction)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Transfer completed successfully',
-            'transaction_id': f"TX{transaction.id}"
-        })
+        return _apply_admin_transfer(to_account_id, from_account_id, amount, data.get('note', 'Admin transfer'))
         
     except Exception as e:
         print("Transfer error:", str(e))
@@ -726,4 +866,207 @@ def admin_transfer():
         return jsonify({
             'error': 'Transfer failed',
             'message': str(e)
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@retry_on_deadlock
+def _apply_admin_transfer(to_account_id, from_account_id, amount, note):
+    """管理员转账的完整事务；死锁时由装饰器整体重跑"""
+    # 验证目标账户
+    to_user = User.query.get(to_account_id)
+    if not to_user:
+        return jsonify({
+            'error': 'Invalid account',
+            'message': 'Target account not found'
+        }), 404
+        
+    # 如果指定了源账户，验证源账户
+    from_user = None
+    if from_account_id:
+        from_user = User.query.get(from_account_id)
+        if not from_user:
+            return jsonify({
+                'error': 'Invalid account',
+                'message': 'Source account not found'
+            }), 404
+    
+    # 按账户id升序统一加行锁，相向的两笔转账不会互相等待形成死锁
+    # 主账户与转账、批量打款使用同一个选取规则
+    primary = primary_account_ids({to_user.id} | ({from_user.id} if from_user else set()))
+    source_id = primary.get(from_user.id) if from_user else None
+    target_id = primary.get(to_user.id)
+    lock_ids = sorted({i for i in (source_id, target_id) if i is not None})
+    locked = {
+        account.id: account
+        for account in BankAccount.query
+            .filter(BankAccount.id.in_(lock_ids))
+            .order_by(BankAccount.id)
+            .with_for_update()
+            .populate_existing()
+    } if lock_ids else {}
+    if source_id in locked and shard_count(source_id):
+        # 分片账户的入账停留在子余额上，扣款前先归并到主余额
+        # 在主账户行锁之后再锁子余额行，与 ledger 中 主余额→子余额 的加锁顺序一致
+        if fold_shards(source_id):
+            db.session.refresh(locked[source_id])
+    
+    # 创建交易记录
+    transaction = Transaction(
+        user_id=to_user.id,
+        amount=amount,
+        description=note,
+        type=TransactionType.TRANSFER,
+        status=TransactionStatus.COMPLETED
+    )
+    
+    db.session.add(transaction)
+    
+    # 更新账户余额，并在同一事务中更新余额汇总
+    if from_user:
+        # 用户间转账：余额检查基于已加锁的行，不会丢失并发更新
+        from_account = locked.get(source_id)
+        if not from_account or from_account.balance < amount:
+            db.session.rollback()
+            return jsonify({
+                'error': 'Insufficient funds',
+                'message': 'Source account has insufficient funds'
+            }), 400
+        from_account.balance -= amount
+        apply_account_delta(from_account.id, -amount)
+        
+    to_account = locked.get(target_id)
+    if not to_account:
+        # 如果用户没有银行账户，创建一个
+        to_account = BankAccount(
+            bank_name='Default Bank',
+            account_number=''.join(random.choices(string.digits, k=10)),
+            balance=amount
+        )
+        to_user.bank_accounts.append(to_account)
+        db.session.flush()
+        apply_delta(to_user.id, balance=amount, accounts=1)
+    else:
+        to_account.balance += amount
+        apply_account_delta(to_account.id, amount)
+    
+    db.session.flush()
+    body = {
+        'success': True,
+        'message': 'Transfer completed successfully',
+        'transaction_id': f"TX{transaction.id}"
+    }
+    record_response(body)
+    db.session.commit()
+    
+    return jsonify(body)
+
+# 管理员API - 批量打款（按批次号可重复提交，已处理的条目不会重复入账）
+@bp.route('/admin/transfer/batch', methods=['POST'])
+@admin_required
+def admin_transfer_batch():
+    data = request.get_json(silent=True) or {}
+    batch_id = str(data.get('batch_id') or '').strip()
+    items = data.get('items')
+    if not batch_id or len(batch_id) > 64 or not isinstance(items, list) or not items:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'batch_id and a non-empty items list are required'
+        }), 400
+    if len(items) > current_app.config['DISBURSEMENT_MAX_ITEMS']:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': f"At most {current_app.config['DISBURSEMENT_MAX_ITEMS']} items per batch"
+        }), 400
+    if not all(isinstance(item, dict) for item in items):
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'Each item must be an object'
+        }), 400
+
+    try:
+        results = run_batch(
+            batch_id, items, int(get_jwt_identity()),
+            chunk_size=current_app.config['DISBURSEMENT_CHUNK_SIZE']
+        )
+    except BatchConflict as e:
+        return jsonify({
+            'error': 'Batch conflict',
+            'message': str(e)
+        }), 409
+    except Exception as e:
+        print("Batch transfer error:", str(e))
+        print("Traceback:", traceback.format_exc())
+        db.session.rollback()
+        return jsonify({
+            'error': 'Batch transfer failed',
+            'message': str(e),
+            'batch_id': batch_id
+        }), 500
+
+    completed = sum(1 for r in results if r['status'] == 'completed')
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'completed': completed,
+        'failed': len(results) - completed,
+        'results': results
+    })
+
+# 管理员API - 热点账户子余额分片（shards=0 关闭并归并）
+@bp.route('/admin/bank-accounts/<int:account_id>/shards', methods=['PUT'])
+@admin_required
+def set_bank_account_shards(account_id):
+    data = request.get_json(silent=True) or {}
+    shards = data.get('shards')
+    max_shards = current_app.config['BALANCE_SHARDS_MAX']
+    if not isinstance(shards, int) or isinstance(shards, bool) or not 0 <= shards <= max_shards:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': f'shards must be an integer between 0 and {max_shards}'
+        }), 400
+    if BankAccount.query.get(account_id) is None:
+        return jsonify({
+            'error': 'Invalid account',
+            'message': 'Bank account not found'
+        }), 404
+
+    set_shard_count(account_id, shards)
+    db.session.commit()
+    return jsonify({
+        'success': True,
+        'account_id': account_id,
+        'shards': shards,
+        'balance': float(account_balance(account_id))
+    })
+
+# 管理员API - 限流计数监控
+@bp.route('/admin/rate-limits', methods=['GET'])
+@admin_required
+def get_rate_limits():
+    prefix = request.args.get('prefix')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'counters': limiter.snapshot(prefix=prefix, limit=limit)
+        }
+    })
+
+# 管理员API - 死锁重试计数监控
+@bp.route('/admin/db-retries', methods=['GET'])
+@admin_required
+def get_db_retries():
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'counters': retry_counters()
+        }
+    })
+
+# 管理员API - 转账组提交统计（批大小直方图、提交耗时）
+@bp.route('/admin/group-commit', methods=['GET'])
+@admin_required
+def get_group_commit_stats():
+    return jsonify({
+        'status': 'success',
+        'data': group_commit.stats()
+    })
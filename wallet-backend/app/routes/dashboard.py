@@ -2,6 +2,9 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.user import User
 from app.models.transaction import Transaction, TransactionType, TransactionStatus
+from app.serializers.user import DashboardProfileSerializer
+from app.services.balance_summary import get_summary
+from app.services.change_seq import etag_by_change_seq, current_month
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc
 from app import db
@@ -10,6 +13,7 @@ bp = Blueprint('dashboard', __name__)
 
 @bp.route('/overview', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq(salt=current_month)
 def get_overview():
     try:
         current_user_id = int(get_jwt_identity())
@@ -20,14 +24,10 @@ def get_overview():
                 'message': 'User not found'
             }), 404
 
-        # 获取总余额
-        total_balance = user.balance
-
-        # 获取待处理余额（未完成的交易总额）
-        pending_balance = db.session.query(func.sum(Transaction.amount))\
-            .filter(Transaction.sender_id == current_user_id)\
-            .filter(Transaction.status == TransactionStatus.PENDING)\
-            .scalar() or 0.0
+        # 获取总余额和待处理余额（未完成的交易总额），都读取余额汇总表
+        summary = get_summary(current_user_id)
+        total_balance = summary.total_balance if summary else 0.0
+        pending_balance = summary.pending_total if summary else 0.0
 
         # 获取本月活动金额
         first_day_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -55,6 +55,7 @@ def get_overview():
 
 @bp.route('/recent-transactions', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq()
 def get_recent_transactions():
     try:
         current_user_id = get_jwt_identity()
@@ -95,28 +96,20 @@ def get_recent_transactions():
 
 @bp.route('/user/profile', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq()
 def get_user_profile():
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        profile = DashboardProfileSerializer.get(current_user_id)
         
-        if not user:
+        if not profile:
             return jsonify({
                 'error': 'Not Found',
                 'message': 'User not found'
             }), 404
 
-        # 获取用户的主要邮箱和电话
-        primary_email = user.emails[0].email if user.emails else None
-        primary_phone = user.phones[0].phone if user.phones else None
-
         return jsonify({
-            'data': {
-                'name': user.name,
-                'email': primary_email,
-                'phone': primary_phone,
-                'is_admin': user.is_admin
-            },
+            'data': profile,
             'message': 'success'
         })
 
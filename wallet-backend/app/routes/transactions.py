@@ -1,12 +1,22 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app, url_for
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from app import db
-from app.models.bank import BankAccount, UserBankAccount
 from app.models.transaction import Transaction, TransactionType, TransactionStatus, PaymentRequest
-from app.models.user import Email, Phone, User
+from app.models.user import User
+from app.services.balance_summary import apply_delta, apply_account_delta
+from app.services.change_seq import etag_by_change_seq
+from app.services.ledger import debit_account, credit_account, owned_account_ids
+from app.services.transfers import execute_transfer, invalid_transfer
+from app.services.transfer_queue import transfer_queue
+from app.services.group_commit import group_commit
+from app.services.retry import retry_on_deadlock
+from app.services.idempotency import idempotent, record_response, current_claim, claim_id
+from app.services.payment_requests import build_shares, create_payment_request, InvalidSplit, list_inbox, parse_status
+from app.services.accounts import InvalidQuery
 
 bp = Blueprint('transactions', __name__)
 
@@ -14,6 +24,7 @@ bp = Blueprint('transactions', __name__)
 # 转账
 @bp.route('/transfer', methods=['POST'])
 @jwt_required()
+@idempotent
 def transfer():
     try:
         current_user_id = int(get_jwt_identity())
@@ -26,66 +37,97 @@ def transfer():
 
 
         data = request.get_json()
-        sender_id = get_jwt_identity()
 
         # 验证必要字段
         required_fields = ['recipient_identifier', 'amount','source_account']
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Missing required fields'}), 400
 
-        # 创建交易
-        transaction = Transaction(
-            transaction_type=TransactionType.TRANSFER,
-            amount=data['amount'],
-            note=data.get('note'),
-            sender_id=sender_id,
-            recipient_identifier=data['recipient_identifier'],
-            sender_account=data['source_account'],
-            created_at = datetime.utcnow()
-        )
-
-        # 查找接收者
-        recipient_id = None
-        if '@' in data['recipient_identifier']:
-            email = Email.query.filter_by(email=data['recipient_identifier'], is_verified=True).first()
-            if email:
-                recipient_id = email.user_id
-        else:
-            phone = Phone.query.filter_by(phone=data['recipient_identifier'], is_verified=True).first()
-            if phone:
-                recipient_id = phone.user_id
-
-        if recipient_id:
-            transaction.recipient_id = recipient_id
-            # 对双方银行账户进行操作
-            account=BankAccount.query.filter_by(account_number=transaction.sender_account).first()
-            if account:
-                account.balance-=transaction.amount
-            account=BankAccount.query.filter_by(account_number=UserBankAccount.query.filter_by(user_id=recipient_id).first().bank_account_id).first()
-            if account:
-                account.balance+=transaction.amount
-
-            transaction.status = TransactionStatus.COMPLETED
-            transaction.completed_at = datetime.utcnow()
-
-        else:
-            transaction.recipient_id=None
-            transaction.status=TransactionStatus.PENDING
-            #这里应该还有超过十五分钟 交易状态为 EXPIRE 的逻辑
-
-        db.session.add(transaction)
-        db.session.commit()
-
-        return jsonify({'message': 'Transfer initiated successfully', 'transaction_id': transaction.id})
+        try:
+            amount = Decimal(str(data['amount']))
+        except InvalidOperation:
+            return jsonify({'error': 'Amount must be a number'}), 400
+        # 超出列宽的金额和标识在这里拒绝，不能进入异步队列
+        error = invalid_transfer(data, amount)
+        if error:
+            return jsonify({'error': error}), 400
+
+        payload = {
+            'recipient_identifier': data['recipient_identifier'],
+            'amount': str(amount),
+            'source_account': data['source_account'],
+            'note': data.get('note')
+        }
+        if _wants_async():
+            # 异步模式：写入本地持久化队列后立即返回，由 transfer_worker.py 批量入账
+            # 带 Idempotency-Key 时队列项id由key导出：先入队再保存响应，
+            # 两步之间崩溃或出错时，重试会落到同一个队列项上，不会重复入队
+            claim = current_claim()
+            transfer_id = transfer_queue.enqueue(
+                current_user_id, payload,
+                transfer_id=claim_id(claim) if claim else None,
+                reuse_after=current_app.config.get('IDEMPOTENCY_TTL', 86400)
+            )
+            body = {
+                'message': 'Transfer accepted',
+                'transfer_id': transfer_id,
+                'status': 'queued'
+            }
+            record_response(body, 202)
+            db.session.commit()
+            response = jsonify(body)
+            response.headers['Location'] = url_for('transactions.get_transfer_status', transfer_id=transfer_id)
+            return response, 202
+
+        if current_app.config.get('TRANSFER_GROUP_COMMIT', False):
+            # 组提交模式：与同一时间窗口内的其它转账共用一次提交
+            body, status = group_commit.submit(current_user_id, payload)
+            return jsonify(body), status
+
+        return _apply_transfer(current_user_id, data, amount)
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'error': 'Internal Server Error',
             'message': str(e)
         }), 500
 
+def _wants_async():
+    prefer = request.headers.get('Prefer', '')
+    return current_app.config.get('TRANSFER_ASYNC', False) or 'respond-async' in prefer
+
+@retry_on_deadlock
+def _apply_transfer(current_user_id, data, amount):
+    """转账事务：余额变更都是带条件的原子UPDATE，不做读-改-写"""
+    body, status = execute_transfer(current_user_id, data, amount)
+    if status != 200:
+        db.session.rollback()
+        return jsonify(body), status
+    record_response(body)
+    db.session.commit()
+    return jsonify(body)
+
+# 异步转账状态；?wait=秒数 时长轮询直到完成或超时
+@bp.route('/transfer/<transfer_id>', methods=['GET'])
+@jwt_required()
+def get_transfer_status(transfer_id):
+    current_user_id = int(get_jwt_identity())
+    wait = min(request.args.get('wait', 0, type=float), current_app.config.get('TRANSFER_STATUS_MAX_WAIT', 30))
+    if wait > 0:
+        item = transfer_queue.wait(transfer_id, current_user_id, wait)
+    else:
+        item = transfer_queue.get(transfer_id, current_user_id)
+    if item is None:
+        return jsonify({
+            'error': 'Not Found',
+            'message': 'Transfer not found'
+        }), 404
+    return jsonify(item)
+
 # 请求付款
 @bp.route('/request', methods=['POST'])
 @jwt_required()
+@idempotent
 def request_payment():
     try:
         current_user_id = int(get_jwt_identity())
@@ -95,36 +137,70 @@ def request_payment():
                 'error': 'Not Found',
                 'message': 'User not found'
             }), 404
-        data = request.get_json()
-        requester_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
 
         # 验证必要字段
         if not all(key in data for key in ['payers', 'total_amount']):
             return jsonify({'error': 'Missing required fields'}), 400
 
-        # 创建交易
-        transaction = Transaction(
-            transaction_type=TransactionType.REQUEST,
-            amount=data['total_amount'],
-            note=data.get('note'),
-            sender_id=requester_id
-
-        )
-        db.session.add(transaction)
-
-        # 创建付款请求
-        for payer in data['payers']:
-            payment_request = PaymentRequest(
-                transaction_id=transaction.id,
-                requester_id=requester_id,
-                payer_identifier=payer['identifier'],
-                amount=payer['amount']
+        try:
+            total, shares = build_shares(
+                data['total_amount'],
+                data['payers'],
+                split=data.get('split'),
+                max_payers=current_app.config['PAYMENT_REQUEST_MAX_PAYERS']
             )
-            db.session.add(payment_request)
-
+        except InvalidSplit as e:
+            return jsonify({'error': 'Invalid request', 'message': str(e)}), 400
+
+        # 创建交易和每个付款人的付款请求（批量写入）
+        transaction, rows = create_payment_request(current_user_id, total, shares, note=data.get('note'))
+        body = {
+            'message': 'Payment request created successfully',
+            'transaction_id': transaction.id,
+            'payment_requests': [{
+                'payer_identifier': row['payer_identifier'],
+                'payer_id': row['payer_id'],
+                'amount': str(row['amount'])
+            } for row in rows]
+        }
+        record_response(body)
         db.session.commit()
 
-        return jsonify({'message': 'Payment request created successfully', 'transaction_id': transaction.id})
+        return jsonify(body)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Internal Server Error',
+            'message': str(e)
+        }), 500
+
+# 付款人收件箱：别人向我发起的付款请求（键集分页）
+@bp.route('/requests/inbox', methods=['GET'])
+@jwt_required()
+@etag_by_change_seq()
+def payment_inbox():
+    try:
+        current_user_id = int(get_jwt_identity())
+        per_page = min(request.args.get('per_page', 50, type=int), current_app.config['PAYMENT_INBOX_PAGE_SIZE_MAX'])
+        try:
+            payment_requests, next_cursor = list_inbox(
+                current_user_id,
+                status=parse_status(request.args.get('status', 'pending')),
+                cursor=request.args.get('cursor'),
+                limit=max(per_page, 1)
+            )
+        except InvalidQuery as e:
+            return jsonify({'error': 'Invalid request', 'message': str(e)}), 400
+
+        return jsonify({
+            'payment_requests': payment_requests,
+            'pagination': {
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None,
+                'per_page': max(per_page, 1)
+            }
+        })
     except Exception as e:
         return jsonify({
             'error': 'Internal Server Error',
@@ -134,6 +210,7 @@ def request_payment():
 # 获取交易历史
 @bp.route('/transactions', methods=['GET'])
 @jwt_required()
+@etag_by_change_seq()
 def get_transactions():
 
     try:
@@ -201,33 +278,50 @@ def cancel_transaction():
             }), 404
         #逻辑是 根据交易id查询具体的转账双方 并恢复对应的账户数额
         transfer_id = request.args.get('transactionId')
-        query=Transaction.query.filter_by(id=transfer_id,type='transfer').first()
-        if query :
-            #查看交易目前状态
-            status=query.status
-            if status == TransactionStatus.PENDING or status == TransactionStatus.EXPIRED:
-                query.status=TransactionStatus.CANCELLED
-            if status==TransactionStatus.COMPLETED:
-                sender_account=query.sender_account
-                # 查找接收者
-                recipient_id = None
-                if '@' in query.recipient_identifier:
-                    email = Email.query.filter_by(email=query.recipient_identifier, is_verified=True).first()
-                    if email:
-                        recipient_id = email.user_id
-                else:
-                    phone = Phone.query.filter_by(phone=query.recipient_identifier, is_verified=True).first()
-                if phone:
-                    recipient_id = phone.user_id
-                    # 对双方银行账户进行回退操作
-                account = BankAccount.query.filter_by(account_number=sender_account).first()
-                if account:
-                    account.balance += query.amount
-                    account = BankAccount.query.filter_by(account_number=UserBankAccount.query.filter_by(user_id=recipient_id).first().bank_account_id).first()
-                    account.balance -= query.amount
-                query.status = TransactionStatus.CANCELLED
+        query=Transaction.query.filter_by(id=transfer_id,user_id=current_user_id,type=TransactionType.TRANSFER)\
+            .with_for_update().populate_existing().first()
+        if not query:
+            return jsonify({'error': 'Transaction not found'}), 404
+        #查看交易目前状态
+        status=query.status
+        if status == TransactionStatus.PENDING or status == TransactionStatus.EXPIRED:
+            query.status=TransactionStatus.CANCELLED
+            if status == TransactionStatus.PENDING:
+                apply_delta(current_user_id, pending=-query.amount)
+        elif status==TransactionStatus.COMPLETED:
+            # 已完成的转账只能在 TRANSACTION_CANCEL_MINUTES 内撤回
+            window = timedelta(minutes=current_app.config['TRANSACTION_CANCEL_MINUTES'])
+            if datetime.utcnow() - query.created_at > window:
+                db.session.rollback()
+                return jsonify({'error': 'Cancellation window has passed'}), 400
+            # 从当时实际入账的账户扣回，而不是接收方现在的主账户
+            if not query.recipient_account_id:
+                db.session.rollback()
+                return jsonify({'error': 'Transaction cannot be cancelled'}), 400
+            sender_account_id = db.session.execute(
+                owned_account_ids(current_user_id, query.sender_account)
+            ).scalars().first()
+            if not sender_account_id:
+                db.session.rollback()
+                return jsonify({'error': 'Source account not found'}), 400
+            # 对双方银行账户进行回退操作；接收方余额不足时不能撤回
+            if not debit_account(query.recipient_account_id, query.amount):
+                db.session.rollback()
+                return jsonify({'error': 'Recipient has insufficient funds'}), 400
+            apply_account_delta(query.recipient_account_id, -query.amount)
+            if not credit_account(sender_account_id, query.amount):
+                # 退回失败时整体回滚，接收方的扣款一并撤销
+                db.session.rollback()
+                return jsonify({'error': 'Source account not found'}), 400
+            query.status = TransactionStatus.CANCELLED
+        else:
+            return jsonify({'error': 'Transaction cannot be cancelled'}), 400
+        db.session.commit()
+
+        return jsonify({'message': 'Transaction cancelled successfully', 'transaction_id': query.id})
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'error': 'Internal Server Error',
             'message': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
@@ -0,0 +1,130 @@
+from abc import ABC, abstractmethod
+
+from sqlalchemy.orm import load_only, selectinload
+
+from app import db
+from app.models.user import User, Email, Phone
+
+
+def primary_value(column):
+    """相关子查询：该用户id最小的一条邮箱/电话的某一列（与 _primary 规则一致）"""
+    model = column.class_
+    return db.session.query(column)\
+        .filter(model.user_id == User.id)\
+        .order_by(model.id)\
+        .limit(1)\
+        .correlate(User)\
+        .scalar_subquery()
+
+
+def _primary(items):
+    # 与原 emails[0] / phones[0] 一致：取id最小的一条
+    return min(items, key=lambda item: item.id) if items else None
+
+
+class UserSerializer(ABC):
+    """用户响应的序列化基类
+
+    子类声明需要的User列以及emails/phones需要的列，
+    查询时只投影这些列，并用selectinload批量加载关联，避免每个用户两次懒加载。
+    """
+    columns = ()
+    email_columns = ()
+    phone_columns = ()
+
+    @classmethod
+    def options(cls):
+        options = [load_only(*cls.columns)]
+        if cls.email_columns:
+            options.append(selectinload(User.emails).load_only(*cls.email_columns))
+        if cls.phone_columns:
+            options.append(selectinload(User.phones).load_only(*cls.phone_columns))
+        return options
+
+    @classmethod
+    def query(cls):
+        return User.query.options(*cls.options())
+
+    @classmethod
+    def get(cls, user_id):
+        user = cls.query().filter(User.id == user_id).first()
+        return cls.dump(user) if user else None
+
+    @classmethod
+    def dump(cls, user):
+        email = _primary(user.emails) if cls.email_columns else None
+        phone = _primary(user.phones) if cls.phone_columns else None
+        return cls.fields(user, email, phone)
+
+    @classmethod
+    def dump_many(cls, users):
+        return [cls.dump(user) for user in users]
+
+    @classmethod
+    @abstractmethod
+    def fields(cls, user, email, phone):
+        """由子类实现：把用户及其主邮箱/主电话组装成响应字典"""
+
+
+class AccountSerializer(UserSerializer):
+    """登录和管理员账户列表使用的格式（即 User.to_dict()）"""
+    columns = (User.name, User.is_admin, User.balance)
+    email_columns = (Email.email,)
+    phone_columns = (Phone.phone,)
+
+    @classmethod
+    def fields(cls, user, email, phone):
+        return cls.build(
+            user.id,
+            user.name,
+            email.email if email else None,
+            phone.phone if phone else None,
+            user.is_admin,
+            user.balance
+        )
+
+    @staticmethod
+    def build(user_id, name, email, phone, is_admin, balance):
+        return {
+            'id': f"ACC{user_id}",
+            'name': name,
+            'email': email,
+            'phone': phone,
+            'is_admin': is_admin,
+            'balance': balance
+        }
+
+
+class ProfileSerializer(UserSerializer):
+    """/api/user/profile 使用的格式"""
+    columns = (User.name,)
+    email_columns = (Email.email, Email.is_verified)
+    phone_columns = (Phone.phone, Phone.is_verified)
+
+    @classmethod
+    def fields(cls, user, email, phone):
+        return {
+            'id': user.id,
+            'name': user.name,
+            'email': email.email if email else None,
+            'phone': phone.phone if phone else None,
+            'email_verified': email.is_verified if email else False,
+            'phone_verified': phone.is_verified if phone else False,
+            'avatar': None  # 暂时不支持头像
+        }
+
+
+class DashboardProfileSerializer(UserSerializer):
+    """/api/dashboard/user/profile 使用的格式"""
+    columns = (User.name, User.is_admin)
+    email_columns = (Email.email,)
+    phone_columns = (Phone.phone,)
+
+    @classmethod
+    def fields(cls, user, email, phone):
+        return {
+            'name': user.name,
+            'email': email.email if email else None,
+            'phone': phone.phone if phone else None,
+            'is_admin': user.is_admin
+        }
@@ -0,0 +1,182 @@
+import base64
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import func, and_, or_
+
+from app import db
+from app.models.user import User, Email, Phone
+from app.models.bank import UserBalanceSummary
+from app.serializers.user import AccountSerializer, primary_value
+
+
+class InvalidQuery(ValueError):
+    """列表参数不合法（调用方返回400）"""
+
+
+# 可排序字段及游标值的解析方式
+SORT_FIELDS = {
+    'id': int,
+    'name': str,
+    'created_at': datetime.fromisoformat,
+    'balance': Decimal,
+}
+
+
+def accounts_query(filters=None, sort='id'):
+    """管理员账户列表查询：余额合计、主邮箱、主电话在同一条SQL中完成"""
+    filters = filters or {}
+    # 余额合计直接读取增量维护的汇总表
+    balance = func.coalesce(UserBalanceSummary.total_balance, 0)
+    query = db.session.query(
+            User.id,
+            User.name,
+            User.is_admin,
+            User.created_at,
+            balance.label('balance'),
+            primary_value(Email.email).label('email'),
+            primary_value(Phone.phone).label('phone')
+        )\
+        .outerjoin(UserBalanceSummary, UserBalanceSummary.user_id == User.id)
+
+    if filters.get('min_balance') is not None:
+        query = query.filter(balance >= filters['min_balance'])
+    if filters.get('max_balance') is not None:
+        query = query.filter(balance <= filters['max_balance'])
+    if filters.get('is_admin') is not None:
+        query = query.filter(User.is_admin == filters['is_admin'])
+    if filters.get('created_from') is not None:
+        query = query.filter(User.created_at >= filters['created_from'])
+    if filters.get('created_to') is not None:
+        query = query.filter(User.created_at <= filters['created_to'])
+
+    sort_column = {
+        'id': User.id,
+        'name': User.name,
+        'created_at': User.created_at,
+        'balance': balance,
+    }[sort]
+    return query, sort_column
+
+
+def serialize_account(row):
+    return AccountSerializer.build(
+        row.id, row.name, row.email, row.phone, row.is_admin, round(float(row.balance), 2)
+    )
+
+
+def parse_filters(args):
+    """从查询参数中解析过滤条件"""
+    filters = {}
+    try:
+        for key in ('min_balance', 'max_balance'):
+            if args.get(key):
+                filters[key] = Decimal(args[key])
+        for key in ('created_from', 'created_to'):
+            if args.get(key):
+                filters[key] = datetime.fromisoformat(args[key])
+    except (ValueError, ArithmeticError):
+        raise InvalidQuery(f"Invalid filter value: {key}")
+    if args.get('is_admin'):
+        value = args['is_admin'].lower()
+        if value not in ('true', 'false', '1', '0'):
+            raise InvalidQuery('Invalid filter value: is_admin')
+        filters['is_admin'] = value in ('true', '1')
+    return filters
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    raw = json.dumps([value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return SORT_FIELDS[sort](value), int(row_id)
+    except (ValueError, TypeError, ArithmeticError):
+        raise InvalidQuery('Invalid cursor')
+
+
+def list_accounts(filters=None, sort='id', order='asc', cursor=None, limit=50):
+    """键集分页：按 (排序列, id) 定位下一页，不使用OFFSET"""
+    if sort not in SORT_FIELDS:
+        raise InvalidQuery(f"Unsupported sort field: {sort}")
+    if order not in ('asc', 'desc'):
+        raise InvalidQuery(f"Unsupported order: {order}")
+
+    query, sort_column = accounts_query(filters, sort)
+    descending = order == 'desc'
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort)
+        if descending:
+            query = query.filter(or_(sort_column < value, and_(sort_column == value, User.id < row_id)))
+        else:
+            query = query.filter(or_(sort_column > value, and_(sort_column == value, User.id > row_id)))
+    if descending:
+        query = query.order_by(sort_column.desc(), User.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), User.id.asc())
+
+    # 多取一行用来判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort), last.id)
+    return [serialize_account(row) for row in rows], next_cursor
+
+
+EXPORT_FIELDS = ('id', 'name', 'email', 'phone', 'is_admin', 'balance')
+
+
+def export_accounts(filters=None, fmt='ndjson', compress=False, batch_size=1000):
+    """流式导出：服务端游标逐批读取，逐行生成NDJSON/CSV，可选gzip"""
+    query, _ = accounts_query(filters)
+    rows = query.order_by(User.id).yield_per(batch_size)
+
+    def lines():
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            for row in rows:
+                account = serialize_account(row)
+                writer.writerow([account[field] for field in EXPORT_FIELDS])
+                # 每攒够一批再输出，避免逐行产生过多小块
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            chunk = []
+            for row in rows:
+                chunk.append(json.dumps(serialize_account(row)) + '\n')
+                if len(chunk) >= batch_size:
+                    yield ''.join(chunk)
+                    chunk = []
+            yield ''.join(chunk)
+
+    if not compress:
+        return (text.encode('utf-8') for text in lines() if text)
+
+    def gzipped():
+        compressor = zlib.compressobj(wbits=31)  # wbits=31 输出gzip格式
+        for text in lines():
+            data = compressor.compress(text.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    return gzipped()
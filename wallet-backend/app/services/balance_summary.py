@@ -0,0 +1,135 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import func, select, update, insert, delete, bindparam
+
+from app import db
+from app.models.user import User
+from app.models.bank import BankAccount, UserBankAccount, UserBalanceSummary
+from app.models.transaction import Transaction, TransactionType, TransactionStatus
+
+_summary = UserBalanceSummary.__table__
+
+
+def summary_select(user_filter):
+    """从明细重新计算汇总的SELECT（重建和补齐缺失行共用）
+
+    余额只算主余额：分片账户子余额行上尚未归并的入账，归并时才计入汇总（见 ledger.fold_shards）。
+    """
+    total = select(func.coalesce(func.sum(BankAccount.balance), 0))\
+        .select_from(UserBankAccount)\
+        .join(BankAccount, BankAccount.id == UserBankAccount.bank_account_id)\
+        .where(UserBankAccount.user_id == User.id)\
+        .scalar_subquery()
+    count = select(func.count(UserBankAccount.id))\
+        .where(UserBankAccount.user_id == User.id)\
+        .scalar_subquery()
+    # 待处理金额只算转出的待处理转账；收款请求(REQUEST)不占用余额
+    pending = select(func.coalesce(func.sum(Transaction.amount), 0))\
+        .where(
+            Transaction.user_id == User.id,
+            Transaction.status == TransactionStatus.PENDING,
+            Transaction.type == TransactionType.TRANSFER
+        )\
+        .scalar_subquery()
+    last_activity = select(func.max(Transaction.created_at))\
+        .where(Transaction.user_id == User.id)\
+        .scalar_subquery()
+    return select(User.id, total, count, pending, last_activity, func.now()).where(user_filter)
+
+
+SUMMARY_COLUMNS = ['user_id', 'total_balance', 'account_count', 'pending_total', 'last_activity_at', 'updated_at']
+
+
+def recompute(user_ids):
+    """按明细重新计算这些用户的汇总行（先删后插，调用方负责提交）"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    db.session.flush()
+    db.session.execute(delete(_summary).where(_summary.c.user_id.in_(user_ids)))
+    db.session.execute(insert(_summary).from_select(SUMMARY_COLUMNS, summary_select(User.id.in_(user_ids))))
+
+
+def apply_delta(user_id, balance=0, accounts=0, pending=0, activity=True):
+    """在当前事务中增量更新汇总；汇总行不存在时按明细补齐"""
+    if user_id is None:
+        return
+    now = datetime.utcnow()
+    values = {
+        'total_balance': _summary.c.total_balance + balance,
+        'account_count': _summary.c.account_count + accounts,
+        'pending_total': _summary.c.pending_total + pending,
+        'updated_at': now,
+    }
+    if activity:
+        values['last_activity_at'] = now
+    result = db.session.execute(
+        update(_summary).where(_summary.c.user_id == user_id).values(**values)
+    )
+    if result.rowcount == 0:
+        # 补齐时明细里已经包含了本次变更（recompute 会先flush）
+        recompute([user_id])
+
+
+def apply_account_delta(bank_account_id, balance):
+    """某个银行账户余额变化时，更新所有关联用户的汇总（一条UPDATE）
+
+    bank_account_id 也可以是返回账户id的子查询，此时不需要先查出id。
+    """
+    now = datetime.utcnow()
+    if isinstance(bank_account_id, int):
+        account_filter = UserBankAccount.bank_account_id == bank_account_id
+    else:
+        account_filter = UserBankAccount.bank_account_id.in_(bank_account_id)
+    owners = select(UserBankAccount.user_id).where(account_filter)
+    result = db.session.execute(
+        update(_summary)
+        .where(_summary.c.user_id.in_(owners))
+        .values(total_balance=_summary.c.total_balance + balance, last_activity_at=now, updated_at=now)
+    )
+    if result.rowcount == 0:
+        recompute(db.session.execute(owners).scalars().all())
+
+
+_bulk_delta = update(_summary)\
+    .where(_summary.c.user_id == bindparam('summary_user_id'))\
+    .values(
+        total_balance=_summary.c.total_balance + bindparam('balance_delta'),
+        pending_total=_summary.c.pending_total + bindparam('pending_delta'),
+        updated_at=bindparam('now')
+    )
+
+
+def apply_deltas(deltas):
+    """批量增量更新汇总：deltas = {user_id: (余额变化, 待处理金额变化)}
+
+    已有汇总行用一条 executemany UPDATE，缺失的行按明细补齐（调用方负责提交）。
+    """
+    if not deltas:
+        return
+    existing = set(db.session.execute(
+        select(_summary.c.user_id).where(_summary.c.user_id.in_(list(deltas)))
+    ).scalars())
+    now = datetime.utcnow()
+    if existing:
+        db.session.execute(_bulk_delta, [{
+            'summary_user_id': user_id,
+            'balance_delta': deltas[user_id][0],
+            'pending_delta': deltas[user_id][1],
+            'now': now
+        } for user_id in existing])
+    recompute(set(deltas) - existing)
+
+
+def get_summary(user_id):
+    """O(1) 读取单个用户的汇总，不写库
+
+    汇总行缺失时按明细现算一次返回（字段与汇总行相同），不在读请求里补齐；
+    补齐由下一次写入（apply_delta 等）或 rebuild_balance_summaries.py 完成。
+    """
+    summary = db.session.get(UserBalanceSummary, user_id)
+    if summary is not None:
+        return summary
+    row = db.session.execute(summary_select(User.id == user_id)).first()
+    return SimpleNamespace(**dict(zip(SUMMARY_COLUMNS, row))) if row else None
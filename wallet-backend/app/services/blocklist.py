@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有fcntl，退化为不加文件锁
+    fcntl = None
+
+from app.utils.bloom import BloomFilter
+
+
+class TokenBlocklist:
+    """已注销令牌(jti)的黑名单
+
+    布隆过滤器挡掉绝大多数未注销的令牌，命中时再查精确的过期集合；
+    注销记录追加写入日志文件，重启时据此恢复，其它worker进程定期读取新增部分。
+    config_prefix 和 default_log 决定读取哪组配置、默认日志文件名（管理员降权记录也用这个类）。
+    """
+
+    def __init__(self, config_prefix='JWT_BLOCKLIST', default_log='revoked_tokens.log'):
+        self.config_prefix = config_prefix
+        self.default_log = default_log
+        self.log_path = None
+        self.sync_interval = 1
+        self.purge_interval = 60
+        self._bloom = BloomFilter()
+        self._revoked = {}  # jti -> 过期时间戳
+        self._lock = threading.Lock()
+        self._log_inode = None
+        self._log_offset = 0
+        self._last_sync = 0
+        self._last_purge = 0
+        self._purge_thread = None
+        self._added_during_purge = None  # 后台重建期间新增的jti，替换前补进新过滤器
+
+    def init_app(self, app):
+        prefix = self.config_prefix
+        self.log_path = app.config.get(f'{prefix}_LOG') or \
+            os.path.join(app.instance_path, self.default_log)
+        self.sync_interval = app.config.get(f'{prefix}_SYNC_INTERVAL', 1)
+        self._bloom = BloomFilter(
+            capacity=app.config.get(f'{prefix}_CAPACITY', 1000000),
+            error_rate=app.config.get(f'{prefix}_ERROR_RATE', 0.001)
+        )
+        self._revoked = {}
+        self._log_inode = None
+        self._log_offset = 0
+        os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+        self._compact_log()
+        self._sync()
+
+    def revoke(self, jti, expires_at):
+        line = f"{jti} {int(expires_at)}\n"
+        with self._locked_log():
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        with self._lock:
+            self._add(jti, expires_at)
+
+    def is_revoked(self, jti):
+        return self.revoked_until(jti) is not None
+
+    def revoked_until(self, jti):
+        """记录仍有效时返回其过期时间戳，否则返回 None"""
+        now = time.time()
+        if now - self._last_sync >= self.sync_interval:
+            self._sync()
+        if now - self._last_purge >= self.purge_interval:
+            self._start_purge(now)
+        if jti not in self._bloom:
+            return None
+        # 布隆过滤器可能误报，以精确集合为准
+        expires_at = self._revoked.get(jti)
+        return expires_at if expires_at is not None and expires_at > now else None
+
+    def _add(self, jti, expires_at):
+        if expires_at > time.time():
+            self._revoked[jti] = expires_at
+            self._bloom.add(jti)
+            if self._added_during_purge is not None:
+                self._added_during_purge.append(jti)
+
+    def _sync(self):
+        """读取其它进程追加到日志中的新记录"""
+        with self._lock:
+            self._last_sync = time.time()
+            try:
+                stat = os.stat(self.log_path)
+            except (OSError, TypeError):
+                return
+            # 日志被压缩替换或截断后从头读取
+            if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+                self._log_inode = stat.st_ino
+                self._log_offset = 0
+            if stat.st_size == self._log_offset:
+                return
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith('\n'):
+                        break  # 另一进程尚未写完的行，下次再读
+                    self._log_offset += len(line.encode('utf-8'))
+                    parts = line.split()
+                    if len(parts) == 2:
+                        self._add(parts[0], int(parts[1]))
+
+    def _start_purge(self, now):
+        """在后台线程中清理，请求线程不等待 O(n) 的重建"""
+        with self._lock:
+            if now - self._last_purge < self.purge_interval:
+                return
+            self._last_purge = now
+            if self._purge_thread is not None and self._purge_thread.is_alive():
+                return
+            self._purge_thread = threading.Thread(
+                target=self._purge, args=(now,), name='blocklist-purge', daemon=True
+            )
+            self._purge_thread.start()
+
+    def _purge(self, now):
+        """清理已过期的记录，并用剩余记录重建布隆过滤器
+
+        锁内只复制快照；重建在锁外进行，期间新增的记录由 _add 记下，替换前补进新过滤器。
+        """
+        with self._lock:
+            snapshot = list(self._revoked.items())
+            self._added_during_purge = []
+        expired = [(jti, exp) for jti, exp in snapshot if exp <= now]
+        if not expired:
+            with self._lock:
+                self._added_during_purge = None
+            return
+        # 在新的过滤器上重建后再整体替换引用：is_revoked 不加锁读取，
+        # 原地清空再回填的过程中已注销的令牌会被误判为未注销
+        bloom = BloomFilter(capacity=self._bloom.capacity, error_rate=self._bloom.error_rate)
+        for jti, exp in snapshot:
+            if exp > now:
+                bloom.add(jti)
+        with self._lock:
+            for jti, exp in expired:
+                # 重建期间同一jti可能被重新注销（过期时间更晚），只删未变的记录
+                if self._revoked.get(jti) == exp:
+                    del self._revoked[jti]
+            for jti in self._added_during_purge:
+                bloom.add(jti)
+            self._added_during_purge = None
+            self._bloom = bloom
+
+    def _compact_log(self):
+        """启动时去掉日志中已过期的记录"""
+        if not os.path.exists(self.log_path):
+            return
+        now = time.time()
+        with self._locked_log():
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                live = [line for line in f
+                        if line.endswith('\n') and len(line.split()) == 2 and int(line.split()[1]) > now]
+            tmp = self.log_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.writelines(live)
+            os.replace(tmp, self.log_path)
+
+    def _locked_log(self):
+        return _FileLock(self.log_path + '.lock')
+
+
+class _FileLock:
+    """跨进程的日志文件锁"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+blocklist = TokenBlocklist()
@@ -0,0 +1,97 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import request, make_response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+
+from app import db
+from app.models.user import User, Email, Phone
+from app.models.bank import BankAccount, UserBankAccount, UserBalanceSummary
+from app.models.transaction import Transaction, PaymentRequest
+
+# 每个用户一个单调递增的变更序号（User.change_seq）
+# 任何影响该用户的写入都会在同一事务中递增它，GET接口据此生成ETag
+
+# 各模型中指向受影响用户的属性
+_USER_ATTRS = {
+    User: ('id',),
+    Email: ('user_id',),
+    Phone: ('user_id',),
+    UserBankAccount: ('user_id',),
+    UserBalanceSummary: ('user_id',),
+    Transaction: ('user_id',),
+    PaymentRequest: ('requester_id', 'payer_id'),
+}
+
+
+def bump_change_seq(user_ids, connection=None):
+    """递增这些用户的变更序号；不经过ORM的批量写入需要手动调用"""
+    user_ids = sorted({int(uid) for uid in user_ids if uid is not None})
+    if not user_ids:
+        return
+    stmt = User.__table__.update()\
+        .where(User.__table__.c.id.in_(user_ids))\
+        .values(change_seq=User.__table__.c.change_seq + 1)
+    (connection or db.session.connection()).execute(stmt)
+
+
+def get_change_seq(user_id):
+    return db.session.query(User.change_seq).filter(User.id == user_id).scalar()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    user_ids = set()
+    bank_account_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, BankAccount):
+            bank_account_ids.add(obj.id)
+            continue
+        for attr in _USER_ATTRS.get(type(obj), ()):
+            user_ids.add(getattr(obj, attr))
+    connection = session.connection()
+    if bank_account_ids:
+        # 余额变化影响该账户关联的所有用户
+        table = UserBankAccount.__table__
+        rows = connection.execute(
+            table.select().with_only_columns(table.c.user_id)
+            .where(table.c.bank_account_id.in_(bank_account_ids))
+        )
+        user_ids.update(row.user_id for row in rows)
+    # 新建用户的序号从默认值开始，不需要递增
+    user_ids -= {obj.id for obj in session.new if isinstance(obj, User)}
+    bump_change_seq(user_ids, connection)
+
+
+def current_month():
+    """按月统计的响应在月初失效"""
+    return datetime.utcnow().strftime('%Y-%m')
+
+
+def etag_by_change_seq(salt=None):
+    """根据当前用户的变更序号生成ETag，If-None-Match 命中时直接返回304，不执行视图函数
+
+    salt 用于那些会随时间变化（而非随写入变化）的响应，例如按月统计的数据。
+    需要放在 jwt_required 之后。
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            user_id = get_jwt_identity()
+            seq = get_change_seq(user_id)
+            if seq is None:
+                return fn(*args, **kwargs)
+            key = f"{request.full_path}|{user_id}|{seq}|{salt() if salt else ''}"
+            etag = hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+                response.set_etag(etag, weak=True)
+                return response
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+            return response
+        return wrapper
+    return decorator
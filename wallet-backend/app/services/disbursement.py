@@ -0,0 +1,198 @@
+import hashlib
+import json
+import random
+import string
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import bindparam
+
+from app import db
+from app.models.user import User
+from app.models.bank import BankAccount, UserBankAccount, UserBalanceSummary
+from app.models.transaction import Transaction, TransactionType, TransactionStatus
+from app.models.disbursement import DisbursementBatch, DisbursementItem
+from app.services.balance_summary import recompute
+from app.services.change_seq import bump_change_seq
+from app.services.recipients import invalidate_users, primary_account_ids
+
+
+class BatchConflict(Exception):
+    """批次号已被使用且内容不一致"""
+
+
+_accounts = BankAccount.__table__
+_summaries = UserBalanceSummary.__table__
+
+# executemany 语句：按账户累加余额、按用户累加汇总
+_credit_account = _accounts.update()\
+    .where(_accounts.c.id == bindparam('account_id'))\
+    .values(balance=_accounts.c.balance + bindparam('delta'))
+_credit_summary = _summaries.update()\
+    .where(_summaries.c.user_id == bindparam('summary_user_id'))\
+    .values(
+        total_balance=_summaries.c.total_balance + bindparam('delta'),
+        account_count=_summaries.c.account_count + bindparam('new_accounts'),
+        last_activity_at=bindparam('now'),
+        updated_at=bindparam('now')
+    )
+
+
+def _parse_item(item):
+    """返回 (user_id, amount, note, error)"""
+    try:
+        user_id = int(str(item['to_account']).replace('ACC', ''))
+        amount = Decimal(str(item['amount']))
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        return None, None, None, 'to_account and amount are required'
+    if amount <= 0 or amount != amount.quantize(Decimal('0.01')):
+        return user_id, None, None, 'Amount must be positive with at most 2 decimals'
+    return user_id, amount, item.get('note') or 'Admin transfer', None
+
+
+def _new_account_numbers(count):
+    """生成 count 个互不相同、且库里还没有的10位账号"""
+    numbers = set()
+    while len(numbers) < count:
+        candidates = {''.join(random.choices(string.digits, k=10)) for _ in range(count - len(numbers))}
+        candidates -= numbers
+        taken = {row[0] for row in db.session.query(BankAccount.account_number)
+                 .filter(BankAccount.account_number.in_(candidates))}
+        numbers |= candidates - taken
+    return list(numbers)
+
+
+def _create_default_accounts(user_ids):
+    """给没有银行账户的用户开默认账户，返回 {user_id: 账户id}
+
+    每个账户单独INSERT并取自己的主键，不按账号反查（账号在库里没有唯一约束）。
+    """
+    user_ids = sorted(user_ids)
+    now = datetime.utcnow()
+    accounts = {}
+    for user_id, number in zip(user_ids, _new_account_numbers(len(user_ids))):
+        result = db.session.execute(_accounts.insert().values(
+            bank_name='Default Bank',
+            account_number=number,
+            balance=0,
+            is_primary=True,
+            created_at=now
+        ))
+        accounts[user_id] = result.inserted_primary_key[0]
+    db.session.execute(UserBankAccount.__table__.insert(), [{
+        'user_id': user_id, 'bank_account_id': account_id, 'created_at': now
+    } for user_id, account_id in accounts.items()])
+    # 核心INSERT不触发映射事件，手动让收款人缓存失效
+    invalidate_users(accounts)
+    return accounts
+
+
+def _process_chunk(batch_id, chunk):
+    """处理一个分块：所有写入在同一事务中完成"""
+    now = datetime.utcnow()
+    results = {}
+    valid = []
+    for index, item in chunk:
+        user_id, amount, note, error = _parse_item(item)
+        if error:
+            results[index] = (user_id, amount, error)
+        else:
+            valid.append((index, user_id, amount, note))
+
+    user_ids = {user_id for _, user_id, _, _ in valid}
+    existing = {row[0] for row in db.session.query(User.id).filter(User.id.in_(user_ids))}
+    accounts = primary_account_ids(existing) if existing else {}
+    new_accounts = _create_default_accounts(existing - set(accounts)) if existing - set(accounts) else {}
+    accounts.update(new_accounts)
+
+    account_deltas = defaultdict(Decimal)
+    user_deltas = defaultdict(Decimal)
+    transactions = []
+    for index, user_id, amount, note in valid:
+        if user_id not in existing:
+            results[index] = (user_id, amount, 'Target account not found')
+            continue
+        account_deltas[accounts[user_id]] += amount
+        user_deltas[user_id] += amount
+        transactions.append({
+            'user_id': user_id,
+            'amount': amount,
+            'description': note,
+            'type': TransactionType.TRANSFER,
+            'status': TransactionStatus.COMPLETED,
+            'created_at': now,
+            'updated_at': now
+        })
+        results[index] = (user_id, amount, None)
+
+    if account_deltas:
+        db.session.execute(_credit_account, [
+            {'account_id': account_id, 'delta': delta} for account_id, delta in account_deltas.items()
+        ])
+        db.session.execute(Transaction.__table__.insert(), transactions)
+        with_summary = {row[0] for row in db.session.query(UserBalanceSummary.user_id)
+                        .filter(UserBalanceSummary.user_id.in_(user_deltas))}
+        if with_summary:
+            db.session.execute(_credit_summary, [{
+                'summary_user_id': user_id,
+                'delta': user_deltas[user_id],
+                'new_accounts': 1 if user_id in new_accounts else 0,
+                'now': now
+            } for user_id in with_summary])
+        recompute(set(user_deltas) - with_summary)
+        bump_change_seq(user_deltas)
+
+    db.session.execute(DisbursementItem.__table__.insert(), [{
+        'batch_id': batch_id,
+        'item_index': index,
+        'to_user_id': user_id,
+        'amount': amount,
+        'status': 'failed' if error else 'completed',
+        'error': error,
+        'created_at': now
+    } for index, (user_id, amount, error) in results.items()])
+    db.session.commit()
+
+
+def items_hash(items):
+    """条目内容的指纹：同一批次号重复提交时必须与首次提交完全一致"""
+    canonical = json.dumps(items, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def run_batch(batch_id, items, admin_id, chunk_size=1000):
+    """执行批量打款；同一批次号重复提交时跳过已处理的条目"""
+    batch = DisbursementBatch.query.get(batch_id)
+    digest = items_hash(items)
+    if batch is None:
+        db.session.add(DisbursementBatch(id=batch_id, created_by=admin_id, total_items=len(items), items_hash=digest))
+        db.session.commit()
+    elif batch.items_hash != digest:
+        raise BatchConflict(f"Batch {batch_id} already exists with different items")
+
+    done = {row[0] for row in db.session.query(DisbursementItem.item_index)
+            .filter(DisbursementItem.batch_id == batch_id)}
+    pending = [(index, item) for index, item in enumerate(items) if index not in done]
+    for i in range(0, len(pending), chunk_size):
+        _process_chunk(batch_id, pending[i:i + chunk_size])
+
+    batch = DisbursementBatch.query.get(batch_id)
+    if batch.completed_at is None:
+        batch.completed_at = datetime.utcnow()
+        db.session.commit()
+    return batch_results(batch_id)
+
+
+def batch_results(batch_id):
+    items = DisbursementItem.query\
+        .filter(DisbursementItem.batch_id == batch_id)\
+        .order_by(DisbursementItem.item_index)\
+        .all()
+    return [{
+        'index': item.item_index,
+        'to_account': f"ACC{item.to_user_id}" if item.to_user_id is not None else None,
+        'amount': float(item.amount) if item.amount is not None else None,
+        'status': item.status,
+        'error': item.error
+    } for item in items]
@@ -0,0 +1,67 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, update
+
+from app import db
+from app.models.transaction import Transaction, TransactionType, TransactionStatus
+from app.services.balance_summary import apply_deltas
+from app.services.change_seq import bump_change_seq
+
+_transactions = Transaction.__table__
+
+
+def expiry_cutoff(days):
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def expire_chunk(cutoff, chunk_size=500):
+    """把一批早于 cutoff 的待处理转账标记为过期，单独一个短事务，返回处理条数
+
+    走 (status, created_at) 索引做范围扫描；SKIP LOCKED 跳过正被结算或取消的行，下一轮再处理。
+    """
+    rows = db.session.execute(
+        select(_transactions.c.id, _transactions.c.user_id, _transactions.c.amount)
+        .where(
+            _transactions.c.status == TransactionStatus.PENDING,
+            _transactions.c.created_at < cutoff,
+            _transactions.c.type == TransactionType.TRANSFER
+        )
+        .order_by(_transactions.c.created_at)
+        .limit(chunk_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.session.commit()
+        return 0
+
+    now = datetime.utcnow()
+    db.session.execute(
+        update(_transactions)
+        .where(_transactions.c.id.in_([row.id for row in rows]), _transactions.c.status == TransactionStatus.PENDING)
+        .values(status=TransactionStatus.EXPIRED, updated_at=now)
+    )
+    # 释放这些转账占用的待处理金额
+    released = defaultdict(Decimal)
+    for row in rows:
+        released[row.user_id] += row.amount
+    apply_deltas({user_id: (0, -amount) for user_id, amount in released.items()})
+    bump_change_seq(released)
+    db.session.commit()
+    return len(rows)
+
+
+def expire_pending(days, chunk_size=500, pause=0):
+    """分批过期所有超期的待处理转账，返回总条数"""
+    cutoff = expiry_cutoff(days)
+    total = 0
+    while True:
+        expired = expire_chunk(cutoff, chunk_size)
+        total += expired
+        if expired < chunk_size:
+            return total
+        if pause:
+            # 批次之间让出锁和IO，不影响在线转账
+            time.sleep(pause)
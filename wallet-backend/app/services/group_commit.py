@@ -0,0 +1,238 @@
+import bisect
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+from flask import has_request_context
+from sqlalchemy import select, tuple_
+
+from app import db
+from app.models.transaction import Transaction
+from app.services.idempotency import current_claim, keep_claim, mark_recorded
+from app.services.transfers import apply_batch
+
+# 批大小直方图的桶上界（最后一个桶表示更大）
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# 提交耗时直方图的桶上界（毫秒），只统计 COMMIT 本身
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class _Pending:
+    __slots__ = ('item', 'state', 'result', 'done')
+
+    def __init__(self, item):
+        self.item = item
+        self.state = 'queued'  # queued -> running / cancelled
+        self.result = None
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """同步转账的组提交：一个时间窗口内到达的转账由写线程在同一个数据库事务中执行
+
+    每笔转账一个保存点，调用方各自拿到自己的结果；一次提交分摊到整批转账上。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.window = 0.005
+        self.max_batch = 100
+        self.wait_timeout = 30
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.app = app
+        self.window = app.config.get('TRANSFER_GROUP_COMMIT_WINDOW_MS', 5) / 1000
+        self.max_batch = app.config.get('TRANSFER_GROUP_COMMIT_MAX_BATCH', 100)
+        self.wait_timeout = app.config.get('TRANSFER_GROUP_COMMIT_TIMEOUT', 30)
+
+    def submit(self, user_id, payload):
+        """提交一笔转账并等待所在批次提交，返回 (响应体, HTTP状态码)"""
+        self._ensure_worker()
+        pending = _Pending({
+            'id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'payload': payload,
+            'idempotency': current_claim() if has_request_context() else None
+        })
+        self._queue.put(pending)
+        if not pending.done.wait(self.wait_timeout):
+            with self._lock:
+                if pending.state == 'queued':
+                    # 还没被写线程取走，撤回后可以放心地告诉调用方未执行
+                    pending.state = 'cancelled'
+                    return {'error': 'Server is busy, please try again later'}, 503
+            # 已经在执行，结果马上就会出来，不能中途放弃
+            pending.done.wait()
+        body, status = pending.result
+        if has_request_context():
+            if status == 200:
+                mark_recorded(body, status)  # 已随批次事务写入
+            elif body.get('outcome') == 'unknown':
+                keep_claim()
+        return body, status
+
+    def _ensure_worker(self):
+        # 预fork部署时每个worker进程各自启动写线程
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='transfer-group-commit', daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            with self.app.app_context():
+                results, commit_latency = self._apply([p.item for p in batch])
+            self._record(len(batch), commit_latency)
+            for p in batch:
+                p.result = results[p.item['id']]
+                p.done.set()
+
+    def _apply(self, items):
+        """执行并提交一批转账，返回 (结果, 提交耗时秒数)；执行阶段失败时耗时为 None
+
+        单笔的数据错误由 apply_batch 回滚它自己的保存点；死锁重试用尽等整批失败时，
+        逐笔在各自的事务里重做，失败的只影响它自己的调用方。
+        """
+        try:
+            results = apply_batch(items, record_results=False, commit=False)
+        except Exception as e:
+            print("Group commit error:", str(e))
+            print("Traceback:", traceback.format_exc())
+            db.session.rollback()
+            if len(items) > 1:
+                results = {}
+                for item in items:
+                    item_results, _ = self._apply([item])
+                    results.update(item_results)
+                return results, None
+            return {item['id']: ({'error': 'Internal Server Error', 'message': str(e)}, 500) for item in items}, None
+        started = time.monotonic()
+        try:
+            db.session.commit()
+        except Exception as e:
+            latency = time.monotonic() - started
+            print("Group commit error:", str(e))
+            print("Traceback:", traceback.format_exc())
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            return self._check_commit(items, results, e), latency
+        return results, time.monotonic() - started
+
+    def _check_commit(self, items, results, error):
+        """COMMIT 出错时事务可能已经生效：在新事务里查成功的转账是否已落库
+
+        查得到就按成功返回，确定没有就返回500；查不了的返回503，让调用方先查状态再重试。
+        """
+        applied = {}
+        for item in items:
+            body, status = results[item['id']]
+            if status == 200:
+                applied[item['id']] = (body['transaction_id'], item['user_id'])
+        if not applied:
+            return results
+        try:
+            rows = db.session.execute(
+                select(Transaction.id, Transaction.user_id)
+                .where(tuple_(Transaction.id, Transaction.user_id).in_(list(applied.values())))
+            ).all()
+            found = {(row.id, row.user_id) for row in rows}
+            db.session.rollback()
+        except Exception as e:
+            print("Group commit check error:", str(e))
+            db.session.rollback()
+            found = None
+        if found == set(applied.values()):
+            return results  # 已经提交
+        if found is not None and not found:
+            # 确定没有提交，整批都没有生效
+            return {item['id']: ({'error': 'Internal Server Error', 'message': str(error)}, 500) for item in items}
+        checked = dict(results)
+        for item_id in applied:
+            checked[item_id] = ({
+                'error': 'Transfer status unknown',
+                'message': 'The transfer may have been applied. Check your transactions before retrying, '
+                           'or retry with the same Idempotency-Key',
+                'outcome': 'unknown'
+            }, 503)
+        return checked
+
+    def _collect(self):
+        """阻塞等待第一笔，之后在时间窗口内继续收集，直到窗口结束或达到批大小上限"""
+        batch = []
+        first = self._queue.get()
+        deadline = time.monotonic() + self.window
+        pending = first
+        while True:
+            with self._lock:
+                if pending.state == 'queued':
+                    pending.state = 'running'
+                    batch.append(pending)
+            if len(batch) >= self.max_batch:
+                break
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+        return batch
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._commits = 0
+        self._transfers = 0
+        self._size_histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _record(self, size, latency):
+        with self._stats_lock:
+            self._batches += 1
+            self._transfers += size
+            self._size_histogram[bisect.bisect_left(BATCH_SIZE_BUCKETS, size)] += 1
+            if latency is None:
+                return  # 执行阶段就失败了，没有提交
+            latency_ms = latency * 1000
+            self._commits += 1
+            self._latency_histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+            self._latency_total += latency_ms
+            self._latency_max = max(self._latency_max, latency_ms)
+
+    def stats(self):
+        """批大小直方图和提交耗时（进程内统计）"""
+        def histogram(bounds, counts):
+            # 按桶顺序输出（jsonify 会给字典键排序）；le 为 None 表示超过最大上界
+            return [{'le': le, 'count': count} for le, count in zip(bounds + (None,), counts)]
+
+        with self._stats_lock:
+            return {
+                'batches': self._batches,
+                'transfers': self._transfers,
+                'avg_batch_size': round(self._transfers / self._batches, 2) if self._batches else 0,
+                'batch_size_histogram': histogram(BATCH_SIZE_BUCKETS, self._size_histogram),
+                'commit_latency_ms': {
+                    'avg': round(self._latency_total / self._commits, 2) if self._commits else 0,
+                    'max': round(self._latency_max, 2),
+                    'histogram': histogram(LATENCY_BUCKETS_MS, self._latency_histogram),
+                },
+            }
+
+
+group_commit = GroupCommitter()
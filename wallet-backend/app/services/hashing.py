@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+
+class HashingBusy(Exception):
+    """哈希队列已满或等待超时，请求被拒绝（调用方应返回503）"""
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+
+class HashingService:
+    """把bcrypt计算放到进程池中执行，避免阻塞请求线程"""
+
+    def __init__(self, rounds=12, workers=None, queue_size=64, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', 12)
+        self.workers = app.config.get('HASH_POOL_WORKERS', os.cpu_count())
+        self.queue_size = app.config.get('HASH_QUEUE_SIZE', 64)
+        self.timeout = app.config.get('HASH_TIMEOUT', 10)
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+
+    def _get_executor(self):
+        # 预fork部署时每个worker进程各自创建进程池
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        # workers为0时直接在当前线程计算（开发/测试环境）
+        if not self.workers:
+            return fn(*args)
+        # 排队+执行中的任务数超过上限时直接拒绝，防止请求堆积
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Password hashing queue is full')
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # 超时说明进程池积压，与队列已满同样按过载处理；还没开始的任务直接取消
+            future.cancel()
+            raise HashingBusy('Password hashing timed out')
+
+    def hash_password(self, password):
+        return self._run(_hashpw, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def check_password(self, password, password_hash):
+        if not password_hash:
+            return False
+        return self._run(_checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        """已存储哈希的cost与当前配置不一致时需要重新哈希"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return False
+
+
+hasher = HashingService()
@@ -0,0 +1,303 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import request, jsonify, make_response, Response, g, current_app
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.idempotency import IdempotencyKey
+from app.utils.cache import TTLCache, MISSING
+
+_keys = IdempotencyKey.__table__
+
+
+class IdempotencyStore:
+    """Idempotency-Key 的执行记录
+
+    数据库表保证跨进程只执行一次；进程内缓存直接重放已完成的响应，
+    同进程的并发重复请求等待正在执行的那一个，跨进程的则轮询数据库。
+    处理函数用 record_response 把响应和业务写入放在同一个事务里提交，
+    因此超时仍为 processing 的记录说明业务没有生效，可以重新抢占。
+    """
+
+    def __init__(self):
+        self.ttl = 86400
+        self.wait_timeout = 10
+        self.poll_interval = 0.05
+        self.processing_timeout = 120
+        self.purge_interval = 300
+        self._cache = TTLCache(maxsize=10000, ttl=300)
+        self._inflight = {}  # (user_id, endpoint, key) -> threading.Event
+        self._lock = threading.Lock()
+        self._last_purge = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDEMPOTENCY_TTL', 86400)
+        self.wait_timeout = app.config.get('IDEMPOTENCY_WAIT_TIMEOUT', 10)
+        self.poll_interval = app.config.get('IDEMPOTENCY_POLL_INTERVAL', 0.05)
+        self.processing_timeout = app.config.get('IDEMPOTENCY_PROCESSING_TIMEOUT', 120)
+        self._cache.configure(
+            maxsize=app.config.get('IDEMPOTENCY_CACHE_SIZE', 10000),
+            ttl=min(self.ttl, app.config.get('IDEMPOTENCY_CACHE_TTL', 300))
+        )
+
+    def run(self, scope, fingerprint, call):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            cached = self._cache.get(scope)
+            if cached is not MISSING:
+                return _replay(cached, fingerprint)
+            with self._lock:
+                event = self._inflight.get(scope)
+                owner = event is None
+                if owner:
+                    event = self._inflight[scope] = threading.Event()
+            if owner:
+                break
+            # 同进程内已有相同key的请求在执行，等它结束后读取结果
+            if not event.wait(max(0, deadline - time.monotonic())):
+                return _in_progress()
+
+        try:
+            return self._execute(scope, fingerprint, call, deadline)
+        finally:
+            with self._lock:
+                self._inflight.pop(scope, None)
+            event.set()
+
+    def _execute(self, scope, fingerprint, call, deadline):
+        self._maybe_purge()
+        while True:
+            claimed, record = self._claim(scope, fingerprint)
+            if claimed:
+                break
+            if record is None:
+                continue  # 旧记录刚被删除或已过期，重新抢占
+            if record['status'] == 'completed':
+                self._cache.set(scope, record)
+                return _replay(record, fingerprint)
+            # 其它进程正在执行
+            if time.monotonic() >= deadline:
+                return _in_progress()
+            time.sleep(self.poll_interval)
+
+        g.idempotency_claim = (scope, fingerprint)
+        g.pop('idempotency_recorded', None)
+        g.pop('idempotency_keep_claim', None)
+        try:
+            response = make_response(call())
+        except Exception:
+            self._release(scope)
+            raise
+        finally:
+            g.pop('idempotency_claim', None)
+        recorded = g.pop('idempotency_recorded', None)
+        if recorded is not None and recorded['response_code'] == response.status_code:
+            # 响应已经随处理函数的事务一起提交
+            self._cache.set(scope, recorded)
+            return response
+        if g.pop('idempotency_keep_claim', False):
+            # 结果未知（提交时出错），保留 processing 记录，不能让同一个key再执行一次
+            db.session.rollback()
+            return response
+        if response.status_code >= 500 or response.is_streamed:
+            # 服务端错误不保存，允许客户端用同一个key重试
+            self._release(scope)
+            return response
+
+        # 没有调用 record_response 的响应（参数错误等不改数据的结果）单独提交
+        record = {
+            'request_hash': fingerprint,
+            'status': 'completed',
+            'response_code': response.status_code,
+            'response_body': response.get_data(as_text=True),
+        }
+        db.session.execute(
+            update(_keys).where(*_scope_filter(scope)).values(
+                status='completed',
+                response_code=record['response_code'],
+                response_body=record['response_body']
+            )
+        )
+        db.session.commit()
+        self._cache.set(scope, record)
+        return response
+
+    def _claim(self, scope, fingerprint):
+        """插入 processing 记录抢占执行权；返回 (是否抢到, 已有记录)"""
+        user_id, endpoint, key = scope
+        now = datetime.utcnow()
+        try:
+            db.session.execute(insert(_keys).values(
+                user_id=user_id,
+                endpoint=endpoint,
+                key=key,
+                request_hash=fingerprint,
+                status='processing',
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl)
+            ))
+            db.session.commit()
+            return True, None
+        except IntegrityError:
+            db.session.rollback()
+
+        row = db.session.execute(
+            select(_keys.c.id, _keys.c.request_hash, _keys.c.status, _keys.c.response_code,
+                   _keys.c.response_body, _keys.c.created_at, _keys.c.expires_at)
+            .where(*_scope_filter(scope))
+        ).first()
+        # 结束只读事务，下次轮询能看到其它进程提交的结果
+        db.session.rollback()
+        if row is None:
+            return False, None
+        if row.expires_at <= now:
+            db.session.execute(delete(_keys).where(_keys.c.id == row.id, _keys.c.expires_at <= now))
+            db.session.commit()
+            return False, None
+        if row.status == 'processing' and row.created_at <= now - timedelta(seconds=self.processing_timeout):
+            # 执行者已经崩溃或放弃；业务生效时记录会是 completed，所以可以重新执行
+            db.session.execute(delete(_keys).where(
+                _keys.c.id == row.id, _keys.c.status == 'processing', _keys.c.created_at == row.created_at
+            ))
+            db.session.commit()
+            return False, None
+        return False, {
+            'request_hash': row.request_hash,
+            'status': row.status,
+            'response_code': row.response_code,
+            'response_body': row.response_body,
+        }
+
+    def _release(self, scope):
+        db.session.rollback()
+        db.session.execute(
+            delete(_keys).where(*_scope_filter(scope), _keys.c.status == 'processing')
+        )
+        db.session.commit()
+
+    def _maybe_purge(self, batch_size=1000):
+        """定期分批删除过期记录"""
+        now = time.time()
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        expired = select(_keys.c.id)\
+            .where(_keys.c.expires_at <= datetime.utcnow())\
+            .limit(batch_size)
+        ids = db.session.execute(expired).scalars().all()
+        if ids:
+            db.session.execute(delete(_keys).where(_keys.c.id.in_(ids)))
+        db.session.commit()
+
+
+def _scope_filter(scope):
+    user_id, endpoint, key = scope
+    return _keys.c.user_id == user_id, _keys.c.endpoint == endpoint, _keys.c.key == key
+
+
+def _replay(record, fingerprint):
+    if record['request_hash'] != fingerprint:
+        return jsonify({
+            'error': 'Idempotency key reused',
+            'message': 'This Idempotency-Key was already used with a different request'
+        }), 422
+    response = Response(record['response_body'], status=record['response_code'], mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _in_progress():
+    response = jsonify({
+        'error': 'Request in progress',
+        'message': 'A request with this Idempotency-Key is still being processed'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 409
+
+
+def current_claim():
+    """当前请求抢占到的 Idempotency-Key：(scope, 请求指纹)；没有带key时为 None"""
+    return g.get('idempotency_claim')
+
+
+def stage_response(claim, body, status_code=200):
+    """在当前事务中把 Idempotency-Key 记录为完成，随调用方的事务一起提交；返回记录"""
+    scope, fingerprint = claim
+    record = _completed(fingerprint, body, status_code)
+    db.session.execute(
+        update(_keys).where(*_scope_filter(scope), _keys.c.status == 'processing').values(
+            status='completed',
+            response_code=status_code,
+            response_body=record['response_body']
+        )
+    )
+    return record
+
+
+def record_response(body, status_code=200):
+    """处理函数在提交业务写入之前调用：响应和资金变动在同一个事务里提交
+
+    否则两次提交之间崩溃会留下钱已转出、key 却还是 processing 的记录。
+    """
+    claim = current_claim()
+    if claim is not None:
+        g.idempotency_recorded = stage_response(claim, body, status_code)
+
+
+def mark_recorded(body, status_code=200):
+    """响应已由别的线程用 stage_response 在业务事务中写入（组提交）"""
+    claim = current_claim()
+    if claim is not None:
+        g.idempotency_recorded = _completed(claim[1], body, status_code)
+
+
+def _completed(fingerprint, body, status_code):
+    return {
+        'request_hash': fingerprint,
+        'status': 'completed',
+        'response_code': status_code,
+        'response_body': current_app.json.dumps(body),
+    }
+
+
+def claim_id(claim):
+    """由 Idempotency-Key 和请求指纹导出的稳定id：同一个请求重试（包括崩溃后重新抢占）得到同一个id"""
+    (user_id, endpoint, key), fingerprint = claim
+    return hashlib.sha256(f'{user_id}\n{endpoint}\n{key}\n{fingerprint}'.encode('utf-8')).hexdigest()[:32]
+
+
+def keep_claim():
+    """当前请求的结果未知时调用：不释放 Idempotency-Key
+
+    已生效时记录是 completed，重试直接重放；未生效的在 processing 超时前重试收到409，之后才重新执行。
+    """
+    g.idempotency_keep_claim = True
+
+
+def idempotent(fn):
+    """支持 Idempotency-Key 请求头；需要放在 jwt_required / admin_required 之后"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({
+                'error': 'Invalid request',
+                'message': 'Idempotency-Key must be at most 255 characters'
+            }), 400
+        scope = (int(get_jwt_identity()), request.endpoint, key)
+        fingerprint = hashlib.sha256(
+            request.method.encode('utf-8') + b' ' + request.path.encode('utf-8') + b'\n' + request.get_data()
+        ).hexdigest()
+        return idempotency.run(scope, fingerprint, lambda: fn(*args, **kwargs))
+    return wrapper
+
+
+idempotency = IdempotencyStore()
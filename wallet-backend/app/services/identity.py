@@ -0,0 +1,88 @@
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models.user import User, Email, Phone
+from app.serializers.user import AccountSerializer, primary_value
+from app.utils.cache import TTLCache, MISSING
+
+# 登录标识(邮箱/电话) -> 用户投影 的进程内缓存
+# 多worker部署时各进程独立缓存，跨进程的数据陈旧由TTL兜底
+identity_cache = TTLCache()
+
+
+def init_app(app):
+    identity_cache.configure(
+        maxsize=app.config.get('IDENTITY_CACHE_SIZE', 10000),
+        ttl=app.config.get('IDENTITY_CACHE_TTL', 300)
+    )
+
+
+def _load_identity(identifier):
+    """一次查询：标识 -> 用户信息投影（含主邮箱、主电话）"""
+    model, column = (Email, Email.email) if '@' in identifier else (Phone, Phone.phone)
+    row = db.session.query(
+            User.id,
+            User.name,
+            User.password_hash,
+            User.is_admin,
+            User.balance,
+            primary_value(Email.email).label('primary_email'),
+            primary_value(Phone.phone).label('primary_phone')
+        )\
+        .select_from(model)\
+        .join(User, User.id == model.user_id)\
+        .filter(column == identifier)\
+        .first()
+    if row is None:
+        return None
+    return {
+        'user_id': row.id,
+        'password_hash': row.password_hash,
+        # 与 User.to_dict() 返回格式保持一致
+        'user': AccountSerializer.build(
+            row.id, row.name, row.primary_email, row.primary_phone, row.is_admin, row.balance
+        )
+    }
+
+
+def lookup_identity(identifier):
+    """按邮箱或电话查找用户，命中缓存时不访问数据库"""
+    identity = identity_cache.get(identifier)
+    if identity is MISSING:
+        identity = _load_identity(identifier)
+        if identity is not None:
+            identity_cache.set(identifier, identity)
+    return identity
+
+
+def invalidate_user(user_id):
+    identity_cache.pop_where(lambda key, value: value['user_id'] == user_id)
+
+
+# Email/Phone/User 变更时让缓存失效
+def _changed_values(target, attr):
+    history = inspect(target).attrs[attr].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    return {v for v in values if v}
+
+
+def _on_identifier_change(attr):
+    def listener(mapper, connection, target):
+        for value in _changed_values(target, attr):
+            identity_cache.pop(value)
+        # 邮箱/电话增删改都可能改变该用户的主邮箱/主电话
+        if target.user_id is not None:
+            invalidate_user(target.user_id)
+    return listener
+
+
+for _model, _attr in ((Email, 'email'), (Phone, 'phone')):
+    event.listen(_model, 'after_insert', _on_identifier_change(_attr))
+    event.listen(_model, 'after_update', _on_identifier_change(_attr))
+    event.listen(_model, 'after_delete', _on_identifier_change(_attr))
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _on_user_change(mapper, connection, target):
+    invalidate_user(target.id)
@@ -0,0 +1,216 @@
+import random
+import zlib
+
+from sqlalchemy import select, update, delete, insert, func, bindparam
+
+from app import db
+from app.models.user import User
+from app.models.bank import BankAccount, BankAccountShard, UserBankAccount
+from app.services.balance_summary import apply_account_delta
+from app.utils.cache import TTLCache, MISSING
+
+_accounts = BankAccount.__table__
+_shards = BankAccountShard.__table__
+
+# 账户id -> 子余额数量（0表示未分片）
+# 缓存过期前按旧值入账也是安全的：子余额行不存在时会退回主余额行
+shard_counts = TTLCache(maxsize=10000, ttl=60)
+
+
+def init_app(app):
+    shard_counts.configure(ttl=app.config.get('BALANCE_SHARD_CACHE_TTL', 60))
+
+
+class AmbiguousAccount(Exception):
+    """同一用户名下有多个相同账号，无法确定扣款账户"""
+
+
+def _linked_ids(user_id):
+    return select(UserBankAccount.bank_account_id).where(UserBankAccount.user_id == user_id)
+
+
+def owned_account_ids(user_id, account_number):
+    """用户名下指定账号的账户id子查询"""
+    return select(BankAccount.id).where(
+        BankAccount.account_number == account_number,
+        BankAccount.id.in_(_linked_ids(user_id))
+    )
+
+
+def _bump_owners(account_filter):
+    """核心UPDATE不会触发 after_flush，手动递增账户关联用户的变更序号"""
+    users = User.__table__
+    owners = select(UserBankAccount.user_id).where(account_filter)
+    db.session.execute(
+        update(users).where(users.c.id.in_(owners)).values(change_seq=users.c.change_seq + 1)
+    )
+
+
+def shard_count(bank_account_id):
+    count = shard_counts.get(bank_account_id)
+    if count is MISSING:
+        count = db.session.query(BankAccount.balance_shards)\
+            .filter(BankAccount.id == bank_account_id)\
+            .scalar() or 0
+        shard_counts.set(bank_account_id, count)
+    return count
+
+
+def _debit(user_id, account_number, amount):
+    # MySQL 不允许UPDATE的子查询引用被更新的表，所以这里只子查询关联表
+    result = db.session.execute(
+        update(_accounts)
+        .where(
+            _accounts.c.account_number == account_number,
+            _accounts.c.id.in_(_linked_ids(user_id)),
+            _accounts.c.balance >= amount
+        )
+        .values(balance=_accounts.c.balance - amount)
+    )
+    if result.rowcount > 1:
+        raise AmbiguousAccount(account_number)
+    return result.rowcount == 1
+
+
+def debit_owned_account(user_id, account_number, amount):
+    """原子扣款：balance = balance - amt WHERE ... AND balance >= amt
+
+    不预先读取余额；返回 False 表示账户不存在、不属于该用户或余额不足。
+    分片账户的入账停留在子余额上，主余额不足时先把子余额归并回来再试一次。
+    """
+    debited = _debit(user_id, account_number, amount)
+    if not debited:
+        sharded = db.session.query(BankAccount.id)\
+            .filter(BankAccount.id.in_(owned_account_ids(user_id, account_number)), BankAccount.balance_shards > 0)\
+            .all()
+        if not sharded:
+            return False
+        for (bank_account_id,) in sharded:
+            fold_shards(bank_account_id)
+        debited = _debit(user_id, account_number, amount)
+        if not debited:
+            return False
+    _bump_owners(UserBankAccount.bank_account_id.in_(owned_account_ids(user_id, account_number)))
+    return True
+
+
+def debit_account(bank_account_id, amount):
+    """按账户id原子扣款（余额不足时不更新），返回是否成功"""
+    def debit():
+        result = db.session.execute(
+            update(_accounts)
+            .where(_accounts.c.id == bank_account_id, _accounts.c.balance >= amount)
+            .values(balance=_accounts.c.balance - amount)
+        )
+        return result.rowcount == 1
+
+    debited = debit()
+    if not debited and shard_count(bank_account_id) and fold_shards(bank_account_id):
+        debited = debit()
+    if debited:
+        _bump_owners(UserBankAccount.bank_account_id == bank_account_id)
+    return debited
+
+
+def credit_account(bank_account_id, amount, shard_key=None):
+    """原子入账，返回是否命中账户；余额汇总和变更序号也在这里更新，调用方不用再调 apply_account_delta
+
+    分片账户随机（或按 shard_key 哈希）落到一个子余额行，并发入账不再争同一行锁。
+    子余额入账不更新汇总和用户的变更序号（否则热点账户的所有入账又会排队在这两行上），
+    由归并（fold_shards）统一补上，所以分片账户的汇总会滞后到下一次归并。
+    """
+    shards = shard_count(bank_account_id)
+    if shards:
+        if shard_key is None:
+            shard_no = random.randrange(shards)
+        else:
+            shard_no = zlib.crc32(str(shard_key).encode('utf-8')) % shards
+        result = db.session.execute(
+            update(_shards)
+            .where(_shards.c.bank_account_id == bank_account_id, _shards.c.shard_no == shard_no)
+            .values(balance=_shards.c.balance + amount)
+        )
+        if result.rowcount == 1:
+            return True
+    # 未分片，或子余额行已被删除（分片数调小/关闭）时入主余额
+    result = db.session.execute(
+        update(_accounts)
+        .where(_accounts.c.id == bank_account_id)
+        .values(balance=_accounts.c.balance + amount)
+    )
+    if result.rowcount != 1:
+        return False
+    _bump_owners(UserBankAccount.bank_account_id == bank_account_id)
+    apply_account_delta(bank_account_id, amount)
+    return True
+
+
+_unfold = update(_shards)\
+    .where(_shards.c.id == bindparam('shard_id'))\
+    .values(balance=_shards.c.balance - bindparam('folded'))
+
+
+def fold_shards(bank_account_id, lock_all=False):
+    """把子余额归并到主余额（调用方负责提交），返回归并的金额
+
+    锁住子余额行后按读到的值逐行扣回，而不是直接清零，不会吞掉并发入账。
+    子余额入账时没有更新的余额汇总和变更序号在这里一次补上。
+    lock_all 为真时连余额为0的子余额行也锁住（调整分片数之前用）。
+    加锁顺序固定为先主余额行、再子余额行，与扣款路径一致（调用方已锁主余额行时这里不会再等待）。
+    """
+    db.session.execute(
+        select(_accounts.c.id).where(_accounts.c.id == bank_account_id).with_for_update()
+    )
+    query = select(_shards.c.id, _shards.c.balance)\
+        .where(_shards.c.bank_account_id == bank_account_id)\
+        .order_by(_shards.c.shard_no)\
+        .with_for_update()
+    if not lock_all:
+        query = query.where(_shards.c.balance != 0)
+    rows = [row for row in db.session.execute(query).all() if row.balance != 0]
+    if not rows:
+        return 0
+    total = sum(row.balance for row in rows)
+    db.session.execute(
+        update(_accounts)
+        .where(_accounts.c.id == bank_account_id)
+        .values(balance=_accounts.c.balance + total)
+    )
+    db.session.execute(_unfold, [{'shard_id': row.id, 'folded': row.balance} for row in rows])
+    _bump_owners(UserBankAccount.bank_account_id == bank_account_id)
+    apply_account_delta(bank_account_id, total)
+    return total
+
+
+def set_shard_count(bank_account_id, shards):
+    """开启/调整/关闭（shards=0）账户的子余额分片（调用方负责提交）
+
+    先锁住该账户的全部子余额行再归并和删除：并发入账会等到提交后再执行，
+    届时被删除的子余额行匹配不到，入账退回主余额，不会随删除一起丢掉。
+    """
+    fold_shards(bank_account_id, lock_all=True)
+    db.session.execute(
+        delete(_shards).where(_shards.c.bank_account_id == bank_account_id, _shards.c.shard_no >= shards)
+    )
+    existing = {row[0] for row in db.session.execute(
+        select(_shards.c.shard_no).where(_shards.c.bank_account_id == bank_account_id)
+    )}
+    missing = [n for n in range(shards) if n not in existing]
+    if missing:
+        db.session.execute(insert(_shards), [
+            {'bank_account_id': bank_account_id, 'shard_no': n, 'balance': 0} for n in missing
+        ])
+    db.session.execute(
+        update(_accounts).where(_accounts.c.id == bank_account_id).values(balance_shards=shards)
+    )
+    shard_counts.pop(bank_account_id)
+
+
+def account_balance(bank_account_id):
+    """账户余额 = 主余额 + 子余额之和"""
+    shard_total = select(func.coalesce(func.sum(_shards.c.balance), 0))\
+        .where(_shards.c.bank_account_id == bank_account_id)\
+        .scalar_subquery()
+    return db.session.query(BankAccount.balance + shard_total)\
+        .filter(BankAccount.id == bank_account_id)\
+        .scalar()
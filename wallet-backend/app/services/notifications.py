@@ -0,0 +1,255 @@
+import os
+import random
+import threading
+import uuid
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, or_, bindparam
+
+from app import db
+from app.models.notification import MessageDelivery, DeliveryChannel, DeliveryStatus
+
+# 从投递记录领取的待发送消息；attempts 为此前已尝试次数
+Message = namedtuple('Message', 'delivery_id channel recipient code attempts')
+
+_deliveries = MessageDelivery.__table__
+
+VERIFICATION_SUBJECT = 'Your verification code'
+VERIFICATION_TEXT = 'Your verification code is {code}'
+
+
+class StubTransport:
+    """本地/测试用：不真正发送，只保留最近的若干条（没有配置凭据时的默认发送方式，不能无限增长）"""
+
+    def __init__(self, keep=100):
+        self.sent = deque(maxlen=keep)
+
+    def send_batch(self, messages):
+        self.sent.extend(messages)
+        return {m.delivery_id: None for m in messages}
+
+
+class SendGridTransport:
+    """一次API调用发送一批邮件（每个收件人一个personalization）"""
+
+    def __init__(self, api_key, sender):
+        from sendgrid import SendGridAPIClient
+        self.client = SendGridAPIClient(api_key)
+        self.sender = sender
+
+    def send_batch(self, messages):
+        from sendgrid.helpers.mail import Mail, Personalization, To, Substitution
+        mail = Mail(
+            from_email=self.sender,
+            subject=VERIFICATION_SUBJECT,
+            plain_text_content=VERIFICATION_TEXT.format(code='-code-')
+        )
+        for m in messages:
+            personalization = Personalization()
+            personalization.add_to(To(m.recipient))
+            personalization.add_substitution(Substitution('-code-', m.code))
+            mail.add_personalization(personalization)
+        try:
+            response = self.client.send(mail)
+            error = None if response.status_code < 300 else f"SendGrid status {response.status_code}"
+        except Exception as e:
+            error = str(e)
+        return {m.delivery_id: error for m in messages}
+
+
+class TwilioTransport:
+    """Twilio没有批量短信接口，一批内复用同一个客户端逐条发送"""
+
+    def __init__(self, account_sid, auth_token, from_number):
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+        self.from_number = from_number
+
+    def send_batch(self, messages):
+        results = {}
+        for m in messages:
+            try:
+                self.client.messages.create(
+                    to=m.recipient,
+                    from_=self.from_number,
+                    body=VERIFICATION_TEXT.format(code=m.code)
+                )
+                results[m.delivery_id] = None
+            except Exception as e:
+                results[m.delivery_id] = str(e)
+        return results
+
+
+class NotificationDispatcher:
+    """后台发送验证码：投递记录（含验证码）就是发送队列
+
+    每个进程的发送线程定期从数据库领取到期的 QUEUED 记录（带租约，多进程不会重复领取），
+    按渠道攒批发送，失败按指数退避推后下次发送时间；进程重启或崩溃后未发完的记录会被重新领取。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.transports = {}
+        self.batch_size = 100
+        self.flush_interval = 0.5
+        self.max_attempts = 5
+        self.backoff_base = 2
+        self.lease = 60
+        self.autostart = True
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('NOTIFY_BATCH_SIZE', 100)
+        self.flush_interval = app.config.get('NOTIFY_FLUSH_INTERVAL', 0.5)
+        self.max_attempts = app.config.get('NOTIFY_MAX_ATTEMPTS', 5)
+        self.backoff_base = app.config.get('NOTIFY_BACKOFF_BASE', 2)
+        self.lease = app.config.get('NOTIFY_LEASE', 60)
+        self.transports = self._build_transports(app.config)
+        self.autostart = app.config.get('NOTIFY_AUTOSTART', True)
+        if self.autostart:
+            # 每个worker进程收到第一个请求时启动发送线程，接着发送重启前没发完的记录
+            app.before_request(self._ensure_worker)
+
+    @staticmethod
+    def _build_transports(config):
+        # 配置了服务商凭据才使用真实通道，否则使用本地桩
+        email, sms = StubTransport(), StubTransport()
+        if config.get('NOTIFY_TRANSPORT', 'auto') != 'stub':
+            if config.get('SENDGRID_API_KEY'):
+                email = SendGridTransport(config['SENDGRID_API_KEY'], config.get('MAIL_DEFAULT_SENDER'))
+            if config.get('TWILIO_ACCOUNT_SID') and config.get('TWILIO_AUTH_TOKEN'):
+                sms = TwilioTransport(
+                    config['TWILIO_ACCOUNT_SID'],
+                    config['TWILIO_AUTH_TOKEN'],
+                    config.get('TWILIO_PHONE_NUMBER')
+                )
+        return {DeliveryChannel.EMAIL: email, DeliveryChannel.SMS: sms}
+
+    def create_delivery(self, channel, recipient, code):
+        """在调用方的事务中创建投递记录，验证码随记录一起保存（提交后再调用 enqueue）"""
+        delivery = MessageDelivery(
+            channel=channel,
+            recipient=recipient,
+            code=code,
+            status=DeliveryStatus.QUEUED,
+            next_attempt_at=datetime.utcnow()
+        )
+        db.session.add(delivery)
+        return delivery
+
+    def enqueue(self, delivery):
+        """提交后调用：唤醒发送线程立即领取（记录已在数据库里，不调用也会在下一轮发出）"""
+        if self.autostart:
+            self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker_pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+            return
+        # 预fork部署时每个worker进程各自启动发送线程
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while self.dispatch_due():
+                        pass
+            except Exception as e:
+                print("Notification dispatch error:", str(e))
+
+    def dispatch_due(self):
+        """领取一批到期的投递记录并发送；领满一批时返回True（调用方接着领下一批）"""
+        limit = self.batch_size * len(DeliveryChannel)
+        batch = self._claim(limit)
+        if batch:
+            self._dispatch(batch)
+        return len(batch) >= limit
+
+    def _claim(self, limit):
+        """给到期且未被领取（或租约已过期）的记录打上本次的领取标记"""
+        now = datetime.utcnow()
+        claimable = (
+            _deliveries.c.status == DeliveryStatus.QUEUED,
+            _deliveries.c.next_attempt_at <= now,
+            or_(_deliveries.c.claimed_until.is_(None), _deliveries.c.claimed_until < now)
+        )
+        ids = db.session.execute(
+            select(_deliveries.c.id).where(*claimable).order_by(_deliveries.c.next_attempt_at).limit(limit)
+        ).scalars().all()
+        if not ids:
+            db.session.rollback()
+            return []
+        token = uuid.uuid4().hex
+        # 条件UPDATE：同时领取同一批的其它进程只有一个能改到
+        db.session.execute(
+            update(_deliveries)
+            .where(_deliveries.c.id.in_(ids), *claimable)
+            .values(claim_token=token, claimed_until=now + timedelta(seconds=self.lease))
+        )
+        db.session.commit()
+        rows = db.session.execute(
+            select(_deliveries.c.id, _deliveries.c.channel, _deliveries.c.recipient,
+                   _deliveries.c.code, _deliveries.c.attempts)
+            .where(_deliveries.c.claim_token == token)
+        ).all()
+        db.session.rollback()
+        return [Message(*row) for row in rows]
+
+    def _dispatch(self, batch):
+        sent, retry, failed = [], {}, {}
+        for channel in DeliveryChannel:
+            messages = [m for m in batch if m.channel == channel]
+            for i in range(0, len(messages), self.batch_size):
+                chunk = messages[i:i + self.batch_size]
+                results = self.transports[channel].send_batch(chunk)
+                for m in chunk:
+                    error = results.get(m.delivery_id)
+                    if error is None:
+                        sent.append(m.delivery_id)
+                    elif m.attempts + 1 < self.max_attempts:
+                        delay = self.backoff_base ** (m.attempts + 1) * random.uniform(0.5, 1.5)
+                        retry[m.delivery_id] = (error, datetime.utcnow() + timedelta(seconds=delay))
+                    else:
+                        failed[m.delivery_id] = error
+        self._record(sent, retry, failed)
+
+    def _record(self, sent, retry, failed):
+        # 每种结果一条语句记录投递状态，同时释放租约；结束的记录清掉验证码
+        now = datetime.utcnow()
+        released = {'claim_token': None, 'claimed_until': None, 'attempts': _deliveries.c.attempts + 1, 'updated_at': now}
+        if sent:
+            db.session.execute(
+                update(_deliveries)
+                .where(_deliveries.c.id.in_(sent))
+                .values(status=DeliveryStatus.SENT, code=None, **released)
+            )
+        if retry:
+            db.session.execute(
+                update(_deliveries)
+                .where(_deliveries.c.id == bindparam('delivery_id'))
+                .values(last_error=bindparam('error'), next_attempt_at=bindparam('not_before'), **released),
+                [{'delivery_id': delivery_id, 'error': error[:255], 'not_before': not_before}
+                 for delivery_id, (error, not_before) in retry.items()]
+            )
+        for delivery_id, error in failed.items():
+            db.session.execute(
+                update(_deliveries)
+                .where(_deliveries.c.id == delivery_id)
+                .values(status=DeliveryStatus.FAILED, code=None, last_error=error[:255], **released)
+            )
+        db.session.commit()
+
+
+notifier = NotificationDispatcher()
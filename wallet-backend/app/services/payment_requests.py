@@ -0,0 +1,201 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_FLOOR
+
+from sqlalchemy import insert, select, update, union_all, or_, and_
+
+from app import db
+from app.models.transaction import Transaction, TransactionType, TransactionStatus, PaymentRequest
+from app.models.user import User, Email, Phone
+from app.services.accounts import InvalidQuery, encode_cursor, decode_cursor
+from app.services.change_seq import bump_change_seq
+
+CENT = Decimal('0.01')
+SPLIT_MODES = ('exact', 'even', 'weighted')
+
+_payment_requests = PaymentRequest.__table__
+
+
+class InvalidSplit(ValueError):
+    """付款人列表或分摊方式不合法（调用方返回400）"""
+
+
+def _decimal(value, field):
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise InvalidSplit(f'{field} must be a number')
+    if not number.is_finite() or number <= 0:
+        raise InvalidSplit(f'{field} must be positive')
+    return number
+
+
+def split_amounts(total, weights):
+    """按权重把 total 分成若干份，精确到分且合计等于 total
+
+    先按比例向下取整到分，剩下的几分钱给小数部分最大的几份（同样大时给靠前的）。
+    """
+    cents = int(total / CENT)
+    weight_total = sum(weights)
+    shares = []
+    remainders = []
+    for index, weight in enumerate(weights):
+        exact = Decimal(cents) * weight / weight_total
+        share = int(exact.to_integral_value(rounding=ROUND_FLOOR))
+        shares.append(share)
+        remainders.append((exact - share, -index))
+    leftover = cents - sum(shares)
+    for _, negative_index in sorted(remainders, reverse=True)[:leftover]:
+        shares[-negative_index] += 1
+    return [Decimal(share) * CENT for share in shares]
+
+
+def build_shares(total_amount, payers, split=None, max_payers=1000):
+    """校验请求并计算每个付款人的金额，返回 (总金额, [(标识, 金额)])
+
+    split: exact（每个付款人自带 amount，合计须等于总金额）、even（平均分）、
+    weighted（按每个付款人的 weight 分）；不传时付款人都带 amount 则为 exact，否则为 even。
+    """
+    total = _decimal(total_amount, 'total_amount')
+    if total != total.quantize(CENT):
+        raise InvalidSplit('total_amount must have at most two decimal places')
+    if not isinstance(payers, list) or not payers:
+        raise InvalidSplit('payers must be a non-empty list')
+    if len(payers) > max_payers:
+        raise InvalidSplit(f'At most {max_payers} payers per request')
+    if not all(isinstance(payer, dict) and payer.get('identifier') for payer in payers):
+        raise InvalidSplit('Each payer must have an identifier')
+
+    identifiers = [str(payer['identifier']).strip() for payer in payers]
+    if len(set(identifiers)) != len(identifiers):
+        raise InvalidSplit('Duplicate payer identifier')
+
+    if split is None:
+        split = 'exact' if all('amount' in payer for payer in payers) else 'even'
+    if split not in SPLIT_MODES:
+        raise InvalidSplit(f"split must be one of: {', '.join(SPLIT_MODES)}")
+
+    if split == 'exact':
+        amounts = [_decimal(payer.get('amount'), 'amount') for payer in payers]
+        if any(amount != amount.quantize(CENT) for amount in amounts):
+            raise InvalidSplit('amount must have at most two decimal places')
+        amounts = [amount.quantize(CENT) for amount in amounts]
+        if sum(amounts) != total:
+            raise InvalidSplit('Payer amounts must add up to total_amount')
+    else:
+        if split == 'even':
+            weights = [Decimal(1)] * len(payers)
+        else:
+            weights = [_decimal(payer.get('weight'), 'weight') for payer in payers]
+        amounts = split_amounts(total, weights)
+        if any(amount <= 0 for amount in amounts):
+            raise InvalidSplit('total_amount is too small to split between these payers')
+
+    return total, list(zip(identifiers, amounts))
+
+
+def resolve_payers(identifiers):
+    """一次查询把已验证的邮箱/电话解析为用户id，返回 {标识: user_id}；查不到的不在结果里"""
+    emails = [identifier for identifier in identifiers if '@' in identifier]
+    phones = [identifier for identifier in identifiers if '@' not in identifier]
+    selects = []
+    if emails:
+        selects.append(select(Email.email.label('identifier'), Email.user_id)
+                       .where(Email.email.in_(emails), Email.is_verified == True))
+    if phones:
+        selects.append(select(Phone.phone.label('identifier'), Phone.user_id)
+                       .where(Phone.phone.in_(phones), Phone.is_verified == True))
+    if not selects:
+        return {}
+    query = selects[0] if len(selects) == 1 else union_all(*selects)
+    return {row.identifier: row.user_id for row in db.session.execute(query)}
+
+
+def create_payment_request(requester_id, total, shares, note=None):
+    """创建一笔收款交易并批量写入每个付款人的付款请求（调用方负责提交）
+
+    父交易只 flush 一次拿到id；付款人标识一次IN查询解析；付款请求用一条 executemany 插入。
+    返回 (交易, [付款请求字典])。
+    """
+    transaction = Transaction(
+        user_id=requester_id,
+        type=TransactionType.REQUEST,
+        amount=total,
+        description=note,
+        status=TransactionStatus.PENDING,
+        created_at=datetime.utcnow()
+    )
+    db.session.add(transaction)
+    db.session.flush()
+
+    payer_ids = resolve_payers([identifier for identifier, _ in shares])
+    rows = [{
+        'transaction_id': transaction.id,
+        'requester_id': requester_id,
+        'payer_identifier': identifier,
+        'payer_id': payer_ids.get(identifier),
+        'amount': amount,
+        'status': TransactionStatus.PENDING,
+        'created_at': transaction.created_at
+    } for identifier, amount in shares]
+    db.session.execute(insert(_payment_requests), rows)
+    # 核心INSERT不经过 after_flush，手动让付款人的缓存失效
+    bump_change_seq(payer_ids.values())
+    return transaction, rows
+
+
+def attach_payment_requests(user_id, identifier):
+    """把只记了标识的付款请求挂到刚验证该标识的用户名下（调用方负责提交），返回条数"""
+    result = db.session.execute(
+        update(_payment_requests)
+        .where(_payment_requests.c.payer_identifier == identifier, _payment_requests.c.payer_id.is_(None))
+        .values(payer_id=user_id)
+    )
+    if result.rowcount:
+        bump_change_seq([user_id])
+    return result.rowcount
+
+
+def list_inbox(payer_id, status=TransactionStatus.PENDING, cursor=None, limit=50):
+    """付款人收件箱：键集分页，按 (created_at, id) 倒序，请求人姓名在同一条查询里联表取出"""
+    query = select(
+        _payment_requests.c.id,
+        _payment_requests.c.transaction_id,
+        _payment_requests.c.requester_id,
+        User.name.label('requester_name'),
+        _payment_requests.c.amount,
+        _payment_requests.c.status,
+        _payment_requests.c.created_at,
+        _payment_requests.c.completed_at
+    ).join(User, User.id == _payment_requests.c.requester_id)\
+        .where(_payment_requests.c.payer_id == payer_id, _payment_requests.c.status == status)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor, 'created_at')
+        query = query.where(or_(
+            _payment_requests.c.created_at < created_at,
+            and_(_payment_requests.c.created_at == created_at, _payment_requests.c.id < row_id)
+        ))
+    # 多取一行用来判断是否还有下一页
+    rows = db.session.execute(
+        query.order_by(_payment_requests.c.created_at.desc(), _payment_requests.c.id.desc()).limit(limit + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [{
+        'id': row.id,
+        'transaction_id': row.transaction_id,
+        'requester_id': row.requester_id,
+        'requester_name': row.requester_name,
+        'amount': str(row.amount),
+        'status': row.status.value,
+        'created_at': row.created_at.isoformat(),
+        'completed_at': row.completed_at.isoformat() if row.completed_at else None
+    } for row in rows], next_cursor
+
+
+def parse_status(value):
+    try:
+        return TransactionStatus(value.lower())
+    except ValueError:
+        raise InvalidQuery(f'Unsupported status: {value}')
@@ -0,0 +1,167 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有fcntl，只能保证单进程内的互斥
+    fcntl = None
+
+# 每个槽位：键(64字节) 窗口起点 窗口长度 本窗口计数 上一窗口计数
+_SLOT = struct.Struct('<64sqIII')
+_SLOT_KEY_SIZE = 64
+_PROBES = 8
+
+
+def _slot_key(key):
+    """槽位里存的键：不超过64字节时原样保存；更长的键保留可读前缀并拼上整个键的哈希
+
+    直接截断会让前64字节相同的长键共用一个计数。
+    """
+    key_bytes = key.encode('utf-8')
+    if len(key_bytes) <= _SLOT_KEY_SIZE:
+        return key_bytes
+    digest = hashlib.blake2b(key_bytes, digest_size=16).hexdigest().encode('ascii')
+    return key_bytes[:_SLOT_KEY_SIZE - len(digest) - 1] + b'#' + digest
+
+
+class SlidingWindowLimiter:
+    """滑动窗口限流器
+
+    计数保存在文件映射的共享内存中，所有预fork的worker进程共用同一份计数；
+    采用"上一窗口按剩余比例加权 + 本窗口计数"的近似滑动窗口算法。
+    """
+
+    def __init__(self, slots=16384):
+        self.slots = slots
+        self.path = None
+        self._fd = None
+        self._mm = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.slots = app.config.get('RATE_LIMIT_SLOTS', 16384)
+        self.path = app.config.get('RATE_LIMIT_FILE') or \
+            os.path.join(app.instance_path, 'ratelimit.bin')
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        size = self.slots * _SLOT.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+
+    def hit(self, key, limit, window):
+        """记录一次请求；返回 (是否放行, 当前估计次数, 建议重试秒数)"""
+        now = time.time()
+        start = int(now // window) * window
+        key_bytes = _slot_key(key)
+        with self._locked():
+            index, free_at = self._find(key_bytes, now)
+            if index is None:
+                # 探测范围内全是活跃的其它键：新键直接拒绝，不挤掉别人的计数
+                # （否则刷大量键就能把受害者的计数清零）
+                return False, limit, max(1, int(free_at - now))
+            slot_key, ws, win, curr, prev = self._read(index)
+            if slot_key != key_bytes:
+                ws, curr, prev = start, 0, 0
+            if ws != start:
+                # 进入新窗口：相邻窗口的计数滚动为上一窗口，否则清零
+                prev = curr if ws == start - window else 0
+                curr, ws = 0, start
+            estimate = prev * (1 - (now - start) / window) + curr
+            allowed = estimate < limit
+            if allowed:
+                curr += 1
+                estimate += 1
+            self._write(index, key_bytes, ws, window, curr, prev)
+        retry_after = 0 if allowed else max(1, int(start + window - now))
+        return allowed, estimate, retry_after
+
+    def snapshot(self, prefix=None, limit=100):
+        """当前各键的计数（供监控使用），按估计次数降序"""
+        now = time.time()
+        entries = []
+        with self._locked():
+            for index in range(self.slots):
+                slot_key, ws, win, curr, prev = self._read(index)
+                if not slot_key or self._is_stale(ws, win, now):
+                    continue
+                key = slot_key.decode('utf-8', 'ignore')
+                if prefix and not key.startswith(prefix):
+                    continue
+                start = int(now // win) * win
+                if ws == start:
+                    current, previous = curr, prev
+                elif ws == start - win:
+                    current, previous = 0, curr
+                else:
+                    continue
+                entries.append({
+                    'key': key,
+                    'window': win,
+                    'current': current,
+                    'previous': previous,
+                    'estimate': round(previous * (1 - (now - start) / win) + current, 2)
+                })
+        entries.sort(key=lambda e: e['estimate'], reverse=True)
+        return entries[:limit]
+
+    def _find(self, key_bytes, now):
+        """开放寻址：返回 (槽位, None)，优先同键、其次空/过期槽位
+
+        探测范围内没有可用槽位时返回 (None, 最早有槽位过期的时间)，不淘汰仍在计数的槽位。
+        """
+        base = int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+        free = None
+        free_at = None
+        for i in range(_PROBES):
+            index = (base + i) % self.slots
+            slot_key, ws, win, curr, prev = self._read(index)
+            if slot_key == key_bytes:
+                return index, None
+            if free is None and (not slot_key or self._is_stale(ws, win, now)):
+                free = index
+            if free_at is None or ws + 2 * win < free_at:
+                free_at = ws + 2 * win
+        return free, free_at
+
+    @staticmethod
+    def _is_stale(ws, win, now):
+        return not win or ws + 2 * win <= now
+
+    def _read(self, index):
+        slot_key, ws, win, curr, prev = _SLOT.unpack_from(self._mm, index * _SLOT.size)
+        return slot_key.rstrip(b'\0'), ws, win, curr, prev
+
+    def _write(self, index, key_bytes, ws, win, curr, prev):
+        _SLOT.pack_into(self._mm, index * _SLOT.size, key_bytes, ws, win, curr, prev)
+
+    def _locked(self):
+        return _SharedLock(self._lock, self._fd)
+
+
+class _SharedLock:
+    """线程锁 + 文件锁，保证进程内外的互斥"""
+
+    def __init__(self, lock, fd):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+limiter = SlidingWindowLimiter()
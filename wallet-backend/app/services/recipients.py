@@ -0,0 +1,117 @@
+from sqlalchemy import event, inspect, select
+
+from app import db
+from app.models.user import User, Email, Phone
+from app.models.bank import BankAccount, UserBankAccount
+from app.utils.cache import TTLCache, MISSING
+
+# 收款标识(已验证的邮箱/电话) -> (user_id, 主账户id) 的进程内缓存
+# 查不到的标识也缓存为 None（负缓存），过期时间更短
+recipient_cache = TTLCache()
+_negative_ttl = 30
+
+
+def init_app(app):
+    global _negative_ttl
+    recipient_cache.configure(
+        maxsize=app.config.get('RECIPIENT_CACHE_SIZE', 10000),
+        ttl=app.config.get('RECIPIENT_CACHE_TTL', 300)
+    )
+    _negative_ttl = app.config.get('RECIPIENT_CACHE_NEGATIVE_TTL', 30)
+
+
+# 主账户的选取规则：优先 is_primary，否则取最早关联的账户（转账、管理员打款、批量打款共用）
+PRIMARY_ACCOUNT_ORDER = (BankAccount.is_primary.desc(), UserBankAccount.id)
+
+
+def primary_account_ids(user_ids):
+    """一次IN查询取每个用户的主账户，返回 {user_id: 账户id}；没有账户的用户不在结果里"""
+    rows = db.session.query(UserBankAccount.user_id, UserBankAccount.bank_account_id)\
+        .join(BankAccount, BankAccount.id == UserBankAccount.bank_account_id)\
+        .filter(UserBankAccount.user_id.in_(list(user_ids)))\
+        .order_by(UserBankAccount.user_id, *PRIMARY_ACCOUNT_ORDER)\
+        .all()
+    primary = {}
+    for user_id, account_id in rows:
+        primary.setdefault(user_id, account_id)
+    return primary
+
+
+def _load_recipient(identifier):
+    """一次查询：标识 -> (user_id, 主账户id)"""
+    model, column = (Email, Email.email) if '@' in identifier else (Phone, Phone.phone)
+    account = select(UserBankAccount.bank_account_id)\
+        .join(BankAccount, BankAccount.id == UserBankAccount.bank_account_id)\
+        .where(UserBankAccount.user_id == model.user_id)\
+        .order_by(*PRIMARY_ACCOUNT_ORDER)\
+        .limit(1)\
+        .scalar_subquery()
+    row = db.session.query(model.user_id, account)\
+        .filter(column == identifier, model.is_verified == True)\
+        .first()
+    return (row[0], row[1]) if row else None
+
+
+def resolve_recipient(identifier, use_cache=True):
+    """返回 (user_id, bank_account_id)；标识不存在或未验证时返回 None，用户没有账户时账户id为 None"""
+    if use_cache:
+        recipient = recipient_cache.get(identifier)
+        if recipient is not MISSING:
+            return recipient
+    recipient = _load_recipient(identifier)
+    recipient_cache.set(identifier, recipient, ttl=None if recipient else _negative_ttl)
+    return recipient
+
+
+def invalidate_users(user_ids):
+    user_ids = set(user_ids)
+    recipient_cache.pop_where(lambda key, value: value is not None and value[0] in user_ids)
+
+
+# 验证状态、账户关联、主账户变化时让缓存失效
+def _on_identifier_change(attr):
+    def listener(mapper, connection, target):
+        history = inspect(target).attrs[attr].history
+        for value in set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ()):
+            if value:
+                recipient_cache.pop(value)
+    return listener
+
+
+for _model, _attr in ((Email, 'email'), (Phone, 'phone')):
+    event.listen(_model, 'after_insert', _on_identifier_change(_attr))
+    event.listen(_model, 'after_update', _on_identifier_change(_attr))
+    event.listen(_model, 'after_delete', _on_identifier_change(_attr))
+
+
+@event.listens_for(UserBankAccount, 'after_insert')
+@event.listens_for(UserBankAccount, 'after_delete')
+def _on_link_change(mapper, connection, target):
+    invalidate_users([target.user_id])
+
+
+# 通过 user.bank_accounts 关联时只写 secondary 表，不会触发 UserBankAccount 的事件
+@event.listens_for(User.bank_accounts, 'append')
+@event.listens_for(User.bank_accounts, 'remove')
+def _on_user_accounts_change(target, value, initiator):
+    invalidate_users([target.id])
+
+
+@event.listens_for(BankAccount, 'after_update')
+def _on_account_update(mapper, connection, target):
+    if inspect(target).attrs.is_primary.history.has_changes():
+        _invalidate_account(connection, target.id)
+
+
+@event.listens_for(BankAccount, 'after_delete')
+def _on_account_delete(mapper, connection, target):
+    _invalidate_account(connection, target.id)
+
+
+def _invalidate_account(connection, bank_account_id):
+    links = UserBankAccount.__table__
+    owners = connection.execute(
+        select(links.c.user_id).where(links.c.bank_account_id == bank_account_id)
+    ).scalars().all()
+    invalidate_users(owners)
+    recipient_cache.pop_where(lambda key, value: value is not None and value[1] == bank_account_id)
@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from flask import current_app
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+
+# MySQL 错误码：1213 死锁被选为牺牲者，1205 锁等待超时
+DEADLOCK = 1213
+LOCK_WAIT_TIMEOUT = 1205
+
+_lock = threading.Lock()
+_counters = defaultdict(lambda: {'calls': 0, 'retries': 0, 'deadlocks': 0, 'lock_timeouts': 0, 'exhausted': 0})
+
+
+def _error_code(error):
+    orig = getattr(error, 'orig', None)
+    args = getattr(orig, 'args', None)
+    if args and isinstance(args[0], int):
+        return args[0]
+    return None
+
+
+def is_retryable(error):
+    """死锁或锁等待超时：整个事务已经（或应当）回滚，只能从头重跑"""
+    return _error_code(error) in (DEADLOCK, LOCK_WAIT_TIMEOUT)
+
+
+def _count(name, **deltas):
+    with _lock:
+        counters = _counters[name]
+        for key, delta in deltas.items():
+            counters[key] += delta
+
+
+def retry_on_deadlock(fn):
+    """死锁或锁等待超时时回滚并重跑整个工作单元（带抖动的指数退避）
+
+    被装饰的函数必须是完整的事务：自己加锁、自己提交，重跑时从头开始。
+    """
+    name = fn.__qualname__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        attempts = current_app.config.get('DB_RETRY_ATTEMPTS', 3)
+        base_delay = current_app.config.get('DB_RETRY_BASE_DELAY', 0.05)
+        max_delay = current_app.config.get('DB_RETRY_MAX_DELAY', 1.0)
+        _count(name, calls=1)
+
+        attempt = 1
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except DBAPIError as e:
+                code = _error_code(e)
+                if code not in (DEADLOCK, LOCK_WAIT_TIMEOUT):
+                    raise
+                db.session.rollback()
+                _count(name, **{'deadlocks' if code == DEADLOCK else 'lock_timeouts': 1})
+                if attempt >= attempts:
+                    _count(name, exhausted=1)
+                    raise
+                _count(name, retries=1)
+                # full jitter：在 [0, base*2^n] 内随机等待，避免冲突双方同时重试
+                time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+                attempt += 1
+
+    return wrapper
+
+
+def retry_counters():
+    """各工作单元的调用、重试次数快照（供监控接口使用，进程内计数）"""
+    with _lock:
+        return {name: dict(counters) for name, counters in _counters.items()}
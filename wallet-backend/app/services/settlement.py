@@ -0,0 +1,118 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import select, update, or_
+
+from app import db
+from app.models.user import Email, Phone
+from app.models.transaction import Transaction, TransactionType, TransactionStatus
+from app.services.balance_summary import apply_deltas, apply_account_delta
+from app.services.change_seq import bump_change_seq
+from app.services.ledger import AmbiguousAccount, debit_owned_account, credit_account, owned_account_ids
+from app.services.recipients import resolve_recipient, recipient_cache
+from app.services.retry import retry_on_deadlock
+
+_transactions = Transaction.__table__
+
+
+@retry_on_deadlock
+def settle_pending(identifier):
+    """接收方验证邮箱/电话后，一次结算所有转给该标识的待处理转账，返回结算条数
+
+    走 (recipient_identifier, status) 索引锁住这些转账；按发送方账户合并扣款，
+    余额不足的那一组留在待处理状态（之后仍可取消或过期）。
+    接收方主账户只做一次合计入账，状态用一条UPDATE改为 COMPLETED。
+    """
+    rows = db.session.execute(
+        select(_transactions.c.id, _transactions.c.user_id, _transactions.c.sender_account, _transactions.c.amount)
+        .where(
+            _transactions.c.recipient_identifier == identifier,
+            _transactions.c.status == TransactionStatus.PENDING,
+            _transactions.c.type == TransactionType.TRANSFER
+        )
+        .order_by(_transactions.c.id)
+        .with_for_update()
+    ).all()
+    # 验证之前留下的负缓存会让之后的转账继续变成待处理，这里先清掉（其它进程的由定时任务兜底）
+    recipient_cache.pop(identifier)
+    recipient = resolve_recipient(identifier, use_cache=False) if rows else None
+    if not recipient or not recipient[1]:
+        # 没有待结算的转账，或接收方还没有主账户
+        db.session.commit()
+        return 0
+    recipient_account_id = recipient[1]
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row.user_id, row.sender_account)].append(row)
+
+    settled_ids = []
+    released = defaultdict(Decimal)
+    for (user_id, sender_account), group in groups.items():
+        amount = sum(row.amount for row in group)
+        savepoint = db.session.begin_nested()
+        try:
+            debited = debit_owned_account(user_id, sender_account, amount)
+        except AmbiguousAccount:
+            debited = False
+        if not debited:
+            savepoint.rollback()
+            continue
+        savepoint.commit()
+        apply_account_delta(owned_account_ids(user_id, sender_account), -amount)
+        settled_ids.extend(row.id for row in group)
+        released[user_id] += amount
+
+    if not settled_ids:
+        db.session.commit()
+        return 0
+
+    total = sum(released.values())
+    if not credit_account(recipient_account_id, total):
+        # 主账户在解析之后被删除，整批放弃，保持待处理
+        db.session.rollback()
+        return 0
+
+    db.session.execute(
+        update(_transactions)
+        .where(_transactions.c.id.in_(settled_ids))
+        .values(status=TransactionStatus.COMPLETED, recipient_account_id=recipient_account_id, updated_at=datetime.utcnow())
+    )
+    # 释放发送方占用的待处理金额（余额已由 apply_account_delta 更新）
+    apply_deltas({user_id: (0, -amount) for user_id, amount in released.items()})
+    bump_change_seq(released)
+    db.session.commit()
+    return len(settled_ids)
+
+
+def settle_verified():
+    """结算接收方已验证但仍处于待处理的转账，返回结算条数（由 expire_pending_transfers.py 定时调用）
+
+    兜住验证时没结算到的情况：其它进程里的负缓存尚未过期时发出的转账、
+    验证时还没有银行账户、或者验证时结算失败。
+    """
+    verified = or_(
+        _transactions.c.recipient_identifier.in_(select(Email.email).where(Email.is_verified == True)),
+        _transactions.c.recipient_identifier.in_(select(Phone.phone).where(Phone.is_verified == True))
+    )
+    identifiers = db.session.execute(
+        select(_transactions.c.recipient_identifier)
+        .where(
+            _transactions.c.status == TransactionStatus.PENDING,
+            _transactions.c.type == TransactionType.TRANSFER,
+            verified
+        )
+        .distinct()
+    ).scalars().all()
+    db.session.commit()
+    settled = 0
+    for identifier in identifiers:
+        try:
+            settled += settle_pending(identifier)
+        except Exception as e:
+            # 单个标识失败不影响其它标识，下一轮再试
+            db.session.rollback()
+            current_app.logger.exception("Settle pending transfers error for %s: %s", identifier, e)
+    return settled
@@ -0,0 +1,50 @@
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models.user import User
+from app.services.blocklist import TokenBlocklist
+
+# 管理员权限变更记录：user_id -> 变更时间 + 令牌有效期
+# 变更之前签发的令牌里的 is_admin 声明不再可信，需要回查数据库；令牌过期后记录随之失效。
+# 与已注销令牌一样追加写入日志文件，所有worker进程共享
+admin_revocations = TokenBlocklist('JWT_ADMIN_REVOCATION', 'admin_revocations.log')
+_token_lifetime = 7 * 86400
+
+
+def init_app(app):
+    global _token_lifetime
+    _token_lifetime = app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+    admin_revocations.init_app(app)
+
+
+def create_user_token(user_id, is_admin):
+    """签发访问令牌，并把管理员标记写入声明"""
+    return create_access_token(
+        identity=str(user_id),
+        additional_claims={'is_admin': bool(is_admin)}
+    )
+
+
+def revoke_admin_claim(user_id):
+    """记录一次管理员权限变更；直接改库时由 revoke_admin.py 调用"""
+    admin_revocations.revoke(str(int(user_id)), time.time() + _token_lifetime)
+
+
+def admin_claim_is_stale(user_id, issued_at):
+    """令牌签发于最近一次权限变更之前时返回True（只查内存）"""
+    revoked_until = admin_revocations.revoked_until(str(int(user_id)))
+    return revoked_until is not None and issued_at <= revoked_until - _token_lifetime
+
+
+def user_is_admin(user_id):
+    """管理员权限以数据库为准，只读一列"""
+    return bool(db.session.query(User.is_admin).filter(User.id == user_id).scalar())
+
+
+@event.listens_for(User, 'after_update')
+def _on_admin_change(mapper, connection, target):
+    if inspect(target).attrs.is_admin.history.has_changes():
+        revoke_admin_claim(target.id)
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# 异步转账的本地持久化队列（SQLite，WAL模式，多进程共享同一个文件）
+# 状态：queued -> processing -> completed / failed
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queued_transfers (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    http_status INTEGER,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_queued_transfers_status ON queued_transfers (status, created_at);
+"""
+
+TERMINAL = ('completed', 'failed')
+
+
+class TransferQueue:
+    def __init__(self):
+        self.path = None
+        self.lease = 60
+        self.retention = 7 * 86400
+        self.poll_interval = 0.1
+        self._local = threading.local()
+
+    def init_app(self, app):
+        self.path = app.config.get('TRANSFER_QUEUE_PATH') or \
+            os.path.join(app.instance_path, 'transfer_queue.db')
+        self.lease = app.config.get('TRANSFER_QUEUE_LEASE', 60)
+        self.retention = app.config.get('TRANSFER_QUEUE_RETENTION', 7 * 86400)
+        self.poll_interval = app.config.get('TRANSFER_STATUS_POLL_INTERVAL', 0.1)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        # 每个线程一个连接；isolation_level=None 时由我们自己控制事务
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')  # 返回202之前必须落盘
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, user_id, payload, transfer_id=None, reuse_after=None):
+        """写入一笔转账，返回队列项id
+
+        transfer_id 由调用方指定（由 Idempotency-Key 导出）时，同一个id重复入队会被忽略；
+        只有已经结束且早于 reuse_after 秒的旧项（key 过期后被再次使用）才会被新请求覆盖。
+        """
+        transfer_id = transfer_id or uuid.uuid4().hex
+        now = time.time()
+        reuse_before = now - reuse_after if reuse_after is not None else 0
+        self._connect().execute(
+            'INSERT INTO queued_transfers (id, user_id, payload, status, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET payload = excluded.payload, status = excluded.status, '
+            'http_status = NULL, result = NULL, attempts = 0, claimed_at = NULL, '
+            'created_at = excluded.created_at, updated_at = excluded.updated_at '
+            'WHERE queued_transfers.status IN (?, ?) AND queued_transfers.created_at < ?',
+            (transfer_id, user_id, json.dumps(payload), 'queued', now, now) + TERMINAL + (reuse_before,)
+        )
+        return transfer_id
+
+    def claim(self, batch_size):
+        """领取一批待处理项；租约过期仍未完成的项（worker崩溃）会被重新领取"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                "SELECT id, user_id, payload, attempts FROM queued_transfers "
+                "WHERE status = 'queued' OR (status = 'processing' AND claimed_at < ?) "
+                "ORDER BY created_at LIMIT ?",
+                (now - self.lease, batch_size)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE queued_transfers SET status = 'processing', claimed_at = ?, updated_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [(now, now, row['id']) for row in rows]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        # attempts 含本次领取；超过上限的由 apply_batch 直接记为失败，坏数据不会一直卡住队列头
+        return [{'id': row['id'], 'user_id': row['user_id'], 'payload': json.loads(row['payload']),
+                 'attempts': row['attempts'] + 1} for row in rows]
+
+    def complete(self, results):
+        """回写一批结果：{id: (响应体, HTTP状态码)}"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'UPDATE queued_transfers SET status = ?, http_status = ?, result = ?, updated_at = ? WHERE id = ?',
+                [('completed' if status < 400 else 'failed', status, json.dumps(body), now, transfer_id)
+                 for transfer_id, (body, status) in results.items()]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release(self, transfer_ids):
+        """处理失败（如数据库不可用）时放回队列"""
+        now = time.time()
+        self._connect().executemany(
+            "UPDATE queued_transfers SET status = 'queued', claimed_at = NULL, updated_at = ? WHERE id = ?",
+            [(now, transfer_id) for transfer_id in transfer_ids]
+        )
+
+    def get(self, transfer_id, user_id):
+        row = self._connect().execute(
+            'SELECT id, status, http_status, result, created_at, updated_at FROM queued_transfers '
+            'WHERE id = ? AND user_id = ?',
+            (transfer_id, user_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'transfer_id': row['id'],
+            'status': row['status'],
+            'http_status': row['http_status'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    def wait(self, transfer_id, user_id, timeout):
+        """长轮询：等到进入终态或超时，返回最新状态"""
+        deadline = time.monotonic() + timeout
+        while True:
+            item = self.get(transfer_id, user_id)
+            if item is None or item['status'] in TERMINAL or time.monotonic() >= deadline:
+                return item
+            time.sleep(self.poll_interval)
+
+    def purge(self):
+        """删除保留期之前已结束的项"""
+        cursor = self._connect().execute(
+            'DELETE FROM queued_transfers WHERE status IN (?, ?) AND updated_at < ?',
+            TERMINAL + (time.time() - self.retention,)
+        )
+        return cursor.rowcount
+
+
+transfer_queue = TransferQueue()
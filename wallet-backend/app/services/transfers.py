@@ -0,0 +1,184 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+from app.models.idempotency import IdempotencyKey
+from app.models.transaction import Transaction, TransactionType, TransactionStatus
+from app.services.balance_summary import apply_delta, apply_account_delta
+from app.services.idempotency import stage_response
+from app.services.ledger import debit_owned_account, credit_account, owned_account_ids
+from app.services.recipients import resolve_recipient
+from app.services.retry import retry_on_deadlock, is_retryable
+
+# 队列中的转账用幂等记录表保证只入账一次（与转账写在同一个事务里）
+QUEUE_ENDPOINT = 'transfer_queue'
+
+CENT = Decimal('0.01')
+MAX_AMOUNT = Decimal('99999999.99')  # transactions.amount 是 Numeric(10, 2)
+
+
+def invalid_transfer(data, amount):
+    """写库之前就能发现的参数问题，返回错误信息，没有问题时返回 None
+
+    超出列宽的值在 MySQL 严格模式下会在写入时报 DataError，异步转账要在入队前拒绝。
+    """
+    if not amount.is_finite() or amount <= 0:
+        return 'Amount must be positive'
+    if amount > MAX_AMOUNT:
+        return 'Amount is too large'
+    if amount != amount.quantize(CENT):
+        return 'Amount must have at most 2 decimal places'
+    for field, column in (('recipient_identifier', Transaction.recipient_identifier),
+                          ('source_account', Transaction.sender_account)):
+        value = data.get(field)
+        if not isinstance(value, str) or not value or len(value) > column.type.length:
+            return f'{field} must be a string of at most {column.type.length} characters'
+    note = data.get('note')
+    if note is not None and (not isinstance(note, str) or len(note) > Transaction.description.type.length):
+        return f'note must be a string of at most {Transaction.description.type.length} characters'
+    return None
+
+
+def execute_transfer(user_id, data, amount):
+    """在当前事务中执行一笔转账，返回 (响应体, HTTP状态码)；不提交也不回滚
+
+    失败时调用方负责回滚（整个事务或所在的保存点）。
+    """
+    # 创建交易
+    transaction = Transaction(
+        user_id=user_id,
+        type=TransactionType.TRANSFER,
+        amount=amount,
+        description=data.get('note'),
+        recipient_identifier=data['recipient_identifier'],
+        sender_account=data['source_account'],
+        created_at = datetime.utcnow()
+    )
+
+    # 查找接收者（已验证的标识及其主账户，一次查询且有缓存）
+    recipient = resolve_recipient(data['recipient_identifier'])
+
+    if recipient and recipient[1]:
+        recipient_account_id = recipient[1]
+        # 扣款和余额检查在同一条UPDATE中完成，并发下也不会透支
+        if not debit_owned_account(user_id, transaction.sender_account, amount):
+            source_exists = db.session.query(
+                owned_account_ids(user_id, transaction.sender_account).exists()
+            ).scalar()
+            if not source_exists:
+                return {'error': 'Source account not found'}, 404
+            return {'error': 'Insufficient funds'}, 400
+        if not credit_account(recipient_account_id, amount):
+            # 缓存中的账户已不存在，绕过缓存重新解析一次
+            recipient = resolve_recipient(data['recipient_identifier'], use_cache=False)
+            recipient_account_id = recipient[1] if recipient else None
+            if not recipient_account_id or not credit_account(recipient_account_id, amount):
+                # 没有入账就不能完成转账；调用方回滚，扣款一并撤销
+                return {'error': 'Recipient account not found'}, 409
+        # 发送方的余额汇总在同一事务中更新（接收方的由 credit_account 更新）
+        apply_account_delta(owned_account_ids(user_id, transaction.sender_account), -amount)
+
+        transaction.recipient_account_id = recipient_account_id
+        transaction.status = TransactionStatus.COMPLETED
+
+    else:
+        # 接收方未注册/未验证，或者还没有银行账户：不扣款，等验证标识时由 settle_pending 结算
+        transaction.status=TransactionStatus.PENDING
+        # 超过 TRANSACTION_EXPIRY_DAYS 仍未完成的由 expire_pending_transfers.py 标记为 EXPIRED
+
+    db.session.add(transaction)
+    apply_delta(user_id, pending=amount if transaction.status == TransactionStatus.PENDING else 0)
+    db.session.flush()
+
+    return {'message': 'Transfer initiated successfully', 'transaction_id': transaction.id}, 200
+
+
+def _applied_results(items):
+    """已经入账过的队列项（worker 在提交后、回写队列前崩溃时会重复领取）"""
+    keys = IdempotencyKey.__table__
+    rows = db.session.execute(
+        select(keys.c.key, keys.c.response_code, keys.c.response_body)
+        .where(keys.c.endpoint == QUEUE_ENDPOINT, keys.c.key.in_([item['id'] for item in items]))
+    ).all()
+    return {row.key: (json.loads(row.response_body), row.response_code) for row in rows}
+
+
+@retry_on_deadlock
+def apply_batch(items, record_results=True, commit=True):
+    """一个事务中应用一批转账，每笔一个保存点；返回 {id: (响应体, HTTP状态码)}
+
+    items: [{'id', 'user_id', 'payload', 'attempts'}]，单笔失败（包括 DataError 等数据库错误）
+    只回滚它自己的保存点并记为失败，死锁和锁等待超时才重跑整批；
+    队列项领取超过 TRANSFER_QUEUE_MAX_ATTEMPTS 次仍未完成时不再执行，直接记为失败；
+    带 'idempotency' (current_claim 的返回值) 的项，成功时在同一个保存点里写入 Idempotency-Key 的响应。
+    record_results 为真时把每笔结果写入幂等记录表，重复领取的项直接返回已有结果。
+    commit 为假时不提交，由调用方提交（组提交需要单独处理提交失败）。
+    """
+    results = _applied_results(items) if record_results else {}
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL', 86400))
+    max_attempts = current_app.config.get('TRANSFER_QUEUE_MAX_ATTEMPTS', 5)
+    for item in items:
+        if item['id'] in results:
+            continue
+        payload = item['payload']
+        if item.get('attempts', 0) > max_attempts:
+            results[item['id']] = ({
+                'error': 'Transfer failed',
+                'message': f'Gave up after {max_attempts} attempts'
+            }, 500)
+            _record_queue_result(item, results[item['id']], now, expires_at, record_results)
+            continue
+        try:
+            amount = Decimal(str(payload['amount']))
+            error = invalid_transfer(payload, amount)
+        except (KeyError, InvalidOperation) as e:
+            error = f'Invalid transfer: {e}'
+        if error:
+            results[item['id']] = ({'error': error}, 400)
+            _record_queue_result(item, results[item['id']], now, expires_at, record_results)
+            continue
+        savepoint = db.session.begin_nested()
+        try:
+            body, status = execute_transfer(item['user_id'], payload, amount)
+        except DBAPIError as e:
+            if is_retryable(e):
+                raise  # 死锁时整个事务已被回滚，交给 retry_on_deadlock 重跑整批
+            # 其它数据库错误（如超长、越界）只属于这一笔
+            body, status = {'error': 'Transfer failed', 'message': str(e.orig)}, 500
+        except Exception as e:
+            body, status = {'error': 'Internal Server Error', 'message': str(e)}, 500
+        if status == 200:
+            if item.get('idempotency'):
+                stage_response(item['idempotency'], body, status)
+            savepoint.commit()
+        else:
+            savepoint.rollback()
+        results[item['id']] = (body, status)
+        _record_queue_result(item, results[item['id']], now, expires_at, record_results)
+    if commit:
+        db.session.commit()
+    return results
+
+
+def _record_queue_result(item, result, now, expires_at, record_results):
+    """成功和失败的结果都记下来，重复领取时直接返回"""
+    if not record_results:
+        return
+    body, status = result
+    db.session.execute(insert(IdempotencyKey.__table__).values(
+        user_id=item['user_id'],
+        endpoint=QUEUE_ENDPOINT,
+        key=item['id'],
+        request_hash='',
+        status='completed',
+        response_code=status,
+        response_body=json.dumps(body),
+        created_at=now,
+        expires_at=expires_at
+    ))
@@ -0,0 +1,51 @@
+"""把热点账户的子余额归并回主余额
+
+用法:
+    python compact_balance_shards.py                 # 执行一轮
+    python compact_balance_shards.py --interval 60   # 每60秒执行一轮
+
+每个账户在独立的事务中归并，只短暂锁住该账户的子余额行。
+子余额入账不更新余额汇总和用户变更序号，归并时一次补上，所以运行间隔也决定了汇总的滞后时间。
+"""
+import argparse
+import time
+import traceback
+
+from app import create_app, db
+from app.models.bank import BankAccount
+from app.services.ledger import fold_shards
+
+
+def compact_once():
+    account_ids = [row[0] for row in db.session.query(BankAccount.id).filter(BankAccount.balance_shards > 0)]
+    folded = 0
+    for account_id in account_ids:
+        try:
+            folded += fold_shards(account_id)
+            db.session.commit()
+        except Exception as e:
+            # 与入账冲突（死锁/锁等待超时）时跳过，下一轮再归并
+            db.session.rollback()
+            print(f"Compaction error on account {account_id}:", str(e))
+            print("Traceback:", traceback.format_exc())
+    return len(account_ids), folded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fold balance shards back into bank account balances')
+    parser.add_argument('--interval', type=float, default=0, help='seconds between runs (0 = run once)')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        while True:
+            started = time.monotonic()
+            accounts, folded = compact_once()
+            print(f"accounts={accounts} folded={folded} elapsed={time.monotonic() - started:.2f}s")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,15 @@ class Config:
     JWT_HEADER_NAME = 'Authorization'
     JWT_HEADER_TYPE = 'Bearer'
     JWT_ERROR_MESSAGE_KEY = 'message'
+    JWT_BLOCKLIST_LOG = os.environ.get('JWT_BLOCKLIST_LOG')  # 默认为 instance/revoked_tokens.log
+    JWT_BLOCKLIST_CAPACITY = 1000000  # 布隆过滤器预期容量
+    JWT_BLOCKLIST_ERROR_RATE = 0.001
+    JWT_BLOCKLIST_SYNC_INTERVAL = 1  # 秒，读取其它worker注销记录的间隔
+    # 管理员权限变更记录（降权后旧令牌的 is_admin 声明失效），与注销记录同样用日志文件在进程间共享
+    JWT_ADMIN_REVOCATION_LOG = os.environ.get('JWT_ADMIN_REVOCATION_LOG')  # 默认为 instance/admin_revocations.log
+    JWT_ADMIN_REVOCATION_CAPACITY = 10000
+    JWT_ADMIN_REVOCATION_ERROR_RATE = 0.001
+    JWT_ADMIN_REVOCATION_SYNC_INTERVAL = 1
     
     # 邮件配置
     SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
@@ -23,9 +32,83 @@ class Config:
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
     
+    # 验证码发送配置（auto: 配置了凭据则使用真实服务商，否则使用本地桩；stub: 始终使用本地桩）
+    NOTIFY_TRANSPORT = os.environ.get('NOTIFY_TRANSPORT', 'auto')
+    NOTIFY_BATCH_SIZE = 100
+    NOTIFY_FLUSH_INTERVAL = 0.5  # 秒
+    NOTIFY_MAX_ATTEMPTS = 5
+    NOTIFY_BACKOFF_BASE = 2  # 秒，第n次重试等待约 base**n
+    NOTIFY_LEASE = 60  # 秒，发送线程领取后超过该时间未回写（进程崩溃）的记录会被重新领取
+    NOTIFY_AUTOSTART = True  # 每个进程收到第一个请求时启动发送线程
+    
+    # 管理员账户列表每页最大条数
+    ADMIN_PAGE_SIZE_MAX = 200
+    
+    # 死锁/锁等待超时重试
+    DB_RETRY_ATTEMPTS = 3
+    DB_RETRY_BASE_DELAY = 0.05  # 秒，第n次重试前随机等待 [0, base*2**n]
+    DB_RETRY_MAX_DELAY = 1.0
+    
+    # 收款人解析缓存（含查不到的负缓存）
+    RECIPIENT_CACHE_SIZE = 10000
+    RECIPIENT_CACHE_TTL = 300  # 秒
+    RECIPIENT_CACHE_NEGATIVE_TTL = 30
+    
+    # Idempotency-Key
+    IDEMPOTENCY_TTL = 86400  # 秒，key保存多久；过期后同一个key会被当作新请求
+    IDEMPOTENCY_WAIT_TIMEOUT = 10  # 秒，重复请求等待正在执行的请求的最长时间
+    IDEMPOTENCY_POLL_INTERVAL = 0.05
+    IDEMPOTENCY_PROCESSING_TIMEOUT = 120  # 秒，超过后仍为processing的记录视为执行者已崩溃，允许重新执行
+    IDEMPOTENCY_CACHE_SIZE = 10000
+    IDEMPOTENCY_CACHE_TTL = 300
+    
+    # 异步转账队列（本地SQLite文件，默认 instance/transfer_queue.db）
+    TRANSFER_ASYNC = os.environ.get('TRANSFER_ASYNC', '').lower() in ('1', 'true')  # 关闭时也可用请求头 Prefer: respond-async
+    TRANSFER_QUEUE_PATH = os.environ.get('TRANSFER_QUEUE_PATH')
+    TRANSFER_QUEUE_LEASE = 60  # 秒，worker领取后超过该时间未完成会被重新领取
+    TRANSFER_QUEUE_RETENTION = 7 * 86400  # 秒，已结束的队列项保留多久
+    TRANSFER_QUEUE_MAX_ATTEMPTS = 5  # 领取超过该次数仍未完成的项记为失败
+    TRANSFER_STATUS_MAX_WAIT = 30  # 秒，状态接口长轮询的最长等待
+    TRANSFER_STATUS_POLL_INTERVAL = 0.1
+    
+    # 同步转账组提交：时间窗口内到达的转账合并为一个事务提交
+    TRANSFER_GROUP_COMMIT = os.environ.get('TRANSFER_GROUP_COMMIT', '').lower() in ('1', 'true')
+    TRANSFER_GROUP_COMMIT_WINDOW_MS = 5
+    TRANSFER_GROUP_COMMIT_MAX_BATCH = 100
+    TRANSFER_GROUP_COMMIT_TIMEOUT = 30  # 秒，超时且尚未开始执行时返回503
+    
+    # 热点账户子余额分片
+    BALANCE_SHARDS_MAX = 64
+    BALANCE_SHARD_CACHE_TTL = 60  # 秒，分片数量的进程内缓存
+    
+    # 管理员批量打款
+    DISBURSEMENT_MAX_ITEMS = 50000
+    DISBURSEMENT_CHUNK_SIZE = 1000  # 每个分块一个事务
+    
     # 交易配置
     TRANSACTION_EXPIRY_DAYS = 15
     TRANSACTION_CANCEL_MINUTES = 10
+    PAYMENT_REQUEST_MAX_PAYERS = 1000  # 一次分账请求最多的付款人数
+    PAYMENT_INBOX_PAGE_SIZE_MAX = 100  # 付款请求收件箱每页最大条数
+    
+    # 密码哈希配置
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+    HASH_POOL_WORKERS = int(os.environ.get('HASH_POOL_WORKERS', os.cpu_count() or 1))  # 0 表示在请求线程内计算
+    HASH_QUEUE_SIZE = int(os.environ.get('HASH_QUEUE_SIZE', 64))
+    HASH_TIMEOUT = int(os.environ.get('HASH_TIMEOUT', 10))  # 秒
+    
+    # 登录/注册限流配置（次数, 窗口秒数）
+    RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE')  # 默认为 instance/ratelimit.bin
+    RATE_LIMIT_SLOTS = 16384
+    LOGIN_LIMIT_PER_IDENTIFIER = (10, 300)
+    LOGIN_LIMIT_PER_IP = (50, 60)
+    REGISTER_LIMIT_PER_IP = (10, 3600)
+    VERIFY_LIMIT_PER_IDENTIFIER = (5, 300)  # 按 用户+邮箱/电话 限制验证码提交
+    VERIFY_MAX_FAILURES = 5  # 同一验证码错误次数达到上限后作废并重新发送
+    
+    # 登录身份缓存配置
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 300))  # 秒
     
     # CORS配置
     CORS_ORIGINS = ['http://localhost:3000'] 
\ No newline at end of file
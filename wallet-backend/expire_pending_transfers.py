@@ -0,0 +1,39 @@
+"""把超过 TRANSACTION_EXPIRY_DAYS 仍未完成的待处理转账标记为过期，并释放其待处理金额
+
+用法:
+    python expire_pending_transfers.py                  # 执行一轮
+    python expire_pending_transfers.py --interval 300   # 每300秒执行一轮
+
+按 (status, created_at) 索引分块更新，每块一个短事务，不会长时间持锁阻塞在线转账。
+过期之前先结算接收方已经验证了标识、但验证时没有结算到的待处理转账。
+"""
+import argparse
+import time
+
+from app import create_app
+from app.services.expiry import expire_pending
+from app.services.settlement import settle_verified
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expire stale pending transfers')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep between chunks')
+    parser.add_argument('--interval', type=float, default=0, help='seconds between runs (0 = run once)')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        days = app.config['TRANSACTION_EXPIRY_DAYS']
+        while True:
+            started = time.monotonic()
+            settled = settle_verified()
+            expired = expire_pending(days, args.chunk_size, args.pause)
+            print(f"settled={settled} expired={expired} elapsed={time.monotonic() - started:.2f}s")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
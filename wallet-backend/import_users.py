@@ -0,0 +1,157 @@
+"""批量导入用户
+
+用法:
+    python import_users.py users.csv
+    python import_users.py users.jsonl --chunk-size 5000 --workers 8 --verified
+
+文件字段: name, ssn, email, phone, password（可选 is_admin）
+每处理完一个分块会写入检查点，中断后以相同参数重新运行即可从断点继续。
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from app import create_app, db
+from app.models.user import User, Email, Phone
+from app.models.bank import UserBalanceSummary
+
+REQUIRED_FIELDS = ('name', 'ssn', 'email', 'phone', 'password')
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def read_records(path):
+    """逐行流式读取CSV或JSONL，不会把整个文件载入内存"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'processed': 0, 'imported': 0, 'skipped': 0}
+
+
+def save_checkpoint(path, state):
+    # 先写临时文件再替换，避免中断时留下损坏的检查点
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def filter_new(records):
+    """去掉字段不全、文件内重复以及数据库中已存在的记录"""
+    seen = {'ssn': set(), 'email': set(), 'phone': set()}
+    valid = []
+    for r in records:
+        if not all(r.get(k) for k in REQUIRED_FIELDS):
+            continue
+        if r['ssn'] in seen['ssn'] or r['email'] in seen['email'] or r['phone'] in seen['phone']:
+            continue
+        for k in seen:
+            seen[k].add(r[k])
+        valid.append(r)
+    if not valid:
+        return []
+
+    # 每个唯一字段一次IN查询
+    existing_ssn = {row[0] for row in db.session.query(User.ssn).filter(User.ssn.in_(seen['ssn']))}
+    existing_email = {row[0] for row in db.session.query(Email.email).filter(Email.email.in_(seen['email']))}
+    existing_phone = {row[0] for row in db.session.query(Phone.phone).filter(Phone.phone.in_(seen['phone']))}
+    return [
+        r for r in valid
+        if r['ssn'] not in existing_ssn and r['email'] not in existing_email and r['phone'] not in existing_phone
+    ]
+
+
+def import_chunk(records, executor, rounds, verified):
+    hashes = executor.map(_hash, [r['password'] for r in records], itertools.repeat(rounds), chunksize=16)
+    user_rows = [{
+        'name': r['name'],
+        'ssn': r['ssn'],
+        'password_hash': password_hash,
+        'is_admin': str(r.get('is_admin', '')).lower() in ('1', 'true', 'yes')
+    } for r, password_hash in zip(records, hashes)]
+
+    # executemany 批量插入用户，再按ssn一次查回自增id
+    db.session.execute(User.__table__.insert(), user_rows)
+    ids = dict(db.session.query(User.ssn, User.id).filter(User.ssn.in_([r['ssn'] for r in records])))
+
+    db.session.execute(Email.__table__.insert(), [{
+        'email': r['email'], 'user_id': ids[r['ssn']], 'is_verified': verified
+    } for r in records])
+    db.session.execute(Phone.__table__.insert(), [{
+        'phone': r['phone'], 'user_id': ids[r['ssn']], 'is_verified': verified
+    } for r in records])
+    db.session.execute(UserBalanceSummary.__table__.insert(), [{
+        'user_id': ids[r['ssn']]
+    } for r in records])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import users from CSV or JSONL')
+    parser.add_argument('path', help='CSV or JSONL file')
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--checkpoint', help='checkpoint file (default: <path>.checkpoint)')
+    parser.add_argument('--verified', action='store_true', help='mark imported emails and phones as verified')
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or args.path + '.checkpoint'
+    state = load_checkpoint(checkpoint)
+    if state['processed']:
+        print(f"Resuming after {state['processed']} records")
+
+    app = create_app()
+    with app.app_context(), ProcessPoolExecutor(max_workers=args.workers) as executor:
+        rounds = app.config.get('BCRYPT_ROUNDS', 12)
+        records = itertools.islice(read_records(args.path), state['processed'], None)
+        started = time.monotonic()
+        done = 0
+
+        for chunk in chunked(records, args.chunk_size):
+            new_records = filter_new(chunk)
+            if new_records:
+                import_chunk(new_records, executor, rounds, args.verified)
+
+            state['processed'] += len(chunk)
+            state['imported'] += len(new_records)
+            state['skipped'] += len(chunk) - len(new_records)
+            save_checkpoint(checkpoint, state)
+
+            done += len(chunk)
+            elapsed = time.monotonic() - started
+            print(f"processed={state['processed']} imported={state['imported']} "
+                  f"skipped={state['skipped']} rate={done / elapsed:.0f} rows/s")
+
+    print("Import finished!")
+
+
+if __name__ == '__main__':
+    main()
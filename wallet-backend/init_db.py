@@ -1,7 +1,10 @@
 from app import create_app, db
 from app.models.user import User, Email, Phone
-from app.models.bank import BankAccount, UserBankAccount
+from app.models.bank import BankAccount, BankAccountShard, UserBankAccount, UserBalanceSummary
 from app.models.transaction import Transaction, PaymentRequest
+from app.models.notification import MessageDelivery
+from app.models.disbursement import DisbursementBatch, DisbursementItem
+from app.models.idempotency import IdempotencyKey
 import pymysql
 
 def init_db():
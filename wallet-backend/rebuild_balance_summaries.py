@@ -0,0 +1,67 @@
+"""按明细重建余额汇总表 user_balance_summaries
+
+用法:
+    python rebuild_balance_summaries.py --chunk-size 5000 --workers 8
+
+按用户id范围切分，每个分块在独立的进程和事务中先删后插。
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sqlalchemy import func, delete, insert
+
+from app import create_app, db
+from app.models.user import User
+from app.models.bank import UserBalanceSummary
+from app.services.balance_summary import summary_select, SUMMARY_COLUMNS
+
+_app = None
+
+
+def _init_worker():
+    global _app
+    _app = create_app()
+
+
+def rebuild_range(low, high):
+    with _app.app_context():
+        summary = UserBalanceSummary.__table__
+        db.session.execute(delete(summary).where(summary.c.user_id.between(low, high)))
+        result = db.session.execute(
+            insert(summary).from_select(SUMMARY_COLUMNS, summary_select(User.id.between(low, high)))
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild user balance summaries')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        low, high = db.session.query(func.min(User.id), func.max(User.id)).one()
+    if low is None:
+        print("No users found")
+        return
+
+    ranges = [(start, min(start + args.chunk_size - 1, high))
+              for start in range(low, high + 1, args.chunk_size)]
+    started = time.monotonic()
+    rebuilt = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(rebuild_range, lo, hi) for lo, hi in ranges]
+        for done, future in enumerate(as_completed(futures), 1):
+            rebuilt += future.result()
+            print(f"chunks={done}/{len(ranges)} users={rebuilt} "
+                  f"rate={rebuilt / (time.monotonic() - started):.0f} rows/s")
+
+    print("Balance summaries rebuilt successfully!")
+
+
+if __name__ == '__main__':
+    main()
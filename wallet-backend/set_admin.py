@@ -0,0 +1,34 @@
+"""授予或撤销管理员权限
+
+用法:
+    python set_admin.py 42            # 授予用户42管理员权限
+    python set_admin.py 42 --revoke   # 撤销
+
+通过ORM修改 is_admin，变更会写入 admin_revocations 日志，所有进程随即回查该用户的旧令牌；
+不要直接改库（直接改库时旧令牌里的管理员声明在过期前仍然有效）。
+"""
+import argparse
+
+from app import create_app, db
+from app.models.user import User
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grant or revoke admin rights')
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('--revoke', action='store_true', help='revoke admin rights instead of granting them')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        user = db.session.get(User, args.user_id)
+        if user is None:
+            print("User not found:", args.user_id)
+            return
+        user.is_admin = not args.revoke
+        db.session.commit()
+        print(f"user={user.id} is_admin={user.is_admin}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from config import Config
+from app import create_app, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        # pysqlite 自己管理事务时 SAVEPOINT 不可靠，改为由 SQLAlchemy 发出 BEGIN（见下面的 begin 事件）
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'isolation_level': None}}
+        TESTING = True
+        RATE_LIMIT_FILE = str(tmp_path / 'ratelimit.bin')
+        JWT_BLOCKLIST_LOG = str(tmp_path / 'revoked_tokens.log')
+        JWT_ADMIN_REVOCATION_LOG = str(tmp_path / 'admin_revocations.log')
+        TRANSFER_QUEUE_PATH = str(tmp_path / 'transfer_queue.db')
+        NOTIFY_AUTOSTART = False
+
+    app = create_app(TestConfig)
+    # 模块级缓存跨测试共享，每个测试的数据库都是新的，先清空
+    from app.services.identity import identity_cache
+    from app.services.ledger import shard_counts
+    from app.services.recipients import recipient_cache
+    for cache in (identity_cache, shard_counts, recipient_cache):
+        cache.clear()
+    with app.app_context():
+        event.listen(db.engine, 'begin', lambda conn: conn.exec_driver_sql('BEGIN'))
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def make_user(app):
+    """建一个邮箱已验证的用户：一个主账户（账号 ACC<id>）和按明细算好的汇总行"""
+    from app.models.user import User, Email
+    from app.models.bank import BankAccount, UserBankAccount
+    from app.services.balance_summary import recompute
+
+    def make(user_id, balance='0.00', email=None, account=True):
+        db.session.add(User(id=user_id, name=f'user{user_id}', ssn=str(user_id), password_hash='x'))
+        db.session.add(Email(user_id=user_id, email=email or f'user{user_id}@x.com', is_verified=True))
+        if account:
+            db.session.add(BankAccount(id=user_id, bank_name='Bank', account_number=f'ACC{user_id}',
+                                       balance=Decimal(balance), is_primary=True))
+            db.session.add(UserBankAccount(user_id=user_id, bank_account_id=user_id))
+        db.session.commit()
+        recompute([user_id])
+        db.session.commit()
+    return make
+
+
+@pytest.fixture
+def balances(app):
+    """{user_id: (主余额合计, 汇总行余额, 汇总行待处理金额)}，用来核对汇总表与明细一致"""
+    from sqlalchemy import func
+
+    from app.models.bank import BankAccount, UserBankAccount, UserBalanceSummary
+
+    def read(*user_ids):
+        db.session.expire_all()
+        result = {}
+        for user_id in user_ids:
+            total = db.session.query(func.coalesce(func.sum(BankAccount.balance), 0))\
+                .join(UserBankAccount, UserBankAccount.bank_account_id == BankAccount.id)\
+                .filter(UserBankAccount.user_id == user_id)\
+                .scalar()
+            summary = db.session.get(UserBalanceSummary, user_id)
+            result[user_id] = (Decimal(total), summary.total_balance, summary.pending_total)
+        return result
+    return read
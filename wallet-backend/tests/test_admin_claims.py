@@ -0,0 +1,33 @@
+import pytest
+
+from app import db
+from app.models.user import User
+from app.routes import api
+from app.services.tokens import create_user_token
+
+
+def _headers(user_id, is_admin):
+    return {'Authorization': 'Bearer ' + create_user_token(user_id, is_admin)}
+
+
+def _get(app, headers):
+    return app.test_client().get('/api/admin/db-retries', headers=headers)
+
+
+def test_admin_claim_is_trusted_without_reading_the_user(app, make_user, monkeypatch):
+    make_user(1)
+    monkeypatch.setattr(api, 'user_is_admin', lambda user_id: pytest.fail('admin check read the user table'))
+    assert _get(app, _headers(1, True)).status_code == 200
+    assert _get(app, _headers(1, False)).status_code == 403
+
+
+def test_demotion_invalidates_earlier_admin_claims(app, make_user):
+    make_user(1)
+    user = db.session.get(User, 1)
+    user.is_admin = True
+    db.session.commit()
+    headers = _headers(1, True)
+    assert _get(app, headers).status_code == 200
+    user.is_admin = False
+    db.session.commit()
+    assert _get(app, headers).status_code == 403
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from app import db
+from app.routes.api import _apply_admin_transfer
+from app.services.ledger import credit_account, set_shard_count
+
+
+def _sharded_source(make_user):
+    make_user(1, '10.00')
+    make_user(2)
+    set_shard_count(1, 2)
+    db.session.commit()
+    credit_account(1, Decimal('40.00'), shard_key='a')
+    db.session.commit()
+
+
+def test_admin_transfer_folds_shards_before_debit(app, make_user, balances):
+    _sharded_source(make_user)
+    # 子余额入账在归并前不计入汇总
+    assert balances(1)[1] == (Decimal('10.00'), Decimal('10.00'), Decimal('0.00'))
+    with app.test_request_context():
+        response = app.make_response(_apply_admin_transfer(2, 1, Decimal('30.00'), 'payout'))
+    assert response.status_code == 200, response.get_json()
+    assert balances(1, 2) == {
+        1: (Decimal('20.00'), Decimal('20.00'), Decimal('0.00')),
+        2: (Decimal('30.00'), Decimal('30.00'), Decimal('0.00')),
+    }
+
+
+def test_admin_transfer_locks_accounts_before_shards(app, make_user):
+    _sharded_source(make_user)
+    tables = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        for table in ('bank_account_shards', 'bank_accounts'):
+            if statement.startswith('SELECT') and f'FROM {table}' in statement:
+                tables.append(table)
+                break
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        with app.test_request_context():
+            _apply_admin_transfer(2, 1, Decimal('30.00'), 'payout')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert 'bank_account_shards' in tables
+    assert tables.index('bank_accounts') < tables.index('bank_account_shards')
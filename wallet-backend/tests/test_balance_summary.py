@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from app import db
+from app.models.bank import UserBalanceSummary
+from app.routes.api import _apply_admin_transfer
+from app.services.balance_summary import get_summary, recompute
+
+
+def _admin_transfer(app, to_id, from_id, amount):
+    with app.test_request_context():
+        return app.make_response(_apply_admin_transfer(to_id, from_id, Decimal(amount), 'admin'))
+
+
+def test_admin_transfer_updates_both_summaries(app, make_user, balances):
+    make_user(1, '50.00')
+    make_user(2)
+    assert _admin_transfer(app, 2, 1, '20.00').status_code == 200
+    assert balances(1, 2) == {
+        1: (Decimal('30.00'), Decimal('30.00'), Decimal('0.00')),
+        2: (Decimal('20.00'), Decimal('20.00'), Decimal('0.00')),
+    }
+
+
+def test_admin_overdraft_leaves_summaries_unchanged(app, make_user, balances):
+    make_user(1, '10.00')
+    make_user(2)
+    before = balances(1, 2)
+    assert _admin_transfer(app, 2, 1, '10.01').status_code == 400
+    assert balances(1, 2) == before
+
+
+def test_admin_credit_creates_account_and_counts_it(app, make_user, balances):
+    make_user(1, account=False)
+    assert db.session.get(UserBalanceSummary, 1).account_count == 0
+    assert _admin_transfer(app, 1, None, '15.00').status_code == 200
+    assert balances(1) == {1: (Decimal('15.00'), Decimal('15.00'), Decimal('0.00'))}
+    assert db.session.get(UserBalanceSummary, 1).account_count == 1
+
+
+def test_missing_summary_row_is_rebuilt_from_the_ledger(app, make_user, balances):
+    make_user(1, '40.00')
+    make_user(2)
+    db.session.delete(db.session.get(UserBalanceSummary, 1))
+    db.session.commit()
+    # 读取不写库，按明细现算一次
+    assert get_summary(1).total_balance == Decimal('40.00')
+    assert db.session.get(UserBalanceSummary, 1) is None
+    # 下一次写入按明细补齐，本次扣款只计一次
+    assert _admin_transfer(app, 2, 1, '10.00').status_code == 200
+    assert balances(1, 2) == {
+        1: (Decimal('30.00'), Decimal('30.00'), Decimal('0.00')),
+        2: (Decimal('10.00'), Decimal('10.00'), Decimal('0.00')),
+    }
+
+
+def test_recompute_repairs_a_drifted_summary(app, make_user, balances):
+    make_user(1, '40.00')
+    db.session.get(UserBalanceSummary, 1).total_balance = Decimal('999.00')
+    db.session.commit()
+    recompute([1])
+    db.session.commit()
+    assert balances(1) == {1: (Decimal('40.00'), Decimal('40.00'), Decimal('0.00'))}
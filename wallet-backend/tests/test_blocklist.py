@@ -0,0 +1,37 @@
+import threading
+import time
+
+from app.services import blocklist as blocklist_module
+from app.services.blocklist import TokenBlocklist
+from app.utils.bloom import BloomFilter
+
+
+def test_purge_rebuilds_off_the_request_thread(app, tmp_path, monkeypatch):
+    app.config['JWT_BLOCKLIST_LOG'] = str(tmp_path / 'purge.log')
+    tokens = TokenBlocklist()
+    tokens.init_app(app)
+    now = int(time.time())
+    tokens.revoke('expired', now + 1)
+    tokens.revoke('live', now + 100)
+    tokens._last_purge = now - tokens.purge_interval
+
+    rebuilding, release = threading.Event(), threading.Event()
+
+    class GatedBloomFilter(BloomFilter):
+        def add(self, key):
+            rebuilding.set()
+            release.wait(5)
+            super().add(key)
+    monkeypatch.setattr(blocklist_module, 'BloomFilter', GatedBloomFilter)
+
+    tokens._start_purge(now + 10)
+    assert rebuilding.wait(5)
+    # 重建进行中：查询不等待，新注销的令牌也不会在替换后丢失
+    assert tokens.revoked_until('live') == now + 100
+    tokens.revoke('new', now + 100)
+    release.set()
+    tokens._purge_thread.join(5)
+
+    assert isinstance(tokens._bloom, GatedBloomFilter)
+    assert set(tokens._revoked) == {'live', 'new'}
+    assert tokens.is_revoked('live') and tokens.is_revoked('new')
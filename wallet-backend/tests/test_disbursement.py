@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from app.models.bank import BankAccount, UserBankAccount
+from app.models.disbursement import DisbursementItem
+from app.services import disbursement
+from app.services.disbursement import BatchConflict, run_batch
+from app.services.tokens import create_user_token
+
+
+def _items(*amounts):
+    return [{'to_account': f'ACC{user_id}', 'amount': amount} for user_id, amount in amounts]
+
+
+def test_resubmitting_a_batch_credits_each_item_once(app, make_user, balances):
+    make_user(1)
+    make_user(2)
+    items = _items((1, '10.00'), (2, '5.00'), (3, '1.00'))
+    first = run_batch('b1', items, admin_id=1)
+    second = run_batch('b1', items, admin_id=1)
+    assert first == second
+    assert [r['status'] for r in first] == ['completed', 'completed', 'failed']
+    assert balances(1, 2) == {
+        1: (Decimal('10.00'), Decimal('10.00'), Decimal('0.00')),
+        2: (Decimal('5.00'), Decimal('5.00'), Decimal('0.00')),
+    }
+
+
+def test_batch_resumes_after_a_crash_between_chunks(app, make_user, balances, monkeypatch):
+    make_user(1)
+    make_user(2)
+    items = _items((1, '10.00'), (2, '5.00'), (1, '2.50'))
+    process_chunk = disbursement._process_chunk
+    calls = []
+
+    def crash_on_second_chunk(batch_id, chunk):
+        calls.append(chunk)
+        if len(calls) == 2:
+            raise RuntimeError('worker killed')
+        process_chunk(batch_id, chunk)
+    monkeypatch.setattr(disbursement, '_process_chunk', crash_on_second_chunk)
+    with pytest.raises(RuntimeError):
+        run_batch('b1', items, admin_id=1, chunk_size=1)
+    db.session.rollback()
+    assert DisbursementItem.query.count() == 1
+
+    monkeypatch.setattr(disbursement, '_process_chunk', process_chunk)
+    results = run_batch('b1', items, admin_id=1, chunk_size=1)
+    assert [r['status'] for r in results] == ['completed'] * 3
+    assert balances(1, 2) == {
+        1: (Decimal('12.50'), Decimal('12.50'), Decimal('0.00')),
+        2: (Decimal('5.00'), Decimal('5.00'), Decimal('0.00')),
+    }
+
+
+def test_same_batch_id_with_different_items_conflicts(app, make_user):
+    make_user(1)
+    run_batch('b1', _items((1, '10.00')), admin_id=1)
+    with pytest.raises(BatchConflict):
+        run_batch('b1', _items((1, '99.00')), admin_id=1)
+
+
+def test_admin_transfer_and_batch_credit_the_same_primary_account(app, make_user):
+    make_user(1)
+    db.session.add(BankAccount(id=2, bank_name='Bank', account_number='SAVINGS', balance=0, is_primary=False))
+    db.session.add(BankAccount(id=3, bank_name='Bank', account_number='PRIMARY', balance=0, is_primary=True))
+    db.session.add(UserBankAccount(user_id=1, bank_account_id=2))
+    db.session.add(UserBankAccount(user_id=1, bank_account_id=3))
+    db.session.get(BankAccount, 1).is_primary = False
+    db.session.commit()
+
+    headers = {'Authorization': 'Bearer ' + create_user_token(1, True)}
+    response = app.test_client().post('/api/admin/transfer', json={'to_account': 'ACC1', 'amount': 10}, headers=headers)
+    assert response.status_code == 200
+    run_batch('b1', _items((1, '5.00')), admin_id=1)
+    db.session.expire_all()
+    assert [db.session.get(BankAccount, i).balance for i in (1, 2, 3)] == \
+        [Decimal('0.00'), Decimal('0.00'), Decimal('15.00')]
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import db
+from app.models.transaction import Transaction, TransactionStatus, TransactionType
+from app.services.balance_summary import recompute
+from app.services.expiry import expire_pending
+from app.services.settlement import settle_pending
+from app.services.tokens import create_user_token
+
+
+def _pending(user_id, amount, days_old, recipient='nobody@x.com'):
+    transaction = Transaction(
+        user_id=user_id, type=TransactionType.TRANSFER, amount=Decimal(amount),
+        recipient_identifier=recipient, sender_account=f'ACC{user_id}',
+        status=TransactionStatus.PENDING, created_at=datetime.utcnow() - timedelta(days=days_old)
+    )
+    db.session.add(transaction)
+    return transaction
+
+
+def _setup(make_user):
+    make_user(1, '100.00')
+    old = [_pending(1, '10.00', 10), _pending(1, '15.00', 8)]
+    fresh = _pending(1, '5.00', 1)
+    db.session.commit()
+    recompute([1])
+    db.session.commit()
+    return [t.id for t in old], fresh.id
+
+
+def _statuses(ids):
+    db.session.expire_all()
+    return [db.session.get(Transaction, i).status for i in ids]
+
+
+def test_expiry_releases_pending_amounts(app, make_user, balances):
+    old, fresh = _setup(make_user)
+    assert balances(1) == {1: (Decimal('100.00'), Decimal('100.00'), Decimal('30.00'))}
+    assert expire_pending(days=7) == 2
+    assert _statuses(old) == [TransactionStatus.EXPIRED] * 2
+    assert _statuses([fresh]) == [TransactionStatus.PENDING]
+    # 只释放占用的待处理金额，余额本来就没扣
+    assert balances(1) == {1: (Decimal('100.00'), Decimal('100.00'), Decimal('5.00'))}
+    assert expire_pending(days=7) == 0
+
+
+def test_expiry_runs_in_chunks(app, make_user, balances):
+    old, _ = _setup(make_user)
+    assert expire_pending(days=7, chunk_size=1) == 2
+    assert _statuses(old) == [TransactionStatus.EXPIRED] * 2
+    assert balances(1)[1][2] == Decimal('5.00')
+
+
+def test_expired_transfer_is_not_settled_and_can_be_cancelled(app, make_user, balances):
+    old, _ = _setup(make_user)
+    expire_pending(days=7)
+    make_user(2, email='nobody@x.com')
+    assert settle_pending('nobody@x.com') == 1  # 只结算未过期的那笔
+    assert _statuses(old) == [TransactionStatus.EXPIRED] * 2
+    assert balances(1, 2) == {
+        1: (Decimal('95.00'), Decimal('95.00'), Decimal('0.00')),
+        2: (Decimal('5.00'), Decimal('5.00'), Decimal('0.00')),
+    }
+
+    response = app.test_client().get(
+        f'/api/transactions/transactions/cancel?transactionId={old[0]}',
+        headers={'Authorization': 'Bearer ' + create_user_token(1, False)}
+    )
+    assert response.status_code == 200
+    assert _statuses(old[:1]) == [TransactionStatus.CANCELLED]
+    # 过期时已经释放过，取消不再改动待处理金额
+    assert balances(1)[1] == (Decimal('95.00'), Decimal('95.00'), Decimal('0.00'))
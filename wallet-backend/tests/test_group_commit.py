@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models.user import User, Email
+from app.models.bank import BankAccount, UserBankAccount
+from app.models.transaction import Transaction
+from app.services import transfers
+from app.services.group_commit import GroupCommitter
+
+
+def _user(user_id, email, account_number, balance):
+    db.session.add(User(id=user_id, name=f'user{user_id}', ssn=str(user_id), password_hash='x'))
+    db.session.add(Email(user_id=user_id, email=email, is_verified=True))
+    db.session.add(BankAccount(id=user_id, bank_name='Bank', account_number=account_number,
+                               balance=balance, is_primary=True))
+    db.session.add(UserBankAccount(user_id=user_id, bank_account_id=user_id))
+
+
+def _items():
+    _user(1, 'a@x.com', 'ACC1', Decimal('100.00'))
+    _user(2, 'b@x.com', 'ACC2', Decimal('0.00'))
+    db.session.commit()
+    return [{'id': 'item-1', 'user_id': 1, 'payload': {
+        'recipient_identifier': 'b@x.com', 'amount': '10.00', 'source_account': 'ACC1', 'note': None
+    }}]
+
+
+def _commit_then_fail(monkeypatch):
+    commit = db.session.commit
+
+    def fail():
+        commit()
+        raise RuntimeError('connection lost during commit')
+    monkeypatch.setattr(db.session, 'commit', fail)
+
+
+def test_commit_error_after_commit_reports_success(app, monkeypatch):
+    items = _items()
+    _commit_then_fail(monkeypatch)
+    results, latency = GroupCommitter()._apply(items)
+    body, status = results['item-1']
+    assert status == 200
+    assert latency is not None
+    assert db.session.get(Transaction, body['transaction_id']) is not None
+
+
+def test_commit_error_without_commit_reports_failure(app):
+    items = _items()
+    results = {'item-1': ({'message': 'Transfer initiated successfully', 'transaction_id': 999}, 200)}
+    checked = GroupCommitter()._check_commit(items, results, RuntimeError('connection lost during commit'))
+    assert checked['item-1'][1] == 500
+
+
+def test_commit_error_unverifiable_reports_unknown(app, monkeypatch):
+    items = _items()
+    results = {'item-1': ({'message': 'Transfer initiated successfully', 'transaction_id': 1}, 200)}
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(db.session, 'execute', fail)
+    body, status = GroupCommitter()._check_commit(items, results, RuntimeError('connection lost'))['item-1']
+    assert status == 503
+    assert body['outcome'] == 'unknown'
+
+
+def test_failing_item_does_not_fail_its_window(app, make_user, balances, monkeypatch):
+    make_user(1, '100.00')
+    make_user(2)
+    execute_transfer = transfers.execute_transfer
+
+    def execute(user_id, data, amount):
+        if data['note'] == 'deadlock':
+            raise OperationalError('UPDATE', {}, Exception(1213, 'Deadlock found'))
+        return execute_transfer(user_id, data, amount)
+    monkeypatch.setattr(transfers, 'execute_transfer', execute)
+    app.config['DB_RETRY_BASE_DELAY'] = 0
+
+    items = [{'id': f'item-{n}', 'user_id': 1, 'payload': {
+        'recipient_identifier': 'user2@x.com', 'amount': '10.00', 'source_account': 'ACC1',
+        'note': 'deadlock' if n == 1 else None
+    }} for n in range(3)]
+    results, _ = GroupCommitter()._apply(items)
+    assert [results[f'item-{n}'][1] for n in range(3)] == [200, 500, 200]
+    assert balances(1, 2) == {
+        1: (Decimal('80.00'), Decimal('80.00'), Decimal('0.00')),
+        2: (Decimal('20.00'), Decimal('20.00'), Decimal('0.00')),
+    }
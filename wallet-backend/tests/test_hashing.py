@@ -0,0 +1,32 @@
+from concurrent.futures import Future
+
+import pytest
+
+from app.services.hashing import HashingBusy, HashingService, hasher
+
+
+class StalledExecutor:
+    """提交的任务永远不会完成，模拟积压的进程池"""
+
+    def submit(self, fn, *args):
+        return Future()
+
+
+def test_timeout_is_reported_as_busy():
+    service = HashingService(workers=1, queue_size=2, timeout=0.01)
+    service._get_executor = lambda: StalledExecutor()
+    with pytest.raises(HashingBusy):
+        service.check_password('secret', 'x')
+    # 超时的任务被取消后释放名额
+    with pytest.raises(HashingBusy, match='timed out'):
+        service.check_password('secret', 'x')
+
+
+def test_login_timeout_returns_503(app, make_user, monkeypatch):
+    make_user(1)
+    monkeypatch.setattr(hasher, 'workers', 1)
+    monkeypatch.setattr(hasher, 'timeout', 0.01)
+    monkeypatch.setattr(hasher, '_get_executor', lambda: StalledExecutor())
+    response = app.test_client().post('/api/auth/login', json={'identifier': 'user1@x.com', 'password': 'secret'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
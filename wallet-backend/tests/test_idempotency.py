@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import jsonify
+
+from app import db
+from app.models.idempotency import IdempotencyKey
+from app.models.user import User
+from app.services.idempotency import IdempotencyStore, record_response
+
+SCOPE = (1, 'transactions.transfer', 'key-1')
+
+
+@pytest.fixture
+def store(app):
+    db.session.add(User(id=1, name='user1', ssn='1', password_hash='x'))
+    db.session.commit()
+    store = IdempotencyStore()
+    store.init_app(app)
+    return store
+
+
+def test_response_is_kept_when_handler_fails_after_commit(app, store):
+    def handler():
+        record_response({'transaction_id': 7})
+        db.session.commit()
+        raise RuntimeError('worker killed')
+
+    with app.test_request_context():
+        with pytest.raises(RuntimeError):
+            store.run(SCOPE, 'hash', handler)
+        replay = store.run(SCOPE, 'hash', lambda: pytest.fail('executed twice'))
+    assert replay.status_code == 200
+    assert replay.get_json() == {'transaction_id': 7}
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+
+
+def test_abandoned_processing_claim_is_reclaimed(app, store):
+    created_at = datetime.utcnow() - timedelta(seconds=store.processing_timeout + 1)
+    db.session.add(IdempotencyKey(
+        user_id=1, endpoint=SCOPE[1], key=SCOPE[2], request_hash='hash', status='processing',
+        created_at=created_at, expires_at=created_at + timedelta(days=1)
+    ))
+    db.session.commit()
+
+    def handler():
+        record_response({'transaction_id': 8})
+        db.session.commit()
+        return jsonify({'transaction_id': 8})
+
+    with app.test_request_context():
+        response = store.run(SCOPE, 'hash', handler)
+    assert response.get_json() == {'transaction_id': 8}
+    assert db.session.query(IdempotencyKey.status).scalar() == 'completed'
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models.notification import MessageDelivery, DeliveryChannel, DeliveryStatus
+from app.services.notifications import NotificationDispatcher, StubTransport
+
+
+class FailingTransport:
+    def send_batch(self, messages):
+        return {m.delivery_id: 'provider unavailable' for m in messages}
+
+
+@pytest.fixture
+def dispatcher(app):
+    # 新建的实例相当于重启后的进程：内存里没有任何待发送消息
+    dispatcher = NotificationDispatcher()
+    dispatcher.init_app(app)
+    return dispatcher
+
+
+def _delivery(code='123456'):
+    delivery = NotificationDispatcher().create_delivery(DeliveryChannel.EMAIL, 'a@x.com', code)
+    db.session.commit()
+    return delivery.id
+
+
+def test_pending_delivery_is_sent_from_the_database(app, dispatcher):
+    delivery_id = _delivery()
+    dispatcher.dispatch_due()
+    assert [(m.recipient, m.code) for m in dispatcher.transports[DeliveryChannel.EMAIL].sent] == [('a@x.com', '123456')]
+    delivery = db.session.get(MessageDelivery, delivery_id)
+    assert (delivery.status, delivery.attempts, delivery.code, delivery.claim_token) == (DeliveryStatus.SENT, 1, None, None)
+    dispatcher.dispatch_due()
+    assert len(dispatcher.transports[DeliveryChannel.EMAIL].sent) == 1
+
+
+def test_failed_send_is_retried_later_then_given_up(app, dispatcher):
+    dispatcher.transports[DeliveryChannel.EMAIL] = FailingTransport()
+    dispatcher.max_attempts = 2
+    delivery_id = _delivery()
+    dispatcher.dispatch_due()
+    delivery = db.session.get(MessageDelivery, delivery_id)
+    assert (delivery.status, delivery.attempts, delivery.claimed_until) == (DeliveryStatus.QUEUED, 1, None)
+    assert delivery.next_attempt_at > datetime.utcnow()
+
+    delivery.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    dispatcher.dispatch_due()
+    db.session.expire_all()
+    delivery = db.session.get(MessageDelivery, delivery_id)
+    assert (delivery.status, delivery.attempts, delivery.code) == (DeliveryStatus.FAILED, 2, None)
+    assert delivery.last_error == 'provider unavailable'
+
+
+def test_delivery_claimed_by_a_crashed_process_is_reclaimed(app, dispatcher):
+    delivery_id = _delivery()
+    delivery = db.session.get(MessageDelivery, delivery_id)
+    delivery.claim_token = 'crashed'
+    delivery.claimed_until = datetime.utcnow() + timedelta(seconds=60)
+    db.session.commit()
+    dispatcher.dispatch_due()
+    assert not dispatcher.transports[DeliveryChannel.EMAIL].sent
+
+    delivery.claimed_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    dispatcher.dispatch_due()
+    assert len(dispatcher.transports[DeliveryChannel.EMAIL].sent) == 1
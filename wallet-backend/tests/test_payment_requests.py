@@ -0,0 +1,39 @@
+from decimal import Decimal
+
+from app import db
+from app.models.user import User, Email
+from app.models.bank import UserBalanceSummary
+from app.services.balance_summary import recompute
+from app.services.payment_requests import build_shares, create_payment_request, split_amounts
+
+
+def _user(user_id, email):
+    user = User(id=user_id, name=f'user{user_id}', ssn=str(user_id), password_hash='x')
+    db.session.add(user)
+    db.session.add(Email(user_id=user_id, email=email, is_verified=True))
+    return user
+
+
+def test_split_amounts_adds_up_to_the_cent():
+    shares = split_amounts(Decimal('100.00'), [Decimal(1)] * 3)
+    assert shares == [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')]
+    shares = split_amounts(Decimal('10.01'), [Decimal(1), Decimal(2), Decimal('0.5')])
+    assert sum(shares) == Decimal('10.01')
+
+
+def test_request_pending_total_matches_recompute(app):
+    _user(1, 'a@x.com')
+    _user(2, 'b@x.com')
+    db.session.commit()
+    recompute([1])
+    db.session.commit()
+
+    total, shares = build_shares('100.00', [{'identifier': 'b@x.com'}, {'identifier': 'nobody@x.com'}])
+    create_payment_request(1, total, shares)
+    db.session.commit()
+
+    incremental = db.session.get(UserBalanceSummary, 1).pending_total
+    recompute([1])
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(UserBalanceSummary, 1).pending_total == incremental
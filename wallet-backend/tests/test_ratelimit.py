@@ -0,0 +1,20 @@
+from app.services.ratelimit import SlidingWindowLimiter
+
+
+def test_flooding_new_keys_does_not_reset_a_counter(app, tmp_path):
+    # 8个槽位：每个键的探测范围覆盖整张表
+    app.config['RATE_LIMIT_SLOTS'] = 8
+    app.config['RATE_LIMIT_FILE'] = str(tmp_path / 'flood.bin')
+    limiter = SlidingWindowLimiter()
+    limiter.init_app(app)
+
+    for _ in range(3):
+        assert limiter.hit('login:id:victim', 3, 300)[0]
+    assert not limiter.hit('login:id:victim', 3, 300)[0]
+    for n in range(7):
+        assert limiter.hit(f'login:id:flood{n}', 3, 300)[0]
+
+    allowed, _, retry_after = limiter.hit('login:id:flood-new', 3, 300)
+    assert not allowed and retry_after > 0
+    # 受害者的计数没有被挤掉
+    assert not limiter.hit('login:id:victim', 3, 300)[0]
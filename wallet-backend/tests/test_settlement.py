@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from app import db
+from app.models.transaction import Transaction, TransactionStatus
+from app.models.user import Email
+from app.services.ledger import credit_account
+from app.services.settlement import settle_verified
+from app.services.tokens import create_user_token
+
+
+def _headers(user_id):
+    return {'Authorization': 'Bearer ' + create_user_token(user_id, False)}
+
+
+def _transfer(client, user_id, amount):
+    response = client.post('/api/transactions/transfer', headers=_headers(user_id), json={
+        'recipient_identifier': 'new@x.com', 'amount': amount, 'source_account': f'ACC{user_id}'
+    })
+    assert response.status_code == 200
+    return response.get_json()['transaction_id']
+
+
+def _statuses(ids):
+    db.session.expire_all()
+    return [db.session.get(Transaction, i).status for i in ids]
+
+
+def test_verification_settles_pending_transfers_in_bulk(app, make_user, balances):
+    make_user(1, '100.00')
+    make_user(2, '5.00')
+    make_user(3)
+    db.session.add(Email(user_id=3, email='new@x.com', verification_code='123456'))
+    db.session.commit()
+    client = app.test_client()
+    funded = [_transfer(client, 1, '10.00'), _transfer(client, 1, '20.00')]
+    short = _transfer(client, 2, '30.00')
+    assert balances(1, 2) == {
+        1: (Decimal('100.00'), Decimal('100.00'), Decimal('30.00')),
+        2: (Decimal('5.00'), Decimal('5.00'), Decimal('30.00')),
+    }
+
+    response = client.post('/api/verify/email', headers=_headers(3), json={'email': 'new@x.com', 'code': '123456'})
+    assert response.status_code == 200
+    assert response.get_json()['settled_transfers'] == 2
+    assert _statuses(funded) == [TransactionStatus.COMPLETED] * 2
+    # 余额不足的发送方留在待处理状态，不影响其它发送方
+    assert _statuses([short]) == [TransactionStatus.PENDING]
+    assert balances(1, 2, 3) == {
+        1: (Decimal('70.00'), Decimal('70.00'), Decimal('0.00')),
+        2: (Decimal('5.00'), Decimal('5.00'), Decimal('30.00')),
+        3: (Decimal('30.00'), Decimal('30.00'), Decimal('0.00')),
+    }
+
+    # 发送方补足余额后由定时任务兜底结算
+    credit_account(2, Decimal('25.00'))
+    db.session.commit()
+    assert settle_verified() == 1
+    assert _statuses([short]) == [TransactionStatus.COMPLETED]
+    assert balances(2, 3) == {
+        2: (Decimal('0.00'), Decimal('0.00'), Decimal('0.00')),
+        3: (Decimal('60.00'), Decimal('60.00'), Decimal('0.00')),
+    }
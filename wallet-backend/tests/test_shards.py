@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from sqlalchemy import func
+
+from app import db
+from app.models.bank import BankAccountShard
+from app.services.ledger import account_balance, credit_account, set_shard_count
+from app.services.tokens import create_user_token
+from compact_balance_shards import compact_once
+
+
+def _shard(make_user, user_id, balance='0.00', shards=4):
+    make_user(user_id, balance)
+    set_shard_count(user_id, shards)
+    db.session.commit()
+
+
+def _shard_total(account_id):
+    return db.session.query(func.coalesce(func.sum(BankAccountShard.balance), 0))\
+        .filter(BankAccountShard.bank_account_id == account_id).scalar()
+
+
+def _transfer(app, user_id, recipient, amount, source):
+    return app.test_client().post('/api/transactions/transfer', json={
+        'recipient_identifier': recipient, 'amount': amount, 'source_account': source
+    }, headers={'Authorization': 'Bearer ' + create_user_token(user_id, False)})
+
+
+def test_credits_land_on_shards_until_compaction(app, make_user, balances):
+    make_user(1, '100.00')
+    _shard(make_user, 2)
+    assert _transfer(app, 1, 'user2@x.com', '30.00', 'ACC1').status_code == 200
+    assert _transfer(app, 1, 'user2@x.com', '20.00', 'ACC1').status_code == 200
+    # 子余额入账：主余额和汇总滞后，账户余额已包含
+    assert account_balance(2) == Decimal('50.00')
+    assert _shard_total(2) == Decimal('50.00')
+    assert balances(1, 2) == {
+        1: (Decimal('50.00'), Decimal('50.00'), Decimal('0.00')),
+        2: (Decimal('0.00'), Decimal('0.00'), Decimal('0.00')),
+    }
+
+    assert compact_once() == (1, Decimal('50.00'))
+    assert _shard_total(2) == 0
+    assert balances(2) == {2: (Decimal('50.00'), Decimal('50.00'), Decimal('0.00'))}
+
+
+def test_debit_folds_shards_when_main_balance_is_short(app, make_user, balances):
+    _shard(make_user, 1, '10.00')
+    make_user(2)
+    credit_account(1, Decimal('40.00'))
+    db.session.commit()
+    assert _transfer(app, 1, 'user2@x.com', '45.00', 'ACC1').status_code == 200
+    assert _shard_total(1) == 0
+    assert balances(1, 2) == {
+        1: (Decimal('5.00'), Decimal('5.00'), Decimal('0.00')),
+        2: (Decimal('45.00'), Decimal('45.00'), Decimal('0.00')),
+    }
+    # 归并后仍然不足时拒绝
+    assert _transfer(app, 1, 'user2@x.com', '5.01', 'ACC1').status_code == 400
+    assert balances(1)[1][0] == Decimal('5.00')
+
+
+def test_same_shard_key_lands_on_the_same_shard(app, make_user):
+    _shard(make_user, 1)
+    credit_account(1, Decimal('1.00'), shard_key='merchant-7')
+    credit_account(1, Decimal('2.00'), shard_key='merchant-7')
+    db.session.commit()
+    shard_balances = [row.balance for row in BankAccountShard.query.filter_by(bank_account_id=1)]
+    assert sorted(shard_balances) == [0, 0, 0, Decimal('3.00')]
+
+
+def test_disabling_shards_folds_and_later_credits_hit_the_main_row(app, make_user, balances):
+    _shard(make_user, 1, '10.00')
+    credit_account(1, Decimal('15.00'))
+    db.session.commit()
+    set_shard_count(1, 0)
+    db.session.commit()
+    assert BankAccountShard.query.filter_by(bank_account_id=1).count() == 0
+    assert balances(1) == {1: (Decimal('25.00'), Decimal('25.00'), Decimal('0.00'))}
+
+    credit_account(1, Decimal('5.00'))
+    db.session.commit()
+    assert balances(1) == {1: (Decimal('30.00'), Decimal('30.00'), Decimal('0.00'))}
+    assert account_balance(1) == Decimal('30.00')
@@ -0,0 +1,118 @@
+from decimal import Decimal
+
+from sqlalchemy.exc import DataError
+
+from app import db
+from app.models.transaction import Transaction
+from app.routes import transactions
+from app.services import transfers
+from app.services.tokens import create_user_token
+from app.services.transfer_queue import TransferQueue, transfer_queue
+from app.services.transfers import apply_batch
+
+
+def _item(item_id, recipient='user2@x.com', amount='10.00', attempts=1):
+    return {'id': item_id, 'user_id': 1, 'attempts': attempts, 'payload': {
+        'recipient_identifier': recipient, 'amount': amount, 'source_account': 'ACC1', 'note': None
+    }}
+
+
+def test_bad_item_fails_alone(app, make_user, balances):
+    make_user(1, '100.00')
+    make_user(2)
+    results = apply_batch([
+        _item('ok-1'),
+        _item('too-long', recipient='x' * 31 + '@x.com'),
+        _item('too-large', amount='1e12'),
+        _item('ok-2', amount='5.00'),
+    ])
+    assert results['ok-1'][1] == 200 and results['ok-2'][1] == 200
+    assert results['too-long'][1] == 400 and results['too-large'][1] == 400
+    assert balances(1, 2) == {
+        1: (Decimal('85.00'), Decimal('85.00'), Decimal('0.00')),
+        2: (Decimal('15.00'), Decimal('15.00'), Decimal('0.00')),
+    }
+
+
+def test_database_error_rolls_back_only_its_savepoint(app, make_user, balances, monkeypatch):
+    make_user(1, '100.00')
+    make_user(2)
+    execute_transfer = transfers.execute_transfer
+
+    def execute(user_id, data, amount):
+        body, status = execute_transfer(user_id, data, amount)
+        if data['note'] == 'poison':
+            raise DataError('INSERT', {}, Exception('Data too long'))
+        return body, status
+    monkeypatch.setattr(transfers, 'execute_transfer', execute)
+
+    poison = _item('poison')
+    poison['payload']['note'] = 'poison'
+    results = apply_batch([_item('ok-1'), poison, _item('ok-2')])
+    assert [results[key][1] for key in ('ok-1', 'poison', 'ok-2')] == [200, 500, 200]
+    assert Transaction.query.count() == 2
+    assert balances(1, 2) == {
+        1: (Decimal('80.00'), Decimal('80.00'), Decimal('0.00')),
+        2: (Decimal('20.00'), Decimal('20.00'), Decimal('0.00')),
+    }
+    # 重复领取时直接返回已记录的结果，不再执行
+    assert apply_batch([poison]) == {'poison': results['poison']}
+
+
+def test_item_is_given_up_after_max_attempts(app, make_user, balances):
+    make_user(1, '100.00')
+    make_user(2)
+    attempts = app.config['TRANSFER_QUEUE_MAX_ATTEMPTS'] + 1
+    results = apply_batch([_item('stuck', attempts=attempts)])
+    assert results['stuck'][1] == 500
+    assert Transaction.query.count() == 0
+    assert balances(1)[1][0] == Decimal('100.00')
+
+
+def test_queue_counts_attempts_and_marks_failures(app, tmp_path):
+    queue = TransferQueue()
+    app.config['TRANSFER_QUEUE_PATH'] = str(tmp_path / 'queue.db')
+    queue.init_app(app)
+    transfer_id = queue.enqueue(1, {'amount': '1.00'})
+    assert queue.claim(10)[0]['attempts'] == 1
+    queue.release([transfer_id])
+    assert queue.claim(10)[0]['attempts'] == 2
+    queue.complete({transfer_id: ({'error': 'Transfer failed'}, 500)})
+    assert queue.get(transfer_id, 1)['status'] == 'failed'
+    assert queue.claim(10) == []
+
+
+def test_enqueue_with_the_same_id_is_ignored(app, tmp_path):
+    queue = TransferQueue()
+    app.config['TRANSFER_QUEUE_PATH'] = str(tmp_path / 'queue.db')
+    queue.init_app(app)
+    queue.enqueue(1, {'amount': '1.00'}, transfer_id='t1', reuse_after=60)
+    queue.enqueue(1, {'amount': '2.00'}, transfer_id='t1', reuse_after=60)
+    items = queue.claim(10)
+    assert [(item['id'], item['payload']) for item in items] == [('t1', {'amount': '1.00'})]
+
+
+def test_async_retry_after_failed_response_write_reuses_the_queued_transfer(app, make_user, monkeypatch):
+    make_user(1, '100.00')
+    make_user(2)
+    headers = {
+        'Authorization': 'Bearer ' + create_user_token(1, False),
+        'Idempotency-Key': 'async-1',
+        'Prefer': 'respond-async'
+    }
+    data = {'recipient_identifier': 'user2@x.com', 'amount': '10.00', 'source_account': 'ACC1'}
+    record_response = transactions.record_response
+
+    def fail_once(body, status_code=200):
+        monkeypatch.setattr(transactions, 'record_response', record_response)
+        raise RuntimeError('crashed before the response was stored')
+    monkeypatch.setattr(transactions, 'record_response', fail_once)
+
+    client = app.test_client()
+    assert client.post('/api/transactions/transfer', json=data, headers=headers).status_code == 500
+    response = client.post('/api/transactions/transfer', json=data, headers=headers)
+    assert response.status_code == 202
+    items = transfer_queue.claim(10)
+    assert [item['id'] for item in items] == [response.get_json()['transfer_id']]
+    replay = client.post('/api/transactions/transfer', json=data, headers=headers)
+    assert replay.get_json()['transfer_id'] == response.get_json()['transfer_id']
@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from app.models.transaction import Transaction, TransactionStatus
+from app.services.tokens import create_user_token
+
+
+@pytest.fixture
+def client(app, make_user):
+    make_user(1, '100.00')
+    make_user(2, '5.00')
+    return app.test_client()
+
+
+def _headers(user_id):
+    return {'Authorization': 'Bearer ' + create_user_token(user_id, False)}
+
+
+def _transfer(client, amount, recipient='user2@x.com', source='ACC1', user_id=1):
+    return client.post('/api/transactions/transfer', headers=_headers(user_id), json={
+        'recipient_identifier': recipient, 'amount': amount, 'source_account': source
+    })
+
+
+def _cancel(client, transaction_id, user_id=1):
+    return client.get(f'/api/transactions/transactions/cancel?transactionId={transaction_id}',
+                      headers=_headers(user_id))
+
+
+def _status(transaction_id):
+    db.session.expire_all()
+    return db.session.get(Transaction, transaction_id).status
+
+
+def test_transfer_debits_sender_and_credits_recipient(client, balances):
+    response = _transfer(client, '30.00')
+    assert response.status_code == 200
+    assert _status(response.get_json()['transaction_id']) == TransactionStatus.COMPLETED
+    assert balances(1, 2) == {
+        1: (Decimal('70.00'), Decimal('70.00'), Decimal('0.00')),
+        2: (Decimal('35.00'), Decimal('35.00'), Decimal('0.00')),
+    }
+
+
+def test_overdraft_is_refused_without_changes(client, balances):
+    before = balances(1, 2)
+    response = _transfer(client, '100.01')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Insufficient funds'
+    assert Transaction.query.count() == 0
+    assert balances(1, 2) == before
+
+
+def test_transfer_from_someone_elses_account_is_refused(client, balances):
+    before = balances(1, 2)
+    assert _transfer(client, '1.00', source='ACC2').status_code == 404
+    assert balances(1, 2) == before
+
+
+def test_transfer_to_unverified_identifier_is_held_as_pending(client, balances):
+    response = _transfer(client, '25.00', recipient='nobody@x.com')
+    assert response.status_code == 200
+    assert _status(response.get_json()['transaction_id']) == TransactionStatus.PENDING
+    # 不扣款，只计入发送方的待处理金额
+    assert balances(1) == {1: (Decimal('100.00'), Decimal('100.00'), Decimal('25.00'))}
+
+
+def test_cancel_pending_releases_the_held_amount(client, balances):
+    transaction_id = _transfer(client, '25.00', recipient='nobody@x.com').get_json()['transaction_id']
+    assert _cancel(client, transaction_id).status_code == 200
+    assert _status(transaction_id) == TransactionStatus.CANCELLED
+    assert balances(1) == {1: (Decimal('100.00'), Decimal('100.00'), Decimal('0.00'))}
+    # 已取消的不能再次取消
+    assert _cancel(client, transaction_id).status_code == 400
+
+
+def test_cancel_completed_reverses_both_accounts(client, balances):
+    transaction_id = _transfer(client, '30.00').get_json()['transaction_id']
+    assert _cancel(client, transaction_id).status_code == 200
+    assert _status(transaction_id) == TransactionStatus.CANCELLED
+    assert balances(1, 2) == {
+        1: (Decimal('100.00'), Decimal('100.00'), Decimal('0.00')),
+        2: (Decimal('5.00'), Decimal('5.00'), Decimal('0.00')),
+    }
+
+
+def test_cancel_completed_is_refused_when_recipient_spent_the_funds(client, make_user, balances):
+    make_user(3)
+    transaction_id = _transfer(client, '30.00').get_json()['transaction_id']
+    assert _transfer(client, '20.00', recipient='user3@x.com', source='ACC2', user_id=2).status_code == 200
+    before = balances(1, 2, 3)
+    response = _cancel(client, transaction_id)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Recipient has insufficient funds'
+    assert _status(transaction_id) == TransactionStatus.COMPLETED
+    assert balances(1, 2, 3) == before
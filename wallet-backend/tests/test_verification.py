@@ -0,0 +1,46 @@
+from app import db
+from app.models.notification import MessageDelivery
+from app.models.user import Email, Phone
+from app.services.tokens import create_user_token
+
+
+def _setup(make_user):
+    make_user(1)
+    db.session.add(Email(user_id=1, email='new@x.com', verification_code='123456'))
+    db.session.add(Phone(user_id=1, phone='5550001', verification_code='654321'))
+    db.session.commit()
+    return {'Authorization': 'Bearer ' + create_user_token(1, False)}
+
+
+def _verify_email(client, headers, code, email='new@x.com'):
+    return client.post('/api/verify/email', json={'email': email, 'code': code}, headers=headers)
+
+
+def test_code_is_replaced_after_max_failures(app, make_user):
+    headers = _setup(make_user)
+    app.config['VERIFY_LIMIT_PER_IDENTIFIER'] = (100, 300)
+    client = app.test_client()
+    for _ in range(app.config['VERIFY_MAX_FAILURES']):
+        assert _verify_email(client, headers, '000000').status_code == 400
+
+    email = Email.query.filter_by(email='new@x.com').one()
+    assert email.verification_code != '123456'
+    assert MessageDelivery.query.filter_by(recipient='new@x.com', code=email.verification_code).count() == 1
+    # 旧码已作废
+    assert _verify_email(client, headers, '123456').status_code == 400
+    assert _verify_email(client, headers, email.verification_code).status_code == 200
+
+
+def test_verification_is_rate_limited_per_user_and_identifier(app, make_user):
+    headers = _setup(make_user)
+    limit, _ = app.config['VERIFY_LIMIT_PER_IDENTIFIER']
+    client = app.test_client()
+    for _ in range(limit):
+        _verify_email(client, headers, '000000')
+    response = _verify_email(client, headers, '123456')
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+    # 大小写不同的同一邮箱共用额度，其他标识不受影响
+    assert _verify_email(client, headers, '123456', email='NEW@x.com').status_code == 429
+    phone = client.post('/api/verify/phone', json={'phone': '5550001', 'code': '654321'}, headers=headers)
+    assert phone.status_code == 200
@@ -0,0 +1,83 @@
+"""异步转账worker：从本地队列领取转账并批量入账
+
+用法:
+    python transfer_worker.py --workers 4 --batch-size 100
+
+每个进程循环领取一批，一个数据库事务中逐笔执行（每笔一个保存点），提交后回写队列状态。
+进程在提交后、回写前崩溃时，租约过期后该批会被重新领取，已入账的不会重复执行。
+整批失败时逐笔单独重试，只把仍然失败的放回队列；领取超过 TRANSFER_QUEUE_MAX_ATTEMPTS 次的记为失败。
+"""
+import argparse
+import multiprocessing
+import time
+import traceback
+
+from app import create_app, db
+from app.services.transfer_queue import transfer_queue
+from app.services.transfers import apply_batch
+
+
+def run_worker(batch_size, idle_sleep):
+    app = create_app()
+    with app.app_context():
+        last_purge = 0
+        while True:
+            items = transfer_queue.claim(batch_size)
+            if not items:
+                if time.time() - last_purge > 3600:
+                    transfer_queue.purge()
+                    last_purge = time.time()
+                time.sleep(idle_sleep)
+                continue
+            try:
+                results = apply_batch(items)
+            except Exception as e:
+                db.session.rollback()
+                print("Transfer batch error:", str(e))
+                print("Traceback:", traceback.format_exc())
+                results = apply_each(items)
+                failed = [item['id'] for item in items if item['id'] not in results]
+                if failed:
+                    transfer_queue.release(failed)
+                    time.sleep(idle_sleep)
+                if not results:
+                    continue
+            transfer_queue.complete(results)
+            print(f"batch={len(items)} failed={sum(1 for _, status in results.values() if status >= 400)}")
+
+
+def apply_each(items):
+    """整批失败后逐笔各自提交，一笔的问题不连累同批的其它转账；返回成功处理的结果"""
+    results = {}
+    for item in items:
+        try:
+            results.update(apply_batch([item]))
+        except Exception as e:
+            db.session.rollback()
+            print("Transfer item error:", item['id'], str(e))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply queued transfers')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--idle-sleep', type=float, default=0.05, help='seconds to sleep when the queue is empty')
+    args = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args.batch_size, args.idle_sleep), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()